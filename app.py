@@ -5,6 +5,7 @@ from extensions import db, socketio, scheduler
 from resourses import * 
 from services import * 
 from scheduler import * 
+import multiprocessing
 import signal
 import sys
 import urllib.parse
@@ -86,6 +87,7 @@ def create_app(config_name='default'):
 
     # Course Enrollment
     api.add_resource(CourseEnrollmentResource, '/api/students/enrollments/<int:student_id>')
+    api.add_resource(CourseBasketEnrollmentResource, '/api/students/enrollments/basket/<int:student_id>')
     api.add_resource(CourseEnrollmentCancellationResource, '/api/students/enrollments/cancel/<int:student_id>')
     api.add_resource(CourseEnrollmentHardDeleteResource, '/api/enrollments/hard-delete/<int:enrollment_id>')
     api.add_resource(StudentEnrollmentStatusResource, '/api/students/enrollment-status/<int:student_id>')
@@ -93,9 +95,11 @@ def create_app(config_name='default'):
     # Graduation Eligibility
     api.add_resource(GraduationEligibilityResource, '/api/students/graduation-eligibility/<int:student_id>')
     api.add_resource(GraduationSummaryResource, '/api/students/graduation-summary/<int:student_id>')
+    api.add_resource(GraduationEligibilityBatchResource, '/api/students/graduation-eligibility/batch')
 
     # Academic Warning
     api.add_resource(AcademicWarningResource, '/api/academic-warnings', '/api/academic-warnings/<int:student_id>')
+    api.add_resource(WarningSimulationResource, '/api/academic-warnings/simulate')
     api.add_resource(ResolveWarningResource, '/api/academic-warnings/<int:warning_id>/resolve')
     api.add_resource(WarningStatsResource, '/api/academic-warnings/stats')
     api.add_resource(StudentWarningCheckResource, '/api/academic-warnings/check/<int:student_id>')
@@ -110,6 +114,7 @@ def create_app(config_name='default'):
     api.add_resource(GPAAnalysisResource, '/api/academic-status/gpa-analysis/<int:student_id>')
     api.add_resource(PerformancePatternsResource, '/api/academic-status/performance-patterns/<int:student_id>')
     api.add_resource(RiskAssessmentResource, '/api/academic-status/risk-assessment/<int:student_id>')
+    api.add_resource(RiskRankingResource, '/api/academic-status/risk-ranking')
     api.add_resource(CourseAnalysisResource, '/api/academic-status/course-analysis/<int:student_id>')
     api.add_resource(AttendanceAnalysisResource, '/api/academic-status/attendance-analysis/<int:student_id>')
     api.add_resource(AcademicWarningsSummaryResource, '/api/academic-status/warnings-summary/<int:student_id>')
@@ -127,6 +132,23 @@ def create_app(config_name='default'):
     # إعداد مجدول الإنذارات الأكاديمية
     warning_scheduler = AcademicWarningScheduler(scheduler)
     warning_scheduler.setup_jobs()
+    
+    # مزامنة عدادات المقاعد مع التسجيلات الفعلية
+    seat_scheduler = CourseSeatScheduler(scheduler)
+    seat_scheduler.setup_jobs()
+    
+    # تحديث إحصائيات درجات المواد
+    statistics_scheduler = CourseStatisticsScheduler(scheduler)
+    statistics_scheduler.setup_jobs()
+    
+    # لقطة يومية لتقييم المخاطر الأكاديمية لكل الطلاب
+    risk_scheduler = RiskSnapshotScheduler(scheduler)
+    risk_scheduler.setup_jobs()
+    
+    # العمليات الفرعية (عمال المهام المجزأة) تبني التطبيق بدون تهيئة أو مجدول
+    if multiprocessing.parent_process() is None:
+        run_startup_tasks(app)
+        scheduler.start()
 
 
 
@@ -139,6 +161,27 @@ def create_app(config_name='default'):
     logger.info("تم إنشاء التطبيق بنجاح")
     return app  
 
+def run_startup_tasks(app):
+    """تهيئة قاعدة البيانات عند كل تشغيل (gunicorn أو مباشر) قبل استقبال الطلبات"""
+    with app.app_context():
+        try:
+            db.create_all()
+            logger.info("تم إنشاء جداول قاعدة البيانات بنجاح")
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء جداول قاعدة البيانات: {str(e)}")
+        
+        # تهيئة عدادات المقاعد قبل أول حجز بدلاً من انتظار المزامنة الليلية
+        seat_sync = CourseEnrollmentService.sync_course_seat_counters()
+        logger.info(f"مزامنة المقاعد عند التشغيل: {seat_sync['message']}")
+        
+        # بناء إحصائيات المواد قبل أول طلب توصيات
+        statistics_refresh = CourseStatisticsService.refresh_all()
+        logger.info(f"إحصائيات المواد عند التشغيل: {statistics_refresh['message']}")
+        
+        # بناء ملخص الإنذارات قبل أن تضيف إليه أي معاملة فروقاً
+        summary_rebuild = WarningSummaryService.rebuild()
+        logger.info(f"ملخص الإنذارات عند التشغيل: {summary_rebuild['message']}")
+
 app = create_app()
 
 def cleanup_resources():
@@ -163,14 +206,6 @@ if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     logger.info(f"بدء تشغيل نظام شؤون الطلاب على المنفذ {port}")
     
-    with app.app_context():
-        try:
-            db.create_all()
-            logger.info("تم إنشاء جداول قاعدة البيانات بنجاح")
-        except Exception as e:
-            logger.error(f"خطأ في إنشاء جداول قاعدة البيانات: {str(e)}")
-    
-    scheduler.start()
     try:
         socketio.run(app, debug=False, use_reloader=False, host="0.0.0.0", port=port)
     except KeyboardInterrupt:
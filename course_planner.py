@@ -0,0 +1,177 @@
+import math
+from collections import deque
+
+
+BLOCKED_PREREQUISITE = 'blocked_prerequisite'
+PREREQUISITE_CYCLE = 'prerequisite_cycle'
+EXCEEDS_CREDIT_LIMIT = 'exceeds_credit_limit'
+NO_REMAINING_SEMESTER = 'no_remaining_semester'
+
+
+def layer_prerequisites(course_ids, prerequisites, completed_ids=None):
+    """ترتيب طبولوجي لرسم المتطلبات السابقة بين المقررات المتبقية
+
+    يُرجع (layers, heights, unscheduled):
+    layers: أقرب ترم نسبي يمكن أخذ المقرر فيه (0 = الترم القادم)
+    heights: طول أطول سلسلة مقررات تعتمد على المقرر (بما فيه المقرر نفسه)
+    unscheduled: {معرف المقرر: السبب} للمقررات المحجوبة بمتطلب غير متاح أو بدورة متطلبات
+    """
+    course_ids = set(course_ids)
+    completed_ids = set(completed_ids) if completed_ids is not None else None
+    unscheduled = {}
+
+    # المتطلب خارج المقررات المتبقية يجب أن يكون منجزاً - إلا إذا لم تُعرف المقررات المنجزة
+    edges = {}
+    for course_id in course_ids:
+        required = set()
+        for prerequisite_id in prerequisites.get(course_id, ()):
+            if prerequisite_id in course_ids:
+                required.add(prerequisite_id)
+            elif completed_ids is not None and prerequisite_id not in completed_ids:
+                unscheduled[course_id] = BLOCKED_PREREQUISITE
+        edges[course_id] = required
+
+    # حجب المقررات التي تعتمد على مقرر محجوب
+    changed = True
+    while changed:
+        changed = False
+        for course_id, required in edges.items():
+            if course_id not in unscheduled and any(prerequisite_id in unscheduled for prerequisite_id in required):
+                unscheduled[course_id] = BLOCKED_PREREQUISITE
+                changed = True
+
+    active = [course_id for course_id in course_ids if course_id not in unscheduled]
+    dependents = {course_id: [] for course_id in active}
+    in_degree = {course_id: 0 for course_id in active}
+    for course_id in active:
+        for prerequisite_id in edges[course_id]:
+            dependents[prerequisite_id].append(course_id)
+            in_degree[course_id] += 1
+
+    # خوارزمية Kahn - كل مقرر في الطبقة التالية لأبعد متطلباته
+    layers = {}
+    queue = deque(sorted(course_id for course_id in active if in_degree[course_id] == 0))
+    for course_id in queue:
+        layers[course_id] = 0
+    order = []
+    while queue:
+        course_id = queue.popleft()
+        order.append(course_id)
+        for dependent_id in dependents[course_id]:
+            layers[dependent_id] = max(layers.get(dependent_id, 0), layers[course_id] + 1)
+            in_degree[dependent_id] -= 1
+            if in_degree[dependent_id] == 0:
+                queue.append(dependent_id)
+
+    for course_id in active:
+        if course_id not in layers or in_degree[course_id] > 0:
+            unscheduled[course_id] = PREREQUISITE_CYCLE
+            layers.pop(course_id, None)
+
+    heights = {}
+    for course_id in reversed(order):
+        if course_id in unscheduled:
+            continue
+        heights[course_id] = 1 + max(
+            (heights[dependent_id] for dependent_id in dependents[course_id] if dependent_id in heights),
+            default=0
+        )
+
+    return layers, heights, unscheduled
+
+
+def schedule_courses(courses, prerequisites, max_credits, completed_ids=None, max_semesters=None):
+    """توزيع المقررات على الترمات مع احترام المتطلبات السابقة وحد الساعات لكل ترم
+
+    courses: قوائم dict تحتوي course_id و credits و is_mandatory و semester
+    prerequisites: {معرف المقرر: معرفات متطلباته السابقة}
+    يُرجع dict فيه semesters (قائمة مقررات كل ترم) و unscheduled و minimum_semesters و scheduled_semesters
+    """
+    courses_by_id = {}
+    for course in courses:
+        courses_by_id.setdefault(course['course_id'], course)
+
+    layers, heights, unscheduled = layer_prerequisites(courses_by_id, prerequisites, completed_ids)
+
+    for course_id in list(heights):
+        if courses_by_id[course_id].get('credits', 0) > max_credits:
+            unscheduled[course_id] = EXCEEDS_CREDIT_LIMIT
+
+    # مقرر يعتمد على مقرر لا يمكن جدولته لا يمكن جدولته أيضاً
+    schedulable = {course_id for course_id in heights if course_id not in unscheduled}
+    for course_id in sorted(schedulable, key=lambda cid: layers[cid]):
+        if any(prerequisite_id in courses_by_id and prerequisite_id not in schedulable
+               for prerequisite_id in prerequisites.get(course_id, ())):
+            schedulable.discard(course_id)
+            unscheduled[course_id] = BLOCKED_PREREQUISITE
+
+    total_credits = sum(courses_by_id[course_id].get('credits', 0) for course_id in schedulable)
+    critical_path = max((heights[course_id] for course_id in schedulable), default=0)
+    minimum_semesters = max(critical_path, math.ceil(total_credits / max_credits) if max_credits > 0 else 0)
+
+    # الأولوية: أطول سلسلة لاحقة أولاً ثم الإجباري ثم ترم المقرر ثم الأكبر ساعات (First Fit Decreasing)
+    def priority(course_id):
+        course = courses_by_id[course_id]
+        return (
+            -heights[course_id],
+            not course.get('is_mandatory', False),
+            course.get('semester') or 99,
+            -course.get('credits', 0),
+            course_id
+        )
+
+    remaining_prerequisites = {
+        course_id: {pid for pid in prerequisites.get(course_id, ()) if pid in schedulable}
+        for course_id in schedulable
+    }
+    ready = sorted(
+        (course_id for course_id in schedulable if not remaining_prerequisites[course_id]),
+        key=priority
+    )
+    dependents = {course_id: [] for course_id in schedulable}
+    for course_id, required in remaining_prerequisites.items():
+        for prerequisite_id in required:
+            dependents[prerequisite_id].append(course_id)
+
+    semesters = []
+    scheduled_count = 0
+    while ready and (max_semesters is None or len(semesters) < max_semesters):
+        semester_courses = []
+        credits = 0
+        deferred = []
+        for course_id in ready:
+            course_credits = courses_by_id[course_id].get('credits', 0)
+            if credits + course_credits <= max_credits:
+                semester_courses.append(courses_by_id[course_id])
+                credits += course_credits
+            else:
+                deferred.append(course_id)
+
+        semesters.append(semester_courses)
+        scheduled_count += len(semester_courses)
+
+        # المقررات التي اكتملت متطلباتها تصبح متاحة من الترم التالي فقط
+        newly_ready = []
+        for course in semester_courses:
+            for dependent_id in dependents[course['course_id']]:
+                remaining_prerequisites[dependent_id].discard(course['course_id'])
+                if not remaining_prerequisites[dependent_id]:
+                    newly_ready.append(dependent_id)
+        ready = sorted(deferred + newly_ready, key=priority)
+
+    if scheduled_count < len(schedulable):
+        scheduled_ids = {course['course_id'] for semester_courses in semesters for course in semester_courses}
+        for course_id in schedulable - scheduled_ids:
+            unscheduled[course_id] = NO_REMAINING_SEMESTER
+
+    return {
+        'semesters': semesters,
+        'unscheduled': [
+            {'course_id': course_id, 'reason': reason}
+            for course_id, reason in sorted(unscheduled.items())
+        ],
+        'minimum_semesters': minimum_semesters,
+        'scheduled_semesters': len(semesters),
+        'critical_path_length': critical_path,
+        'total_credits': total_credits
+    }
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+def fit_trend(values, positions=None):
+    """ميل وتقاطع خط المربعات الصغرى بصيغة مغلقة - (0, القيمة) إذا كانت النقاط أقل من 2"""
+    y = np.asarray(values, dtype=float)
+    x = np.arange(1, len(y) + 1, dtype=float) if positions is None else np.asarray(positions, dtype=float)
+
+    if len(y) == 0:
+        return 0.0, 0.0
+    if len(y) < 2:
+        return 0.0, float(y[0])
+
+    x_mean = x.mean()
+    y_mean = y.mean()
+    x_centered = x - x_mean
+    denominator = float(np.dot(x_centered, x_centered))
+
+    if denominator == 0:
+        return 0.0, float(y_mean)
+
+    slope = float(np.dot(x_centered, y - y_mean) / denominator)
+    return slope, float(y_mean - slope * x_mean)
+
+
+def predict_next(values, positions=None):
+    """توقع القيمة في الموضع التالي لآخر نقطة"""
+    slope, intercept = fit_trend(values, positions)
+    if positions is None:
+        next_position = len(values) + 1
+    else:
+        next_position = float(np.asarray(positions, dtype=float)[-1]) + 1
+    return slope * next_position + intercept
+
+
+def fit_trends_batch(gpa_matrix, positions=None):
+    """ميل وتقاطع وتوقع الترم التالي لكل صف في مصفوفة معدلات (NaN = ترم بدون معدل)
+
+    يُرجع (slopes, intercepts, predictions, counts) كمصفوفات بطول عدد الصفوف
+    """
+    y = np.asarray(gpa_matrix, dtype=float)
+    if y.ndim != 2:
+        raise ValueError("gpa_matrix must be two-dimensional")
+
+    columns = y.shape[1]
+    x = np.arange(1, columns + 1, dtype=float) if positions is None else np.asarray(positions, dtype=float)
+
+    mask = ~np.isnan(y)
+    counts = mask.sum(axis=1)
+    safe_counts = np.maximum(counts, 1)
+
+    x_values = np.where(mask, x, 0.0)
+    y_values = np.where(mask, y, 0.0)
+
+    x_mean = x_values.sum(axis=1) / safe_counts
+    y_mean = y_values.sum(axis=1) / safe_counts
+
+    x_centered = np.where(mask, x - x_mean[:, None], 0.0)
+    y_centered = np.where(mask, y - y_mean[:, None], 0.0)
+
+    denominator = (x_centered * x_centered).sum(axis=1)
+    numerator = (x_centered * y_centered).sum(axis=1)
+
+    valid = (counts >= 2) & (denominator > 0)
+    slopes = np.where(valid, numerator / np.where(valid, denominator, 1.0), 0.0)
+    intercepts = y_mean - slopes * x_mean
+
+    # الموضع التالي لآخر ترم له معدل في كل صف
+    last_positions = np.where(mask, x, -np.inf).max(axis=1)
+    next_positions = np.where(counts > 0, last_positions + 1, 0.0)
+    predictions = np.where(counts > 0, slopes * next_positions + intercepts, np.nan)
+
+    return slopes, intercepts, predictions, counts
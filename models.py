@@ -64,6 +64,20 @@ class CoursePrerequisites(db.Model):
     prerequisite_course = db.relationship('Courses', foreign_keys=[PrerequisiteCourseId])
 
 
+class CourseStatistics(db.Model):
+    __tablename__ = 'CourseStatistics'
+    CourseId = db.Column(db.Integer, db.ForeignKey('Courses.Id'), primary_key=True)
+    AttemptCount = db.Column(db.Integer, nullable=False, default=0)
+    GradeSum = db.Column(db.Float, nullable=False, default=0)
+    MeanGrade = db.Column(db.Float)
+    PassCount = db.Column(db.Integer, nullable=False, default=0)
+    PassRate = db.Column(db.Float)
+    GradeHistogram = db.Column(db.String(255))
+    UpdatedAt = db.Column(db.DateTime, nullable=False)
+
+    course = db.relationship('Courses', backref=db.backref('statistics', uselist=False))
+
+
 class Courses(db.Model):
     __tablename__ = 'Courses'
     Id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -169,3 +183,63 @@ class Students(db.Model):
     GPA8 = db.Column(db.Float)
 
     division = db.relationship('Divisions', backref='students')
+
+
+class WarningJobCheckpoints(db.Model):
+    __tablename__ = 'WarningJobCheckpoints'
+    Id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    JobKey = db.Column(db.String(100), nullable=False, index=True)
+    ChunkStart = db.Column(db.Integer, nullable=False)
+    ChunkEnd = db.Column(db.Integer, nullable=False)
+    StudentsProcessed = db.Column(db.Integer, nullable=False, default=0)
+    WarningsIssued = db.Column(db.Integer, nullable=False, default=0)
+    WarningsResolved = db.Column(db.Integer, nullable=False, default=0)
+    CompletedAt = db.Column(db.DateTime, nullable=False)
+
+
+class StudentWarningFingerprints(db.Model):
+    __tablename__ = 'StudentWarningFingerprints'
+    StudentId = db.Column(db.Integer, db.ForeignKey('Students.Id'), primary_key=True)
+    Fingerprint = db.Column(db.String(40), nullable=False)
+    EvaluatedAt = db.Column(db.DateTime, nullable=False)
+
+
+class WarningSummary(db.Model):
+    __tablename__ = 'WarningSummary'
+    Status = db.Column(db.String(20), primary_key=True)
+    WarningType = db.Column(db.String(50), primary_key=True)
+    WarningLevel = db.Column(db.Integer, primary_key=True)
+    Count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class RiskSnapshotRuns(db.Model):
+    __tablename__ = 'RiskSnapshotRuns'
+    Id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    SnapshotDate = db.Column(db.Date, nullable=False)
+    StartedAt = db.Column(db.DateTime, nullable=False)
+    CompletedAt = db.Column(db.DateTime, nullable=True, index=True)
+    StudentsScored = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StudentRiskSnapshots(db.Model):
+    __tablename__ = 'StudentRiskSnapshots'
+    __table_args__ = (
+        db.Index('IX_StudentRiskSnapshots_Run_Score', 'RunId', 'RiskScore'),
+        db.Index('IX_StudentRiskSnapshots_Run_Student', 'RunId', 'StudentId'),
+    )
+    Id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    RunId = db.Column(db.Integer, db.ForeignKey('RiskSnapshotRuns.Id'), nullable=False)
+    StudentId = db.Column(db.Integer, db.ForeignKey('Students.Id'), nullable=False, index=True)
+    DivisionId = db.Column(db.Integer, db.ForeignKey('Divisions.Id'), nullable=False)
+    Semester = db.Column(db.Integer, nullable=False)
+    SnapshotDate = db.Column(db.Date, nullable=False)
+    RiskScore = db.Column(db.Integer, nullable=False)
+    RiskLevel = db.Column(db.String(20), nullable=False)
+    RiskFactors = db.Column(db.String(500), nullable=False)
+    CurrentGPA = db.Column(db.Float, nullable=False)
+    PredictedGPA = db.Column(db.Float)
+    AttendanceRate = db.Column(db.Float, nullable=False)
+    WarningsCount = db.Column(db.Integer, nullable=False)
+    CreatedAt = db.Column(db.DateTime, nullable=False)
+
+    student = db.relationship('Students', backref='risk_snapshots')
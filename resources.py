@@ -1,6 +1,7 @@
 from flask import request
 from datetime import datetime
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
+import json
 from models import AcademicWarnings, Students
 from extensions import db
 from flask_restful import Resource
@@ -12,7 +13,10 @@ from services import(
     CourseEnrollmentService,
     SmartCourseRecommendationService,
     EnrollmentPeriodService,
-    GraduationEligibilityService
+    GraduationEligibilityService,
+    RiskSnapshotService,
+    StudentContext,
+    WarningSummaryService
     
 ) 
 
@@ -107,6 +111,93 @@ class GraduationSummaryResource(Resource):
             }, 500
 
 
+class GraduationEligibilityBatchResource(Resource):
+    
+    def post(self):
+        try:
+            data = request.get_json() or {}
+            
+            division_id = data.get('division_id')
+            semester = data.get('semester')
+            student_ids = data.get('student_ids')
+            
+            if division_id is None and semester is None and not student_ids:
+                return {
+                    "success": False,
+                    "message": "يجب تحديد الشعبة أو الترم أو قائمة الطلاب",
+                    "error": "MISSING_FILTER"
+                }, 400
+            
+            for value in (division_id, semester):
+                if value is not None and (not isinstance(value, int) or value <= 0):
+                    return {
+                        "success": False,
+                        "message": "معرف الشعبة أو الترم غير صحيح",
+                        "error": "INVALID_FILTER"
+                    }, 400
+            
+            if student_ids is not None and (
+                not isinstance(student_ids, list) or
+                not all(isinstance(sid, int) and sid > 0 for sid in student_ids)
+            ):
+                return {
+                    "success": False,
+                    "message": "قائمة معرفات الطلاب غير صحيحة",
+                    "error": "INVALID_STUDENT_IDS"
+                }, 400
+            
+            if student_ids and len(student_ids) > GraduationEligibilityService.MAX_BATCH_STUDENT_IDS:
+                return {
+                    "success": False,
+                    "message": f"الحد الأقصى لقائمة الطلاب {GraduationEligibilityService.MAX_BATCH_STUDENT_IDS} طالب",
+                    "error": "TOO_MANY_STUDENT_IDS"
+                }, 400
+            
+            reports = GraduationEligibilityService.iter_batch_graduation_eligibility(
+                division_id=division_id,
+                semester=semester,
+                student_ids=student_ids
+            )
+            
+            def generate():
+                total = 0
+                eligible = 0
+                failed = 0
+                try:
+                    for report in reports:
+                        total += 1
+                        if not report.get("success"):
+                            failed += 1
+                        elif report["graduation_status"]["eligible"]:
+                            eligible += 1
+                        yield json.dumps(report, ensure_ascii=False, default=str) + "\n"
+                except Exception as e:
+                    logger.error(f"Error in GraduationEligibilityBatchResource stream: {str(e)}")
+                    yield json.dumps({
+                        "success": False,
+                        "message": "توقف حساب أهلية التخرج بسبب خطأ",
+                        "error": str(e)
+                    }, ensure_ascii=False) + "\n"
+                
+                yield json.dumps({
+                    "summary": {
+                        "total_students": total,
+                        "eligible": eligible,
+                        "errors": failed
+                    }
+                }, ensure_ascii=False) + "\n"
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+                
+        except Exception as e:
+            logger.error(f"Error in GraduationEligibilityBatchResource.post: {str(e)}")
+            return {
+                "success": False,
+                "message": "حدث خطأ أثناء حساب أهلية التخرج للمجموعة",
+                "error": str(e)
+            }, 500
+
+
 class EnrollmentPeriodResource(Resource):
     
     def post(self):
@@ -763,6 +854,41 @@ class CourseEnrollmentResource(Resource):
                 "message": f"حدث خطأ في الخادم: {str(e)}"
             }, 500
 
+class CourseBasketEnrollmentResource(Resource):
+    
+    def post(self, student_id):
+        try:
+            data = request.get_json()
+            
+            if not data or 'course_ids' not in data:
+                return {
+                    "success": False,
+                    "message": "يجب تحديد قائمة معرفات المواد (course_ids)"
+                }, 400
+            
+            course_ids = data['course_ids']
+            
+            if (not isinstance(course_ids, list) or not course_ids or
+                    not all(isinstance(course_id, int) and course_id > 0 for course_id in course_ids)):
+                return {
+                    "success": False,
+                    "message": "قائمة معرفات المواد غير صحيحة"
+                }, 400
+            
+            result = CourseEnrollmentService.enroll_student_in_courses(student_id, course_ids)
+            
+            if result["success"]:
+                return result, 201
+            else:
+                return result, 400
+                
+        except Exception as e:
+            logger.error(f"Error in CourseBasketEnrollmentResource.post: {str(e)}")
+            return {
+                "success": False,
+                "message": f"حدث خطأ في الخادم: {str(e)}"
+            }, 500
+
 class CourseEnrollmentCancellationResource(Resource):
     
     def put(self, student_id):
@@ -891,9 +1017,16 @@ class AcademicWarningResource(Resource):
                     } for w in warnings]
                 }
             else:
-                warnings = self.warning_service.get_all_active_warnings()
+                try:
+                    limit = min(max(int(request.args.get('limit', 100)), 1), 500)
+                    cursor = self._parse_cursor(request.args.get('cursor'))
+                except ValueError:
+                    return {'error': 'معاملات الترقيم غير صحيحة'}, 400
+                
+                warnings, next_cursor = self.warning_service.get_active_warnings_page(limit, cursor)
                 
                 return {
+                    'next_cursor': self._format_cursor(next_cursor),
                     'warnings': [{
                         'id': w.Id,
                         'student_id': w.StudentId,
@@ -914,6 +1047,21 @@ class AcademicWarningResource(Resource):
             logger.error(f"خطأ في جلب الإنذارات: {str(e)}")
             return {'error': 'حدث خطأ في جلب الإنذارات'}, 500
     
+    @staticmethod
+    def _parse_cursor(cursor):
+        """المؤشر بصيغة level|id"""
+        if not cursor:
+            return None
+        level, warning_id = cursor.split('|')
+        return int(level), int(warning_id)
+    
+    @staticmethod
+    def _format_cursor(cursor):
+        if not cursor:
+            return None
+        level, warning_id = cursor
+        return f"{level}|{warning_id}"
+    
     def post(self):
         """تشغيل فحص الإنذارات يدوياً"""
         try:
@@ -949,6 +1097,48 @@ class AcademicWarningResource(Resource):
             return {'error': 'حدث خطأ في تشغيل فحص الإنذارات'}, 500
 
 
+class WarningSimulationResource(Resource):
+    
+    def __init__(self):
+        self.warning_service = AcademicWarningService()
+    
+    def post(self):
+        """محاكاة فحص الإنذارات بدون كتابة - الملخص فقط أو فرق كل طالب بصيغة NDJSON"""
+        try:
+            data = request.get_json() or {}
+            semester = data.get('semester', self.warning_service.get_current_semester())
+            include_details = data.get('include_details', False)
+            
+            if not isinstance(include_details, bool):
+                return {'error': 'قيمة include_details يجب أن تكون true أو false'}, 400
+            
+            results = self.warning_service.simulate_warning_check(semester)
+            
+            if not include_details:
+                summary = {}
+                for item in results:
+                    summary = item.get('summary', summary)
+                return {
+                    'message': f'محاكاة الإنذارات: إصدار {summary["warnings_issued"]} وتصعيد {summary["warnings_escalated"]} وحل {summary["warnings_resolved"]} إنذار',
+                    'semester': semester,
+                    'summary': summary
+                }
+            
+            def generate():
+                try:
+                    for item in results:
+                        yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+                except Exception as e:
+                    logger.error(f"خطأ أثناء بث محاكاة الإنذارات: {str(e)}")
+                    yield json.dumps({'error': f'توقفت المحاكاة بسبب خطأ: {str(e)}'}, ensure_ascii=False) + "\n"
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+            
+        except Exception as e:
+            logger.error(f"خطأ في محاكاة الإنذارات: {str(e)}")
+            return {'error': 'حدث خطأ في محاكاة الإنذارات'}, 500
+
+
 class ResolveWarningResource(Resource):
     
     def __init__(self):
@@ -980,24 +1170,12 @@ class WarningStatsResource(Resource):
     def get(self):
         """إحصائيات الإنذارات الأكاديمية"""
         try:
-            from sqlalchemy import func
-            from models import AcademicWarnings
-            
-            # إحصائيات عامة
-            total_active = AcademicWarnings.query.filter_by(Status='نشط').count()
-            total_resolved = AcademicWarnings.query.filter_by(Status='محلول').count()
-            
-            # إحصائيات حسب النوع
-            warning_types_stats = db.session.query(
-                AcademicWarnings.WarningType,
-                func.count(AcademicWarnings.Id).label('count')
-            ).filter_by(Status='نشط').group_by(AcademicWarnings.WarningType).all()
-            
-            # إحصائيات حسب المستوى
-            warning_levels_stats = db.session.query(
-                AcademicWarnings.WarningLevel,
-                func.count(AcademicWarnings.Id).label('count')
-            ).filter_by(Status='نشط').group_by(AcademicWarnings.WarningLevel).all()
+            # الإحصائيات من الملخص المجمع المحدث مع كل تغيير في الإنذارات
+            stats = WarningSummaryService.get_summary()
+            total_active = stats['total_active']
+            total_resolved = stats['total_resolved']
+            warning_types_stats = stats['by_type']
+            warning_levels_stats = stats['by_level']
             
             return {
                 'summary': {
@@ -1119,8 +1297,7 @@ class StudentBasicInfoResource(Resource):
     
     def get(self, student_id):
         try:
-            from models import Students
-            student = Students.query.get(student_id)
+            student = StudentContext(student_id).student
             if not student:
                 return {
                     "success": False,
@@ -1188,7 +1365,8 @@ class RiskAssessmentResource(Resource):
     
     def get(self, student_id):
         try:
-            risk_assessment = AcademicStatusAnalysisService._calculate_risk_assessment(student_id)
+            # آخر لقطة من حساب المخاطر الدوري مع حساب مباشر كبديل
+            risk_assessment = RiskSnapshotService.get_student_risk(student_id)
             
             return {
                 "success": True,
@@ -1204,6 +1382,53 @@ class RiskAssessmentResource(Resource):
                 "data": None
             }, 500
 
+class RiskRankingResource(Resource):
+    
+    def get(self):
+        """ترتيب الطلاب الأعلى مخاطرة من أحدث لقطة مع التصفية حسب الشعبة والترم ومستوى المخاطرة"""
+        try:
+            division_id = request.args.get('division_id', type=int)
+            semester = request.args.get('semester', type=int)
+            risk_level = request.args.get('risk_level')
+            page = request.args.get('page', 1, type=int)
+            per_page = request.args.get('per_page', 50, type=int)
+            
+            if risk_level is not None and risk_level not in RiskSnapshotService.RISK_LEVELS:
+                return {
+                    "success": False,
+                    "message": "مستوى المخاطرة غير صحيح",
+                    "data": None
+                }, 400
+            
+            if page < 1 or not 1 <= per_page <= 200:
+                return {
+                    "success": False,
+                    "message": "رقم الصفحة أو حجمها غير صحيح",
+                    "data": None
+                }, 400
+            
+            ranking = RiskSnapshotService.get_risk_ranking(
+                division_id=division_id,
+                semester=semester,
+                risk_level=risk_level,
+                page=page,
+                per_page=per_page
+            )
+            
+            return {
+                "success": True,
+                "message": "تم جلب ترتيب المخاطر بنجاح",
+                "data": ranking,
+                "timestamp": datetime.now().isoformat()
+            }, 200
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"خطأ في جلب ترتيب المخاطر: {str(e)}",
+                "data": None
+            }, 500
+
 class CourseAnalysisResource(Resource):
     
     def get(self, student_id):
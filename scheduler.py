@@ -1,5 +1,8 @@
 from datetime import datetime, timedelta
-from services import AcademicWarningService
+from services import (
+    AcademicWarningService, CourseEnrollmentService, CourseStatisticsService, RiskSnapshotService,
+    WarningSummaryService
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -34,29 +37,61 @@ class AcademicWarningScheduler:
                 replace_existing=True
             )
             
+            # إعادة بناء ملخص الإنذارات يومياً لتصحيح أي انحراف في العدادات
+            self.scheduler.add_job(
+                func=self.rebuild_warning_summary,
+                trigger="cron",
+                hour=4,
+                minute=30,
+                id='daily_warning_summary_rebuild',
+                replace_existing=True
+            )
+            
             logger.info("تم إعداد مهام الإنذارات الأكاديمية المجدولة")
             
         except Exception as e:
             logger.error(f"خطأ في إعداد مهام الإنذارات المجدولة: {str(e)}")
     
     def daily_warning_check(self):
-        """فحص يومي للإنذارات"""
+        """فحص يومي للطلاب الذين تغيرت بياناتهم فقط"""
         try:
             current_semester = self.warning_service.get_current_semester()
-            warnings_count = self.warning_service.check_all_students_warnings(current_semester)
-            logger.info(f"الفحص اليومي للإنذارات: تم إصدار {warnings_count} إنذار")
+            # مفتاح المهمة ثابت خلال اليوم حتى تستأنف إعادة التشغيل من آخر نطاق مكتمل
+            job_key = f"daily:{current_semester}:{datetime.now().date().isoformat()}"
+            result = self._run_chunked_check(current_semester, job_key, only_changed=True)
+            logger.info(
+                f"الفحص اليومي للإنذارات: تم تقييم {result.get('students_evaluated', 0)} طالب متغير "
+                f"وإصدار {result['warnings_issued']} إنذار"
+            )
         except Exception as e:
             logger.error(f"خطأ في الفحص اليومي للإنذارات: {str(e)}")
     
     def weekly_warning_check(self):
-        """فحص أسبوعي شامل"""
+        """فحص أسبوعي شامل لجميع الطلاب للاحتياط"""
         try:
             current_semester = self.warning_service.get_current_semester()
-            warnings_count = self.warning_service.check_all_students_warnings(current_semester)
-            logger.info(f"الفحص الأسبوعي للإنذارات: تم إصدار {warnings_count} إنذار")
+            year, week, _ = datetime.now().isocalendar()
+            job_key = f"weekly:{current_semester}:{year}-W{week:02d}"
+            result = self._run_chunked_check(current_semester, job_key)
+            logger.info(f"الفحص الأسبوعي للإنذارات: تم إصدار {result['warnings_issued']} إنذار")
         except Exception as e:
             logger.error(f"خطأ في الفحص الأسبوعي للإنذارات: {str(e)}")
     
+    def rebuild_warning_summary(self):
+        """إعادة بناء ملخص الإنذارات من الجدول"""
+        try:
+            with self.scheduler.app.app_context():
+                result = WarningSummaryService.rebuild()
+            logger.info(f"ملخص الإنذارات: {result['message']}")
+        except Exception as e:
+            logger.error(f"خطأ في إعادة بناء ملخص الإنذارات: {str(e)}")
+    
+    def _run_chunked_check(self, semester, job_key, only_changed=False):
+        with self.scheduler.app.app_context():
+            return self.warning_service.run_chunked_warning_check(
+                semester, job_key, only_changed=only_changed
+            )
+    
     def manual_check(self, semester=None):
         """فحص يدوي للإنذارات"""
         try:
@@ -68,4 +103,102 @@ class AcademicWarningScheduler:
             return warnings_count
         except Exception as e:
             logger.error(f"خطأ في الفحص اليدوي للإنذارات: {str(e)}")
-            return 0 
+            return 0
+
+
+class CourseSeatScheduler:
+    
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+    
+    def setup_jobs(self):
+        """إعداد مهمة مزامنة عدادات المقاعد"""
+        try:
+            # تشغيل يومي في الساعة 3 صباحاً بعد فحص الإنذارات
+            self.scheduler.add_job(
+                func=self.daily_seat_sync,
+                trigger="cron",
+                hour=3,
+                minute=0,
+                id='daily_course_seat_sync',
+                replace_existing=True
+            )
+            
+            logger.info("تم إعداد مهمة مزامنة عدادات المقاعد")
+            
+        except Exception as e:
+            logger.error(f"خطأ في إعداد مهمة مزامنة المقاعد: {str(e)}")
+    
+    def daily_seat_sync(self):
+        """مزامنة يومية لعدادات المقاعد مع التسجيلات الفعلية"""
+        try:
+            with self.scheduler.app.app_context():
+                result = CourseEnrollmentService.sync_course_seat_counters()
+                logger.info(f"مزامنة المقاعد: {result['message']}")
+        except Exception as e:
+            logger.error(f"خطأ في مزامنة المقاعد: {str(e)}")
+
+
+class CourseStatisticsScheduler:
+    
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+    
+    def setup_jobs(self):
+        """إعداد مهمة تحديث إحصائيات المواد"""
+        try:
+            # تشغيل كل ساعة لالتقاط الدرجات الجديدة
+            self.scheduler.add_job(
+                func=self.refresh_statistics,
+                trigger="cron",
+                minute=15,
+                id='hourly_course_statistics_refresh',
+                replace_existing=True
+            )
+            
+            logger.info("تم إعداد مهمة تحديث إحصائيات المواد")
+            
+        except Exception as e:
+            logger.error(f"خطأ في إعداد مهمة إحصائيات المواد: {str(e)}")
+    
+    def refresh_statistics(self):
+        """تحديث إحصائيات الدرجات لجميع المواد"""
+        try:
+            with self.scheduler.app.app_context():
+                result = CourseStatisticsService.refresh_all()
+                logger.info(f"إحصائيات المواد: {result['message']}")
+        except Exception as e:
+            logger.error(f"خطأ في تحديث إحصائيات المواد: {str(e)}")
+
+
+class RiskSnapshotScheduler:
+    
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+    
+    def setup_jobs(self):
+        """إعداد مهمة لقطة المخاطر اليومية"""
+        try:
+            # بعد فحص الإنذارات اليومي حتى تشمل اللقطة الإنذارات الجديدة
+            self.scheduler.add_job(
+                func=self.run_risk_snapshot,
+                trigger="cron",
+                hour=RiskSnapshotService.SCHEDULE_HOUR,
+                minute=0,
+                id='daily_risk_snapshot',
+                replace_existing=True
+            )
+            
+            logger.info("تم إعداد مهمة لقطة المخاطر")
+            
+        except Exception as e:
+            logger.error(f"خطأ في إعداد مهمة لقطة المخاطر: {str(e)}")
+    
+    def run_risk_snapshot(self):
+        """حساب المخاطر لكل الطلاب النشطين وحفظ لقطة اليوم"""
+        try:
+            with self.scheduler.app.app_context():
+                result = RiskSnapshotService.run_snapshot()
+                logger.info(f"لقطة المخاطر: {result['message']}")
+        except Exception as e:
+            logger.error(f"خطأ في حساب لقطة المخاطر: {str(e)}")
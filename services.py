@@ -1,12 +1,25 @@
 from datetime import datetime
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, literal, literal_column, cast, text, BigInteger
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as postgresql_insert
 from extensions import db
 from models import (
     Students, Divisions, Enrollments, Courses, CourseDivisions, Departments,
-    AcademicWarnings, Attendances, EnrollmentPeriods, CoursePrerequisites, Classes, Professors
+    AcademicWarnings, Attendances, EnrollmentPeriods, CoursePrerequisites, Classes, Professors,
+    CourseStatistics, WarningJobCheckpoints, StudentWarningFingerprints, WarningSummary,
+    StudentRiskSnapshots, RiskSnapshotRuns
 )
 
-from functools import lru_cache
+from functools import wraps
+from collections import namedtuple, Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import bisect
+import copy
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import threading
 import time
 from sqlalchemy.orm import joinedload, selectinload
 from typing import Dict, List, Any, Optional
@@ -14,16 +27,76 @@ from datetime import datetime, timedelta
 import statistics
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 import pandas as pd
+from gpa_trend import fit_trend, fit_trends_batch, predict_next
+from course_planner import schedule_courses
+from subject_classifier import SUBJECT_CLASSIFIER, SPECIALIZATION_KEYWORDS
+from specialization_matrix import SpecializationScoreTable
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class GraduationReportCache:
+    """ذاكرة مؤقتة لتقارير أهلية التخرج مفهرسة بمعرف الطالب ورقم إصدار بياناته"""
+    
+    TTL_SECONDS = 300
+    MAX_ENTRIES = 5000
+    
+    # ترتيب الإدخال = ترتيب آخر استخدام (الأقدم أولاً) للإخراج بدون مسح كامل
+    _reports = OrderedDict()
+    _versions = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_version(cls, student_id):
+        with cls._lock:
+            return cls._versions.get(student_id, 0)
+
+    @classmethod
+    def get(cls, student_id, version):
+        with cls._lock:
+            entry = cls._reports.get(student_id)
+            if not entry:
+                return None
+            
+            entry_version, stored_at, report = entry
+            if entry_version != version or time.time() - stored_at > cls.TTL_SECONDS:
+                cls._reports.pop(student_id, None)
+                return None
+            cls._reports.move_to_end(student_id)
+        
+        return copy.deepcopy(report)
+
+    @classmethod
+    def set(cls, student_id, version, report):
+        with cls._lock:
+            # تجاهل التقرير إذا تغيرت بيانات الطالب أثناء حسابه
+            if cls._versions.get(student_id, 0) != version:
+                return
+            
+            cls._reports[student_id] = (version, time.time(), copy.deepcopy(report))
+            cls._reports.move_to_end(student_id)
+            while len(cls._reports) > cls.MAX_ENTRIES:
+                cls._reports.popitem(last=False)
+
+    @classmethod
+    def invalidate(cls, student_id):
+        """إبطال التقرير المخزن بعد أي تعديل على تسجيلات أو إنذارات الطالب"""
+        if student_id is None:
+            return
+        with cls._lock:
+            cls._versions[student_id] = cls._versions.get(student_id, 0) + 1
+            cls._reports.pop(student_id, None)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._reports.clear()
+
+
 
 
 
@@ -35,6 +108,7 @@ class GraduationEligibilityService:
     MANDATORY_CREDITS = 96
     ELECTIVE_CREDITS = 40
     MINIMUM_GPA = 2.0
+    MAX_BATCH_STUDENT_IDS = 5000
     
     YEAR_CLASSIFICATIONS = {
         1: (0, 33),    
@@ -164,8 +238,14 @@ class GraduationEligibilityService:
     }
 
     @classmethod
-    def get_graduation_eligibility(cls, student_id):
+    def get_graduation_eligibility(cls, student_id, use_cache=True):
         try:
+            cache_version = GraduationReportCache.get_version(student_id)
+            if use_cache:
+                cached_report = GraduationReportCache.get(student_id, cache_version)
+                if cached_report:
+                    return cached_report
+            
             student = Students.query.get(student_id)
             if not student:
                 return {
@@ -174,52 +254,18 @@ class GraduationEligibilityService:
                     
                 }
             
-            student_info = cls._get_student_info(student)
-            
-            cumulative_gpa = cls._calculate_gpa(student_id)
-            
-            completed_courses = cls._get_completed_courses(student_id)
-            failed_courses = cls._get_failed_courses(student_id)
-            remaining_courses = cls._get_remaining_courses(student_id, student.DivisionId)
-            
-            credits_analysis = cls._analyze_credits(
-                completed_courses, 
-                remaining_courses, 
-                student.DivisionId,
-                student.CreditsCompleted
-            )
-            
-            gpa_analysis = cls._analyze_gpa(cumulative_gpa)
-            
-            warnings = cls._get_academic_warnings(student_id)
-            
-            graduation_status = cls._determine_graduation_status(
-                credits_analysis, cumulative_gpa, warnings
-            )
-            
-            graduation_planning = cls._calculate_graduation_planning(
-                credits_analysis, student_info["current_semester"]
-            )
-            
-            recommendations = cls._generate_recommendations(
-                graduation_status, credits_analysis, gpa_analysis, remaining_courses, student_info
+            report = cls._build_graduation_report(
+                student,
+                student_info=cls._get_student_info(student),
+                cumulative_gpa=cls._calculate_student_gpa(student),
+                completed_courses=cls._get_completed_courses(student_id),
+                failed_courses=cls._get_failed_courses(student_id),
+                remaining_courses=cls._get_remaining_courses(student_id, student.DivisionId),
+                warnings=cls._get_academic_warnings(student_id)
             )
             
-            return {
-                "success": True,
-                "message": "تم الحصول على تقرير أهلية التخرج بنجاح",
-                "student_info": student_info,
-                "graduation_status": graduation_status,
-                "credits_analysis": credits_analysis,
-                "gpa_analysis": gpa_analysis,
-                "completed_courses": completed_courses,
-                "failed_courses": failed_courses,
-                "remaining_courses": remaining_courses,
-                "academic_warnings": warnings,
-                "graduation_planning": graduation_planning,
-                "recommendations": recommendations,
-                "generated_at": datetime.now().isoformat()
-            }
+            GraduationReportCache.set(student_id, cache_version, report)
+            return report
             
         except Exception as e:
             logger.error(f"Error in get_graduation_eligibility: {str(e)}")
@@ -229,12 +275,192 @@ class GraduationEligibilityService:
                 "error": str(e)
             }
 
+    @classmethod
+    def _build_graduation_report(cls, student, student_info, cumulative_gpa, completed_courses,
+                                 failed_courses, remaining_courses, warnings, mandatory_course_ids=None):
+        """تجميع تقرير أهلية التخرج من بيانات الطالب المحملة مسبقاً"""
+        credits_analysis = cls._analyze_credits(
+            completed_courses, 
+            remaining_courses, 
+            student.DivisionId,
+            student.CreditsCompleted,
+            mandatory_course_ids=mandatory_course_ids
+        )
+        
+        gpa_analysis = cls._analyze_gpa(cumulative_gpa)
+        
+        graduation_status = cls._determine_graduation_status(
+            credits_analysis, cumulative_gpa, warnings
+        )
+        
+        graduation_planning = cls._calculate_graduation_planning(
+            credits_analysis, student_info["current_semester"]
+        )
+        
+        recommendations = cls._generate_recommendations(
+            graduation_status, credits_analysis, gpa_analysis, remaining_courses, student_info
+        )
+        
+        return {
+            "success": True,
+            "message": "تم الحصول على تقرير أهلية التخرج بنجاح",
+            "student_info": student_info,
+            "graduation_status": graduation_status,
+            "credits_analysis": credits_analysis,
+            "gpa_analysis": gpa_analysis,
+            "completed_courses": completed_courses,
+            "failed_courses": failed_courses,
+            "remaining_courses": remaining_courses,
+            "academic_warnings": warnings,
+            "graduation_planning": graduation_planning,
+            "recommendations": recommendations,
+            "generated_at": datetime.now().isoformat()
+        }
+
+    @classmethod
+    def iter_batch_graduation_eligibility(cls, division_id=None, semester=None, student_ids=None, chunk_size=500):
+        """حساب أهلية التخرج لمجموعة من الطلاب مع تحميل بيانات الخطة الدراسية مرة واحدة"""
+        missing_ids = []
+        if student_ids:
+            # القائمة تُحل على دفعات حتى لا تتجاوز حد معاملات SQL Server (2100)
+            requested_ids = sorted(set(student_ids))
+            target_ids = []
+            for start in range(0, len(requested_ids), chunk_size):
+                chunk_ids = requested_ids[start:start + chunk_size]
+                rows = db.session.query(Students.Id, Students.DivisionId, Students.Semester).filter(
+                    Students.Id.in_(chunk_ids)
+                ).all()
+                found_ids = {row.Id for row in rows}
+                missing_ids.extend(sid for sid in chunk_ids if sid not in found_ids)
+                target_ids.extend(
+                    row.Id for row in rows
+                    if (division_id is None or row.DivisionId == division_id)
+                    and (semester is None or row.Semester == semester)
+                )
+            target_ids.sort()
+        else:
+            query = db.session.query(Students.Id)
+            if division_id is not None:
+                query = query.filter(Students.DivisionId == division_id)
+            if semester is not None:
+                query = query.filter(Students.Semester == semester)
+            target_ids = [row.Id for row in query.order_by(Students.Id).all()]
+        
+        for student_id in missing_ids:
+            yield {
+                "success": False,
+                "student_id": student_id,
+                "message": "الطالب غير موجود"
+            }
+        
+        # البيانات المشتركة بين جميع الطلاب
+        division_names = {division.Id: division.Name for division in Divisions.query.all()}
+        prerequisite_graph = cls._load_prerequisite_graph()
+        mandatory_course_ids = {
+            row.CourseId for row in db.session.query(CourseDivisions.CourseId).filter(
+                CourseDivisions.IsMandatory == True
+            ).distinct().all()
+        }
+        division_courses_cache = {}
+        
+        for start in range(0, len(target_ids), chunk_size):
+            chunk_ids = target_ids[start:start + chunk_size]
+            cache_versions = {sid: GraduationReportCache.get_version(sid) for sid in chunk_ids}
+            
+            students = Students.query.filter(Students.Id.in_(chunk_ids)).order_by(Students.Id).all()
+            
+            enrollment_rows = db.session.query(Enrollments, Courses).join(
+                Courses, Enrollments.CourseId == Courses.Id
+            ).filter(
+                Enrollments.StudentId.in_(chunk_ids),
+                Enrollments.IsCompleted.in_(["مكتملة", "قيد الدراسة", "راسب"])
+            ).all()
+            
+            warning_rows = db.session.query(AcademicWarnings.StudentId, AcademicWarnings.WarningType).filter(
+                AcademicWarnings.StudentId.in_(chunk_ids),
+                AcademicWarnings.Status == "نشط"
+            ).all()
+            
+            enrollments_by_student = {}
+            for enrollment, course in enrollment_rows:
+                enrollments_by_student.setdefault(enrollment.StudentId, []).append((enrollment, course))
+            
+            warning_types_by_student = {}
+            for row in warning_rows:
+                warning_types_by_student.setdefault(row.StudentId, []).append(row.WarningType)
+            
+            for student in students:
+                try:
+                    if student.DivisionId not in division_courses_cache:
+                        division_courses_cache[student.DivisionId] = db.session.query(
+                            Courses, CourseDivisions.IsMandatory
+                        ).join(
+                            CourseDivisions, Courses.Id == CourseDivisions.CourseId
+                        ).filter(
+                            CourseDivisions.DivisionId == student.DivisionId
+                        ).all()
+                    
+                    student_enrollments = enrollments_by_student.get(student.Id, [])
+                    completed_courses = [
+                        cls._format_enrollment_course(enrollment, course)
+                        for enrollment, course in student_enrollments
+                        if enrollment.IsCompleted == "مكتملة"
+                    ]
+                    failed_courses = [
+                        dict(cls._format_enrollment_course(enrollment, course), can_retake=True)
+                        for enrollment, course in student_enrollments
+                        if enrollment.IsCompleted == "راسب"
+                    ]
+                    completed_ids = {course["id"] for course in completed_courses}
+                    enrolled_ids = {
+                        enrollment.CourseId for enrollment, _ in student_enrollments
+                        if enrollment.IsCompleted in ["مكتملة", "قيد الدراسة"]
+                    }
+                    
+                    division_courses = [
+                        (course, is_mandatory)
+                        for course, is_mandatory in division_courses_cache[student.DivisionId]
+                        if course.Id not in enrolled_ids
+                    ]
+                    remaining_courses = cls._build_remaining_courses(
+                        cls._determine_academic_stage(student),
+                        division_courses,
+                        prerequisite_graph,
+                        completed_ids
+                    )
+                    
+                    report = cls._build_graduation_report(
+                        student,
+                        student_info=cls._get_student_info(
+                            student, division_names.get(student.DivisionId, "غير محدد")
+                        ),
+                        cumulative_gpa=cls._calculate_student_gpa(student),
+                        completed_courses=completed_courses,
+                        failed_courses=failed_courses,
+                        remaining_courses=remaining_courses,
+                        warnings=cls._summarize_warnings(warning_types_by_student.get(student.Id, [])),
+                        mandatory_course_ids=mandatory_course_ids
+                    )
+                    GraduationReportCache.set(student.Id, cache_versions[student.Id], report)
+                    
+                except Exception as e:
+                    logger.error(f"Error in batch graduation eligibility for student {student.Id}: {str(e)}")
+                    report = {
+                        "success": False,
+                        "student_id": student.Id,
+                        "message": "حدث خطأ أثناء الحصول على تقرير أهلية التخرج",
+                        "error": str(e)
+                    }
+                
+                yield report
+
     @staticmethod
-    def _get_student_info(student):
+    def _get_student_info(student, division_name=None):
         academic_year = student.StudentLevel or 1
         
-        division = Divisions.query.get(student.DivisionId)
-        division_name = division.Name if division else "غير محدد"
+        if division_name is None:
+            division = Divisions.query.get(student.DivisionId)
+            division_name = division.Name if division else "غير محدد"
         
         # تحديد مرحلة الطالب الأكاديمية
         academic_stage_info = GraduationEligibilityService._determine_academic_stage(student)
@@ -292,7 +518,7 @@ class GraduationEligibilityService:
             }
 
     @staticmethod
-    def _analyze_credits(completed_courses, remaining_courses, division_id, actual_credits=None):
+    def _analyze_credits(completed_courses, remaining_courses, division_id, actual_credits=None, mandatory_course_ids=None):
         
         calculated_credits = sum(course["credits"] for course in completed_courses)
         
@@ -304,7 +530,9 @@ class GraduationEligibilityService:
         else:
             completed_credits = calculated_credits
             data_source = "المواد المسجلة"
-            estimated_mandatory = GraduationEligibilityService._calculate_mandatory_credits(completed_courses)
+            estimated_mandatory = GraduationEligibilityService._calculate_mandatory_credits(
+                completed_courses, mandatory_course_ids
+            )
             estimated_elective = completed_credits - estimated_mandatory
         
         remaining_credits = sum(course["credits"] for course in remaining_courses)
@@ -345,16 +573,20 @@ class GraduationEligibilityService:
         }
 
     @staticmethod
-    def _calculate_mandatory_credits(completed_courses):
+    def _calculate_mandatory_credits(completed_courses, mandatory_course_ids=None):
         try:
+            if mandatory_course_ids is None:
+                course_ids = [course["id"] for course in completed_courses]
+                mandatory_course_ids = {
+                    row.CourseId for row in db.session.query(CourseDivisions.CourseId).filter(
+                        CourseDivisions.CourseId.in_(course_ids),
+                        CourseDivisions.IsMandatory == True
+                    ).all()
+                } if course_ids else set()
+            
             mandatory_credits = 0
             for course in completed_courses:
-                course_division = db.session.query(CourseDivisions).filter(
-                    CourseDivisions.CourseId == course["id"],
-                    CourseDivisions.IsMandatory == True
-                ).first()
-                
-                if course_division:
+                if course["id"] in mandatory_course_ids:
                     mandatory_credits += course["credits"]
             
             return mandatory_credits
@@ -388,24 +620,28 @@ class GraduationEligibilityService:
             ).all()
             
             return [
-                {
-                    "id": course.Id,
-                    "name": course.Name,
-                    "code": course.Code,
-                    "credits": course.Credits,
-                    "grade": (
-                        (float(enrollment.Exam1Grade) if enrollment.Exam1Grade else 0) +
-                        (float(enrollment.Exam2Grade) if enrollment.Exam2Grade else 0) +
-                        (float(enrollment.Grade) if enrollment.Grade else 0)
-                    ),
-                    "semester": enrollment.Semester
-                }
+                GraduationEligibilityService._format_enrollment_course(enrollment, course)
                 for enrollment, course in completed
             ]
         except Exception as e:
             logger.error(f"Error getting completed courses: {str(e)}")
             return []
 
+    @staticmethod
+    def _format_enrollment_course(enrollment, course):
+        return {
+            "id": course.Id,
+            "name": course.Name,
+            "code": course.Code,
+            "credits": course.Credits,
+            "grade": (
+                (float(enrollment.Exam1Grade) if enrollment.Exam1Grade else 0) +
+                (float(enrollment.Exam2Grade) if enrollment.Exam2Grade else 0) +
+                (float(enrollment.Grade) if enrollment.Grade else 0)
+            ),
+            "semester": enrollment.Semester
+        }
+
     @staticmethod
     def _get_remaining_courses(student_id, division_id):
         try:
@@ -421,139 +657,133 @@ class GraduationEligibilityService:
                 Enrollments.IsCompleted.in_(["مكتملة", "قيد الدراسة"])
             ).subquery()
             
-            remaining_courses = []
-            
-            # إذا كان الطالب لم يختر تخصص نهائي بعد
-            if academic_stage["specialization_status"] in ["لم يتم اختيار التخصص النهائي بعد", "يجب اختيار التخصص فوراً"]:
-                # عرض المواد الحالية للشعبة الموجود فيها
-                current_division_courses = db.session.query(Courses).join(
-                    CourseDivisions, Courses.Id == CourseDivisions.CourseId
-                ).filter(
-                    CourseDivisions.DivisionId == division_id,
-                    ~Courses.Id.in_(enrolled_course_ids)
-                ).all()
-                
-                for course in current_division_courses:
-                    division_course = db.session.query(CourseDivisions).filter(
-                        CourseDivisions.DivisionId == division_id,
-                        CourseDivisions.CourseId == course.Id
-                    ).first()
-                    
-                    course_type = "إجبارية" if division_course and division_course.IsMandatory else "اختيارية"
-                    is_available = course.Status == "متاح"
-                    availability_status = "متاحة للتسجيل" if is_available else "غير متاحة حالياً"
-                    prerequisites = GraduationEligibilityService._get_course_prerequisites(course.Id, student_id)
-                    
-                    remaining_courses.append({
-                        "id": course.Id,
-                        "name": course.Name,
-                        "code": course.Code,
-                        "credits": course.Credits,
-                        "type": course_type,
-                        "availability_status": availability_status,
-                        "prerequisites": prerequisites,
-                        "semester": course.Semester,
-                        "category": "مواد الشعبة الحالية"
-                    })
-                
-                # إضافة معلومات عن التخصصات المتاحة
-                if academic_stage["available_options"]:
-                    available_specializations = []
-                    for option_code in academic_stage["available_options"]:
-                        if option_code in GraduationEligibilityService.DIVISION_SYSTEM:
-                            spec_info = GraduationEligibilityService.DIVISION_SYSTEM[option_code]
-                            available_specializations.append({
-                                "code": option_code,
-                                "name": spec_info["description"],
-                                "path": spec_info["path"],
-                                "stage": spec_info["stage"]
-                            })
-                    
-                    # إضافة معلومة خاصة عن التخصصات المتاحة
-                    remaining_courses.append({
-                        "id": "SPECIALIZATION_INFO",
-                        "name": "اختيار التخصص",
-                        "code": "SPEC",
-                        "credits": 0,
-                        "type": "معلومات",
-                        "availability_status": "متاح للاختيار" if academic_stage["can_choose_specialization"] else "غير متاح بعد",
-                        "prerequisites": "إنهاء متطلبات الشعبة الحالية",
-                        "semester": 0,
-                        "category": "تخصصات متاحة",
-                        "available_specializations": available_specializations
-                    })
+            # مواد الشعبة غير المسجلة مع علامة الإجباري في استعلام واحد
+            division_courses = db.session.query(Courses, CourseDivisions.IsMandatory).join(
+                CourseDivisions, Courses.Id == CourseDivisions.CourseId
+            ).filter(
+                CourseDivisions.DivisionId == division_id,
+                ~Courses.Id.in_(enrolled_course_ids)
+            ).all()
             
-            else:
-                # الطالب في تخصص نهائي - عرض المواد العادية
-                division_courses = db.session.query(Courses).join(
-                    CourseDivisions, Courses.Id == CourseDivisions.CourseId
-                ).filter(
-                    CourseDivisions.DivisionId == division_id,
-                    ~Courses.Id.in_(enrolled_course_ids)
-                ).all()
-                
-                for course in division_courses:
-                    division_course = db.session.query(CourseDivisions).filter(
-                        CourseDivisions.DivisionId == division_id,
-                        CourseDivisions.CourseId == course.Id
-                    ).first()
-                    
-                    course_type = "إجبارية" if division_course and division_course.IsMandatory else "اختيارية"
-                    is_available = course.Status == "متاح"
-                    availability_status = "متاحة للتسجيل" if is_available else "غير متاحة حالياً"
-                    prerequisites = GraduationEligibilityService._get_course_prerequisites(course.Id, student_id)
-                    
-                    remaining_courses.append({
-                        "id": course.Id,
-                        "name": course.Name,
-                        "code": course.Code,
-                        "credits": course.Credits,
-                        "type": course_type,
-                        "availability_status": availability_status,
-                        "prerequisites": prerequisites,
-                        "semester": course.Semester,
-                        "category": "مواد التخصص"
-                    })
+            completed_ids = GraduationEligibilityService._get_completed_course_ids(student_id)
+            prerequisite_graph = GraduationEligibilityService._load_prerequisite_graph(
+                list({course.Id for course, _ in division_courses})
+            )
             
-            return remaining_courses
+            return GraduationEligibilityService._build_remaining_courses(
+                academic_stage, division_courses, prerequisite_graph, completed_ids
+            )
             
         except Exception as e:
             logger.error(f"Error getting remaining courses: {str(e)}")
             return []
 
     @staticmethod
-    def _get_course_prerequisites(course_id, student_id):
-        try:
-            prerequisites = db.session.query(CoursePrerequisites, Courses).join(
-                Courses, CoursePrerequisites.PrerequisiteCourseId == Courses.Id
-            ).filter(
-                CoursePrerequisites.CourseId == course_id
-            ).all()
-            
-            if not prerequisites:
-                return "لا توجد متطلبات سابقة"
-            
-            completed_course_ids = db.session.query(Enrollments.CourseId).filter(
-                Enrollments.StudentId == student_id,
-                Enrollments.IsCompleted == "مكتملة"
-            ).all()
-            
-            completed_ids = [c.CourseId for c in completed_course_ids]
-            
-            prerequisite_info = []
-            for prereq, course in prerequisites:
-                is_completed = prereq.PrerequisiteCourseId in completed_ids
-                prerequisite_info.append({
-                    "course_name": course.Name,
-                    "course_code": course.Code,
-                    "is_completed": is_completed
-                })
-            
-            return prerequisite_info
+    def _build_remaining_courses(academic_stage, division_courses, prerequisite_graph, completed_ids):
+        """بناء قائمة المواد المتبقية من مواد الشعبة المحملة مسبقاً"""
+        # أول صف لكل مادة هو المعتمد لعلامة الإجباري
+        mandatory_flags = {}
+        for course, is_mandatory in division_courses:
+            mandatory_flags.setdefault(course.Id, is_mandatory)
+        
+        not_final_specialization = academic_stage["specialization_status"] in [
+            "لم يتم اختيار التخصص النهائي بعد", "يجب اختيار التخصص فوراً"
+        ]
+        # إذا كان الطالب لم يختر تخصص نهائي بعد تعرض مواد الشعبة الحالية
+        category = "مواد الشعبة الحالية" if not_final_specialization else "مواد التخصص"
+        
+        remaining_courses = []
+        for course, _ in division_courses:
+            course_type = "إجبارية" if mandatory_flags.get(course.Id) else "اختيارية"
+            is_available = course.Status == "متاح"
+            availability_status = "متاحة للتسجيل" if is_available else "غير متاحة حالياً"
+            
+            remaining_courses.append({
+                "id": course.Id,
+                "name": course.Name,
+                "code": course.Code,
+                "credits": course.Credits,
+                "type": course_type,
+                "availability_status": availability_status,
+                "prerequisites": GraduationEligibilityService._format_prerequisites(
+                    prerequisite_graph, course.Id, completed_ids
+                ),
+                "semester": course.Semester,
+                "category": category
+            })
+        
+        # إضافة معلومات عن التخصصات المتاحة
+        if not_final_specialization and academic_stage["available_options"]:
+            available_specializations = []
+            for option_code in academic_stage["available_options"]:
+                if option_code in GraduationEligibilityService.DIVISION_SYSTEM:
+                    spec_info = GraduationEligibilityService.DIVISION_SYSTEM[option_code]
+                    available_specializations.append({
+                        "code": option_code,
+                        "name": spec_info["description"],
+                        "path": spec_info["path"],
+                        "stage": spec_info["stage"]
+                    })
             
-        except Exception as e:
-            logger.error(f"Error getting course prerequisites: {str(e)}")
-            return "خطأ في تحديد المتطلبات"
+            # إضافة معلومة خاصة عن التخصصات المتاحة
+            remaining_courses.append({
+                "id": "SPECIALIZATION_INFO",
+                "name": "اختيار التخصص",
+                "code": "SPEC",
+                "credits": 0,
+                "type": "معلومات",
+                "availability_status": "متاح للاختيار" if academic_stage["can_choose_specialization"] else "غير متاح بعد",
+                "prerequisites": "إنهاء متطلبات الشعبة الحالية",
+                "semester": 0,
+                "category": "تخصصات متاحة",
+                "available_specializations": available_specializations
+            })
+        
+        return remaining_courses
+
+    @staticmethod
+    def _get_completed_course_ids(student_id):
+        """معرفات المواد المكتملة للطالب"""
+        rows = db.session.query(Enrollments.CourseId).filter(
+            Enrollments.StudentId == student_id,
+            Enrollments.IsCompleted == "مكتملة"
+        ).all()
+        return {row.CourseId for row in rows}
+
+    @staticmethod
+    def _load_prerequisite_graph(course_ids=None):
+        """تحميل المتطلبات السابقة لمجموعة مواد (أو لكل المواد) في استعلام واحد"""
+        if course_ids is not None and not course_ids:
+            return {}
+        
+        query = db.session.query(CoursePrerequisites, Courses).join(
+            Courses, CoursePrerequisites.PrerequisiteCourseId == Courses.Id
+        )
+        if course_ids is not None:
+            query = query.filter(CoursePrerequisites.CourseId.in_(course_ids))
+        
+        prerequisite_graph = {}
+        for prereq, course in query.all():
+            prerequisite_graph.setdefault(prereq.CourseId, []).append(
+                (prereq.PrerequisiteCourseId, course.Name, course.Code)
+            )
+        
+        return prerequisite_graph
+
+    @staticmethod
+    def _format_prerequisites(prerequisite_graph, course_id, completed_ids):
+        prerequisites = prerequisite_graph.get(course_id)
+        if not prerequisites:
+            return "لا توجد متطلبات سابقة"
+        
+        return [
+            {
+                "course_name": name,
+                "course_code": code,
+                "is_completed": prerequisite_id in completed_ids
+            }
+            for prerequisite_id, name, code in prerequisites
+        ]
 
     @staticmethod
     def _get_failed_courses(student_id):
@@ -567,19 +797,10 @@ class GraduationEligibilityService:
             ).all()
             
             return [
-                {
-                    "id": course.Id,
-                    "name": course.Name,
-                    "code": course.Code,
-                    "credits": course.Credits,
-                    "grade": (
-                        (float(enrollment.Exam1Grade) if enrollment.Exam1Grade else 0) +
-                        (float(enrollment.Exam2Grade) if enrollment.Exam2Grade else 0) +
-                        (float(enrollment.Grade) if enrollment.Grade else 0)
-                    ),
-                    "semester": enrollment.Semester,
-                    "can_retake": True  
-                }
+                dict(
+                    GraduationEligibilityService._format_enrollment_course(enrollment, course),
+                    can_retake=True
+                )
                 for enrollment, course in failed
             ]
         except Exception as e:
@@ -621,20 +842,9 @@ class GraduationEligibilityService:
                 AcademicWarnings.Status == "نشط"
             ).all()
             
-            if not active_warnings:
-                return {
-                    "has_warnings": False,
-                    "count": 0,
-                    "types": []
-                }
-            
-            warning_types = list(set([warning.WarningType for warning in active_warnings]))
-            
-            return {
-                "has_warnings": True,
-                "count": len(active_warnings),
-                "types": warning_types
-            }
+            return GraduationEligibilityService._summarize_warnings(
+                [warning.WarningType for warning in active_warnings]
+            )
         except Exception as e:
             logger.error(f"Error getting academic warnings: {str(e)}")
             return {
@@ -643,6 +853,21 @@ class GraduationEligibilityService:
                 "types": []
             }
 
+    @staticmethod
+    def _summarize_warnings(warning_types):
+        if not warning_types:
+            return {
+                "has_warnings": False,
+                "count": 0,
+                "types": []
+            }
+        
+        return {
+            "has_warnings": True,
+            "count": len(warning_types),
+            "types": list(set(warning_types))
+        }
+
     @staticmethod
     def _determine_graduation_status(credits_analysis, cumulative_gpa, warnings):
         credits_complete = credits_analysis["remaining_total"] == 0
@@ -796,13 +1021,8 @@ class GraduationEligibilityService:
         return recommendations
 
     @staticmethod
-    def _calculate_gpa(student_id):
-        """حساب المعدل التراكمي الصحيح بناءً على الساعات المعتمدة والدرجات"""
+    def _calculate_student_gpa(student):
         try:
-            student = Students.query.get(student_id)
-            if not student:
-                return 0.0
-            
             gpa_history = []
             for i in range(1, student.Semester + 1):
                 gpa_field = f'GPA{i}'
@@ -820,6 +1040,63 @@ class GraduationEligibilityService:
             return 0.0
 
 
+EnrollmentPeriodSnapshot = namedtuple('EnrollmentPeriodSnapshot', ['Id', 'Semester', 'StartDate', 'EndDate'])
+
+
+class EnrollmentPeriodCache:
+    """ذاكرة مؤقتة مشتركة لفترات التسجيل - تحدد الفترة النشطة والقادمة والسابقة بدون استعلامات"""
+    
+    REFRESH_SECONDS = 3600
+    
+    _periods = None
+    _expires_at = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_periods(cls):
+        now_ts = time.time()
+        with cls._lock:
+            if cls._periods is not None and now_ts < cls._expires_at:
+                return cls._periods
+        
+        periods = [
+            EnrollmentPeriodSnapshot(period.Id, period.Semester, period.StartDate, period.EndDate)
+            for period in EnrollmentPeriods.query.order_by(EnrollmentPeriods.StartDate).all()
+        ]
+        
+        with cls._lock:
+            cls._periods = periods
+            cls._expires_at = now_ts + cls.REFRESH_SECONDS
+        return periods
+
+    @classmethod
+    def refresh(cls):
+        """إبطال الذاكرة بعد إضافة أو تعديل فترة تسجيل"""
+        with cls._lock:
+            cls._periods = None
+            cls._expires_at = 0
+
+    @classmethod
+    def get_status(cls, current_date=None):
+        """الفترة النشطة والقادمة وآخر فترة منتهية بالنسبة للوقت الحالي"""
+        # المقارنة بالوقت الحالي عند كل طلب تجعل انتهاء الفترة النشطة يظهر فوراً
+        current_date = current_date or datetime.now()
+        periods = cls._get_periods()
+        
+        active_period = next(
+            (period for period in periods if period.StartDate <= current_date <= period.EndDate), None
+        )
+        next_period = next((period for period in periods if period.StartDate > current_date), None)
+        ended_periods = [period for period in periods if period.EndDate < current_date]
+        last_period = max(ended_periods, key=lambda period: period.EndDate) if ended_periods else None
+        
+        return {
+            "active": active_period,
+            "next": next_period,
+            "last": last_period
+        }
+
+
 class EnrollmentPeriodService:
     
     @staticmethod
@@ -858,6 +1135,7 @@ class EnrollmentPeriodService:
             
             db.session.add(new_period)
             db.session.commit()
+            EnrollmentPeriodCache.refresh()
             
             return {
                 "success": True,
@@ -907,11 +1185,7 @@ class EnrollmentPeriodService:
     @staticmethod
     def get_current_enrollment_period():
         try:
-            current_date = datetime.now()
-            current_period = EnrollmentPeriods.query.filter(
-                EnrollmentPeriods.StartDate <= current_date,
-                EnrollmentPeriods.EndDate >= current_date
-            ).first()
+            current_period = EnrollmentPeriodCache.get_status()["active"]
             
             if current_period:
                 return {
@@ -1023,57 +1297,306 @@ class EnrollmentPeriodService:
         else:
             return "نشطة" 
 
-class SmartCourseRecommendationService:
-
-    def __init__(self):
-        self.weights = {
-            'content_based': 0.3,
-            'academic_performance': 0.25,
-            'schedule_optimization': 0.2,
-            'prerequisite_analysis': 0.15,
-            'gpa_improvement': 0.1
-        }
+class CourseStatisticsService:
+    """إحصائيات الدرجات لكل مادة (المتوسط ونسبة النجاح والتوزيع) محسوبة مسبقاً"""
     
-    def _check_enrollment_period(self):
-        """فحص ما إذا كانت فترة التسجيل مفتوحة أم لا"""
+    PASSING_GRADE = 75
+    BUCKET_WIDTH = 15
+    BUCKET_COUNT = 10
+    REFRESH_SECONDS = 3600
+    
+    _stats = None
+    _expires_at = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _total_grade_expression():
+        return (
+            func.coalesce(Enrollments.Exam1Grade, 0) +
+            func.coalesce(Enrollments.Exam2Grade, 0) +
+            func.coalesce(Enrollments.Grade, 0)
+        )
+
+    @classmethod
+    def refresh_all(cls):
+        """إعادة حساب إحصائيات جميع المواد باستعلام مجمع واحد"""
         try:
-            current_date = datetime.now()
+            # حساب الدرجة الكلية في استعلام فرعي حتى يتطابق تعبير الفئة في SELECT و GROUP BY
+            # (SQL Server يعتبر المعاملات المربوطة المكررة تعبيرات مختلفة)
+            grades = db.session.query(
+                Enrollments.CourseId.label('course_id'),
+                cls._total_grade_expression().label('total_grade')
+            ).filter(
+                or_(
+                    Enrollments.Exam1Grade.isnot(None),
+                    Enrollments.Exam2Grade.isnot(None),
+                    Enrollments.Grade.isnot(None)
+                )
+            ).subquery()
+            bucket = func.floor(grades.c.total_grade / literal_column(str(cls.BUCKET_WIDTH)))
+            
+            rows = db.session.query(
+                grades.c.course_id,
+                bucket.label('bucket'),
+                func.count(),
+                func.sum(grades.c.total_grade),
+                func.sum(db.case((grades.c.total_grade >= cls.PASSING_GRADE, 1), else_=0))
+            ).group_by(grades.c.course_id, bucket).all()
+            
+            aggregates = {}
+            for course_id, bucket_index, attempts, grade_sum, passed in rows:
+                stats = aggregates.setdefault(course_id, {
+                    'attempt_count': 0,
+                    'grade_sum': 0.0,
+                    'pass_count': 0,
+                    'histogram': [0] * cls.BUCKET_COUNT
+                })
+                stats['attempt_count'] += attempts
+                stats['grade_sum'] += float(grade_sum or 0)
+                stats['pass_count'] += int(passed or 0)
+                index = min(max(int(bucket_index or 0), 0), cls.BUCKET_COUNT - 1)
+                stats['histogram'][index] += attempts
+            
+            existing = {row.CourseId: row for row in CourseStatistics.query.all()}
+            now = datetime.now()
+            
+            for course_id, stats in aggregates.items():
+                row = existing.pop(course_id, None)
+                if row is None:
+                    row = CourseStatistics(CourseId=course_id)
+                    db.session.add(row)
+                
+                row.AttemptCount = stats['attempt_count']
+                row.GradeSum = stats['grade_sum']
+                row.MeanGrade = stats['grade_sum'] / stats['attempt_count']
+                row.PassCount = stats['pass_count']
+                row.PassRate = stats['pass_count'] / stats['attempt_count']
+                row.GradeHistogram = json.dumps(stats['histogram'])
+                row.UpdatedAt = now
+            
+            # مواد لم يعد لها درجات
+            for row in existing.values():
+                db.session.delete(row)
             
-            # البحث عن فترة التسجيل الحالية
-            active_period = EnrollmentPeriods.query.filter(
-                EnrollmentPeriods.StartDate <= current_date,
-                EnrollmentPeriods.EndDate >= current_date
-            ).first()
+            db.session.commit()
+            cls.invalidate()
             
-            if active_period:
-                return {
-                    'is_open': True,
-                    'message': f'فترة التسجيل مفتوحة حتى {active_period.EndDate.strftime("%Y-%m-%d")}',
-                    'period_info': {
-                        'semester': active_period.Semester,
-                        'start_date': active_period.StartDate.strftime("%Y-%m-%d"),
-                        'end_date': active_period.EndDate.strftime("%Y-%m-%d")
-                    }
-                }
-            else:
-                # البحث عن آخر فترة تسجيل انتهت
-                last_period = EnrollmentPeriods.query.filter(
-                    EnrollmentPeriods.EndDate < current_date
-                ).order_by(EnrollmentPeriods.EndDate.desc()).first()
-                
-                if last_period:
-                    return {
-                        'is_open': False,
-                        'message': f'فترة التسجيل انتهت في {last_period.EndDate.strftime("%Y-%m-%d")}',
-                        'period_info': {
-                            'semester': last_period.Semester,
-                            'end_date': last_period.EndDate.strftime("%Y-%m-%d")
-                        }
-                    }
-                else:
-                    return {
-                        'is_open': False,
-                        'message': 'لا توجد فترة تسجيل محددة حالياً',
+            return {
+                "success": True,
+                "message": f"تم تحديث إحصائيات {len(aggregates)} مادة",
+                "data": {"courses_updated": len(aggregates)}
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error in refresh_all course statistics: {str(e)}")
+            return {
+                "success": False,
+                "message": f"حدث خطأ أثناء تحديث إحصائيات المواد: {str(e)}"
+            }
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._stats = None
+            cls._expires_at = 0
+
+    @classmethod
+    def _load(cls):
+        now_ts = time.time()
+        with cls._lock:
+            if cls._stats is not None and now_ts < cls._expires_at:
+                return cls._stats
+        
+        # الجدول يُبنى من المهمة المجدولة وعند التشغيل فقط - لا تجميع داخل جلسة الطلب
+        rows = CourseStatistics.query.all()
+        
+        stats = {
+            row.CourseId: {
+                'attempt_count': row.AttemptCount,
+                'mean_grade': row.MeanGrade,
+                'pass_rate': row.PassRate,
+                'histogram': json.loads(row.GradeHistogram) if row.GradeHistogram else [],
+                'updated_at': row.UpdatedAt.isoformat() if row.UpdatedAt else None
+            }
+            for row in rows
+        }
+        
+        with cls._lock:
+            cls._stats = stats
+            cls._expires_at = now_ts + cls.REFRESH_SECONDS
+        return stats
+
+    @classmethod
+    def get_course_statistics(cls, course_id):
+        try:
+            return cls._load().get(course_id)
+        except Exception as e:
+            logger.error(f"Error getting course statistics: {str(e)}")
+            return None
+
+    @classmethod
+    def get_statistics_map(cls):
+        try:
+            return cls._load()
+        except Exception as e:
+            logger.error(f"Error getting course statistics: {str(e)}")
+            return {}
+
+
+class CourseCatalogIndex:
+    """فهرس TF-IDF مشترك لكتالوج المواد - يُبنى مرة واحدة ويُعاد بناؤه عند تغير الكتالوج فقط"""
+    
+    REFRESH_SECONDS = 3600
+    
+    _vectorizer = None
+    _matrix = None
+    _row_index = None
+    _fingerprint = None
+    _checked_at = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _catalog_fingerprint():
+        """بصمة تتغير عند إضافة مادة أو حذفها أو تعديل اسمها أو وصفها"""
+        if db.engine.dialect.name == 'mssql':
+            content_checksum = func.checksum_agg(
+                func.binary_checksum(Courses.Id, Courses.Name, Courses.Description)
+            )
+        else:
+            content_checksum = func.md5(func.string_agg(
+                func.concat(Courses.Id, ':', Courses.Name, ':', func.coalesce(Courses.Description, '')),
+                aggregate_order_by(literal('|'), Courses.Id)
+            ))
+        
+        return tuple(db.session.query(
+            func.count(Courses.Id), func.max(Courses.Id), content_checksum
+        ).one())
+
+    @classmethod
+    def _build(cls, fingerprint):
+        courses = db.session.query(Courses.Id, Courses.Name, Courses.Description).all()
+        documents = [f"{name or ''} {description or ''}".strip() for _, name, description in courses]
+        
+        vectorizer = TfidfVectorizer()
+        try:
+            matrix = vectorizer.fit_transform(documents)
+        except ValueError:
+            # كتالوج فارغ أو بدون كلمات صالحة
+            vectorizer, matrix = None, None
+        
+        cls._vectorizer = vectorizer
+        cls._matrix = matrix
+        cls._row_index = {course_id: row for row, (course_id, _, _) in enumerate(courses)}
+        cls._fingerprint = fingerprint
+
+    @classmethod
+    def _ensure_index(cls):
+        with cls._lock:
+            now_ts = time.time()
+            if cls._row_index is not None and now_ts - cls._checked_at < cls.REFRESH_SECONDS:
+                return
+            
+            fingerprint = cls._catalog_fingerprint()
+            if cls._row_index is None or fingerprint != cls._fingerprint:
+                cls._build(fingerprint)
+            cls._checked_at = now_ts
+
+    @classmethod
+    def invalidate(cls):
+        """إجبار إعادة بناء الفهرس في الطلب التالي"""
+        with cls._lock:
+            cls._row_index = None
+            cls._checked_at = 0
+
+    @classmethod
+    def similarity_to_courses(cls, candidate_ids, reference_ids, default=0.5):
+        """متوسط تشابه كل مادة مرشحة مع مجموعة مواد مرجعية بضرب مصفوفات واحد"""
+        cls._ensure_index()
+        
+        with cls._lock:
+            matrix, row_index = cls._matrix, cls._row_index
+        
+        scores = {course_id: default for course_id in candidate_ids}
+        if matrix is None:
+            return scores
+        
+        reference_rows = [row_index[course_id] for course_id in reference_ids if course_id in row_index]
+        candidate_pairs = [(course_id, row_index[course_id]) for course_id in candidate_ids if course_id in row_index]
+        if not reference_rows or not candidate_pairs:
+            return scores
+        
+        # الصفوف مطبعة (L2) لذا متوسط جيب التمام = الضرب في متوسط المتجهات المرجعية
+        profile = np.asarray(matrix[reference_rows].mean(axis=0)).ravel()
+        if not profile.any():
+            return scores
+        
+        candidate_matrix = matrix[[row for _, row in candidate_pairs]]
+        similarities = candidate_matrix.dot(profile)
+        has_terms = np.diff(candidate_matrix.indptr) > 0
+        
+        for (course_id, _), similarity, valid in zip(candidate_pairs, similarities, has_terms):
+            if valid:
+                scores[course_id] = float(similarity)
+        
+        return scores
+
+
+class SmartCourseRecommendationService:
+    
+    # ترتيب أعمدة مصفوفة الخصائص ومتجه الأوزان
+    FEATURE_COLUMNS = (
+        'content_based',
+        'academic_performance',
+        'schedule_optimization',
+        'prerequisite_analysis',
+        'gpa_improvement'
+    )
+
+    def __init__(self):
+        self.weights = {
+            'content_based': 0.3,
+            'academic_performance': 0.25,
+            'schedule_optimization': 0.2,
+            'prerequisite_analysis': 0.15,
+            'gpa_improvement': 0.1
+        }
+    
+    def _check_enrollment_period(self):
+        """فحص ما إذا كانت فترة التسجيل مفتوحة أم لا"""
+        try:
+            period_status = EnrollmentPeriodCache.get_status()
+            
+            # البحث عن فترة التسجيل الحالية
+            active_period = period_status["active"]
+            
+            if active_period:
+                return {
+                    'is_open': True,
+                    'message': f'فترة التسجيل مفتوحة حتى {active_period.EndDate.strftime("%Y-%m-%d")}',
+                    'period_info': {
+                        'semester': active_period.Semester,
+                        'start_date': active_period.StartDate.strftime("%Y-%m-%d"),
+                        'end_date': active_period.EndDate.strftime("%Y-%m-%d")
+                    }
+                }
+            else:
+                # البحث عن آخر فترة تسجيل انتهت
+                last_period = period_status["last"]
+                
+                if last_period:
+                    return {
+                        'is_open': False,
+                        'message': f'فترة التسجيل انتهت في {last_period.EndDate.strftime("%Y-%m-%d")}',
+                        'period_info': {
+                            'semester': last_period.Semester,
+                            'end_date': last_period.EndDate.strftime("%Y-%m-%d")
+                        }
+                    }
+                else:
+                    return {
+                        'is_open': False,
+                        'message': 'لا توجد فترة تسجيل محددة حالياً',
                         'period_info': None
                     }
                     
@@ -1250,22 +1773,35 @@ class SmartCourseRecommendationService:
             student = Students.query.get(student_id)
             current_semester_name = f"الترم {student.Semester}" if student else "الترم 1"
             
+            # تجاهل المواد الراسب فيها إذا كان مسجل فيها حالياً
+            retry_course_ids = {
+                enrollment.CourseId for enrollment in failed_enrollments
+                if enrollment.CourseId not in currently_enrolled_course_ids
+            }
+            courses = {
+                course.Id: course for course in Courses.query.filter(Courses.Id.in_(list(retry_course_ids))).all()
+            } if retry_course_ids else {}
+            mandatory_ids = {
+                row.CourseId for row in db.session.query(CourseDivisions.CourseId).filter(
+                    CourseDivisions.DivisionId == student.DivisionId,
+                    CourseDivisions.CourseId.in_(list(courses)),
+                    CourseDivisions.IsMandatory == True
+                ).all()
+            } if student and courses else set()
+            class_info_map = self._get_course_class_info_bulk(courses.keys())
+            enrolled_counts = self._get_current_enrolled_counts(courses.keys(), current_semester_name)
+            
             failed_courses = []
             for enrollment in failed_enrollments:
-                # تجاهل المواد الراسب فيها إذا كان مسجل فيها حالياً
                 if enrollment.CourseId not in currently_enrolled_course_ids:
-                    course = Courses.query.get(enrollment.CourseId)
+                    course = courses.get(enrollment.CourseId)
                     if course:
-                        is_mandatory = self._is_course_mandatory(course.Id, student_id)
+                        is_mandatory = course.Id in mandatory_ids
                         
-                        class_info = self._get_course_class_info(course.Id)
+                        class_info = class_info_map.get(course.Id, {})
                         
-                        # حساب عدد الطلاب المسجلين حالياً في نفس الترم
-                        current_enrolled_count = db.session.query(Enrollments).filter(
-                            Enrollments.CourseId == course.Id,
-                            Enrollments.Semester == current_semester_name,
-                            Enrollments.IsCompleted == 'قيد الدراسة'
-                        ).count()
+                        # عدد الطلاب المسجلين حالياً في نفس الترم
+                        current_enrolled_count = enrolled_counts.get(course.Id, 0)
                         
                         failed_courses.append({
                             'id': course.Id,
@@ -1290,23 +1826,6 @@ class SmartCourseRecommendationService:
             logger.error(f"Error getting failed courses: {str(e)}")
             return []
     
-    def _is_course_mandatory(self, course_id, student_id):
-        try:
-            student = Students.query.get(student_id)
-            if not student:
-                return False
-            
-            course_division = CourseDivisions.query.filter_by(
-                CourseId=course_id,
-                DivisionId=student.DivisionId,
-                IsMandatory=True
-            ).first()
-            
-            return course_division is not None
-        except Exception as e:
-            logger.error(f"Error checking if course is mandatory: {str(e)}")
-            return False
-    
     def _classify_student_academic_status(self, student_data):
         try:
             current_gpa = student_data['current_gpa']
@@ -1440,67 +1959,68 @@ class SmartCourseRecommendationService:
     
     def _get_available_courses(self, student_data):
         try:
-            available_courses = db.session.query(Courses).join(
+            # مواد الشعبة المتاحة مع علامة الإجباري في استعلام واحد
+            division_courses = db.session.query(Courses, CourseDivisions.IsMandatory).join(
                 CourseDivisions, Courses.Id == CourseDivisions.CourseId
             ).filter(
                 CourseDivisions.DivisionId == student_data['division_id'],
                 Courses.Status == 'متاح'
             ).all()
             
-            completed_course_ids = [course['id'] for course in student_data['completed_courses']]
+            completed_course_ids = {course['id'] for course in student_data['completed_courses']}
             
-            # الحصول على المواد المسجل فيها حالياً بتفاصيل أكثر
-            current_enrollments = Enrollments.query.filter_by(
-                StudentId=student_data['id'],
-                IsCompleted='قيد الدراسة'
-            ).all()
-            
-            currently_enrolled_course_ids = [enrollment.CourseId for enrollment in current_enrollments]
+            currently_enrolled_course_ids = student_data.get('currently_enrolled_course_ids')
+            if currently_enrolled_course_ids is None:
+                currently_enrolled_course_ids = self._get_currently_enrolled_courses(student_data['id'])
             
             # دمج المواد المكتملة والمسجل فيها حالياً
-            excluded_course_ids = completed_course_ids + currently_enrolled_course_ids
+            excluded_course_ids = completed_course_ids | set(currently_enrolled_course_ids)
+            
+            mandatory_flags = {}
+            for course, is_mandatory in division_courses:
+                mandatory_flags.setdefault(course.Id, bool(is_mandatory))
+            
+            candidate_ids = [course_id for course_id in mandatory_flags if course_id not in excluded_course_ids]
+            
+            # فلترة المتطلبات السابقة كعمليات على المجموعات
+            prerequisites_map = self._get_prerequisites_bulk(candidate_ids)
+            eligible_ids = {
+                course_id for course_id in candidate_ids
+                if prerequisites_map.get(course_id, set()) <= completed_course_ids
+            }
             
             # الحصول على الترم الحالي للطالب
             current_semester_name = f"الترم {student_data['current_semester']}"
             
+            class_info_map = self._get_course_class_info_bulk(eligible_ids)
+            enrolled_counts = self._get_current_enrolled_counts(eligible_ids, current_semester_name)
+            
             filtered_courses = []
-            for course in available_courses:
-                if course.Id not in excluded_course_ids:
-                    prerequisites_met = self._check_prerequisites(course.Id, completed_course_ids)
-                    
-                    if prerequisites_met:
-                        course_division = CourseDivisions.query.filter_by(
-                            CourseId=course.Id,
-                            DivisionId=student_data['division_id']
-                        ).first()
-                        
-                        class_info = self._get_course_class_info(course.Id)
-                        
-                        # حساب عدد الطلاب المسجلين حالياً في نفس الترم
-                        current_enrolled_count = db.session.query(Enrollments).filter(
-                            Enrollments.CourseId == course.Id,
-                            Enrollments.Semester == current_semester_name,
-                            Enrollments.IsCompleted == 'قيد الدراسة'
-                        ).count()
-                        
-                        filtered_courses.append({
-                            'id': course.Id,
-                            'name': course.Name,
-                            'code': course.Code,
-                            'description': course.Description,
-                            'credits': course.Credits,
-                            'semester': course.Semester,
-                            'is_mandatory': course_division.IsMandatory if course_division else False,
-                            'max_seats': course.MaxSeats,
-                            'current_enrolled': current_enrolled_count,  # العدد المحسوب من جدول Enrollments
-                            'available_seats': course.MaxSeats - current_enrolled_count,
-                            'professor_name': class_info.get('professor_name', 'غير محدد'),
-                            'day': class_info.get('day', 'غير محدد'),
-                            'day_name': class_info.get('day', 'غير محدد'),
-                            'start_time': class_info.get('start_time', 'غير محدد'),
-                            'end_time': class_info.get('end_time', 'غير محدد'),
-                            'location': class_info.get('location', 'غير محدد')
-                        })
+            for course, _ in division_courses:
+                if course.Id not in eligible_ids:
+                    continue
+                
+                class_info = class_info_map.get(course.Id, {})
+                current_enrolled_count = enrolled_counts.get(course.Id, 0)
+                
+                filtered_courses.append({
+                    'id': course.Id,
+                    'name': course.Name,
+                    'code': course.Code,
+                    'description': course.Description,
+                    'credits': course.Credits,
+                    'semester': course.Semester,
+                    'is_mandatory': mandatory_flags[course.Id],
+                    'max_seats': course.MaxSeats,
+                    'current_enrolled': current_enrolled_count,  # العدد المحسوب من جدول Enrollments
+                    'available_seats': course.MaxSeats - current_enrolled_count,
+                    'professor_name': class_info.get('professor_name', 'غير محدد'),
+                    'day': class_info.get('day', 'غير محدد'),
+                    'day_name': class_info.get('day', 'غير محدد'),
+                    'start_time': class_info.get('start_time', 'غير محدد'),
+                    'end_time': class_info.get('end_time', 'غير محدد'),
+                    'location': class_info.get('location', 'غير محدد')
+                })
             
             return filtered_courses
             
@@ -1508,26 +2028,56 @@ class SmartCourseRecommendationService:
             logger.error(f"Error getting available courses: {str(e)}")
             return []
     
-    def _get_course_class_info(self, course_id):
-        try:
-            class_session = Classes.query.filter_by(CourseId=course_id).first()
-            
-            if not class_session:
-                return {}
-            
-            professor = Professors.query.get(class_session.ProfessorId)
-            
-            return {
-                'professor_name': professor.FullName if professor else 'غير محدد',
+    def _get_prerequisites_bulk(self, course_ids):
+        """المتطلبات السابقة لمجموعة مواد في استعلام واحد"""
+        if not course_ids:
+            return {}
+        
+        rows = db.session.query(CoursePrerequisites.CourseId, CoursePrerequisites.PrerequisiteCourseId).filter(
+            CoursePrerequisites.CourseId.in_(list(course_ids))
+        ).all()
+        
+        prerequisites_map = {}
+        for course_id, prerequisite_id in rows:
+            prerequisites_map.setdefault(course_id, set()).add(prerequisite_id)
+        return prerequisites_map
+    
+    def _get_course_class_info_bulk(self, course_ids):
+        """أول محاضرة لكل مادة مع اسم الأستاذ في استعلام واحد"""
+        if not course_ids:
+            return {}
+        
+        rows = db.session.query(Classes, Professors.FullName).outerjoin(
+            Professors, Classes.ProfessorId == Professors.Id
+        ).filter(
+            Classes.CourseId.in_(list(course_ids))
+        ).order_by(Classes.Id).all()
+        
+        class_info_map = {}
+        for class_session, professor_name in rows:
+            if class_session.CourseId in class_info_map:
+                continue
+            class_info_map[class_session.CourseId] = {
+                'professor_name': professor_name or 'غير محدد',
                 'day': class_session.Day,
                 'start_time': str(class_session.StartTime) if class_session.StartTime else 'غير محدد',
                 'end_time': str(class_session.EndTime) if class_session.EndTime else 'غير محدد',
                 'location': class_session.Location or 'غير محدد'
             }
-            
-        except Exception as e:
-            logger.error(f"Error getting course class info: {str(e)}")
+        return class_info_map
+    
+    def _get_current_enrolled_counts(self, course_ids, semester_name):
+        """عدد الطلاب المسجلين حالياً لكل مادة في استعلام مجمع واحد"""
+        if not course_ids:
             return {}
+        
+        return dict(
+            db.session.query(Enrollments.CourseId, func.count(Enrollments.Id)).filter(
+                Enrollments.CourseId.in_(list(course_ids)),
+                Enrollments.Semester == semester_name,
+                Enrollments.IsCompleted == 'قيد الدراسة'
+            ).group_by(Enrollments.CourseId).all()
+        )
     
     def _check_prerequisites(self, course_id, completed_course_ids):
         try:
@@ -1559,18 +2109,23 @@ class SmartCourseRecommendationService:
             
             failed_mandatory_courses = [course for course in student_data['failed_courses'] if course['is_mandatory']]
             
+            # مصفوفة الخصائص تُبنى مرة واحدة لكل المواد وتُستخدم في جميع الفئات
+            course_scores = self._score_courses(
+                current_semester_mandatory + elective_courses + failed_mandatory_courses, student_data
+            )
+            
             recommendations = {
                 'mandatory_courses': self._recommend_mandatory_courses(
-                    current_semester_mandatory, student_data, academic_status
+                    current_semester_mandatory, student_data, academic_status, course_scores
                 ),
                 'failed_courses_retry': self._recommend_failed_courses_retry(
-                    failed_mandatory_courses, student_data, academic_status
+                    failed_mandatory_courses, student_data, academic_status, course_scores
                 ),
                 'gpa_improvement_courses': self._recommend_gpa_improvement_courses(
-                    elective_courses, student_data, academic_status
+                    elective_courses, student_data, academic_status, course_scores
                 ),
                 'elective_courses': self._recommend_elective_courses(
-                    elective_courses, student_data, academic_status
+                    elective_courses, student_data, academic_status, course_scores
                 ),
                 'academic_status': academic_status,
                 'summary': self._generate_recommendation_summary(student_data, academic_status)
@@ -1582,15 +2137,75 @@ class SmartCourseRecommendationService:
             logger.error(f"Error generating categorized recommendations: {str(e)}")
             return {}
     
-    def _recommend_mandatory_courses(self, mandatory_courses, student_data, academic_status):
+    def _score_courses(self, courses, student_data):
+        """بناء مصفوفة خصائص NumPy للمواد المرشحة وحساب الدرجة المركبة بمتجه الأوزان"""
+        unique_courses = list({course['id']: course for course in courses}.values())
+        course_ids = [course['id'] for course in unique_courses]
+        
+        # الأعمدة بنفس ترتيب FEATURE_COLUMNS
+        similarities = self._calculate_content_similarities(unique_courses, student_data)
+        difficulty = self._estimate_course_difficulties(course_ids)
+        prerequisite_readiness = self._calculate_prerequisite_readiness(course_ids, student_data)
+        
+        credits = np.array([course['credits'] or 0 for course in unique_courses], dtype=float)
+        total_credits = student_data['credits_completed'] or 0
+        gpa_impact = credits / (total_credits + credits) if total_credits > 0 else np.full(len(course_ids), 0.1)
+        
+        max_seats = np.array([course.get('max_seats') or 0 for course in unique_courses], dtype=float)
+        available_seats = np.array([course.get('available_seats') or 0 for course in unique_courses], dtype=float)
+        seat_availability = np.where(
+            max_seats > 0, np.clip(available_seats / np.where(max_seats > 0, max_seats, 1), 0.0, 1.0), 1.0
+        )
+        
+        features = np.column_stack([
+            np.array([similarities.get(course_id, 0.5) for course_id in course_ids], dtype=float),
+            1.0 - difficulty,
+            seat_availability,
+            prerequisite_readiness,
+            gpa_impact
+        ]) if course_ids else np.zeros((0, len(self.FEATURE_COLUMNS)))
+        
+        weight_vector = np.array([self.weights[column] for column in self.FEATURE_COLUMNS])
+        
+        semesters = np.array([course['semester'] or 0 for course in unique_courses], dtype=float)
+        dependent_counts = self._get_dependent_counts_bulk(course_ids)
+        priority = np.minimum(
+            0.5 +
+            np.array([dependent_counts.get(course_id, 0) for course_id in course_ids], dtype=float) * 0.1 +
+            np.where(student_data['current_semester'] >= semesters, 0.3, 0.0),
+            1.0
+        )
+        
+        return {
+            'index': {course_id: row for row, course_id in enumerate(course_ids)},
+            'features': features,
+            'difficulty': difficulty,
+            'priority': priority,
+            'composite': features @ weight_vector
+        }
+    
+    def _select_scores(self, courses, student_data, course_scores, *keys):
+        """اقتطاع صفوف مواد فئة معينة من مصفوفة الخصائص المشتركة"""
+        if course_scores is None:
+            course_scores = self._score_courses(courses, student_data)
+        
+        rows = np.array([course_scores['index'][course['id']] for course in courses], dtype=int)
+        return [course_scores[key][rows] for key in keys]
+    
+    def _recommend_mandatory_courses(self, mandatory_courses, student_data, academic_status, course_scores=None):
         try:
             recommendations = []
             current_semester = student_data['current_semester']
             
-            for course in mandatory_courses:
-                priority_score = self._calculate_mandatory_priority(course, student_data)
-                
-                difficulty_score = self._estimate_course_difficulty(course, student_data)
+            priority, difficulty, composite = self._select_scores(
+                mandatory_courses, student_data, course_scores, 'priority', 'difficulty', 'composite'
+            )
+            
+            # الترتيب حسب الأولوية ثم الدرجة المركبة
+            for row in np.lexsort((-composite, -priority)):
+                course = mandatory_courses[row]
+                priority_score = float(priority[row])
+                difficulty_score = float(difficulty[row])
                 
                 recommendation_reason = self._get_mandatory_recommendation_reason(
                     course, student_data, priority_score, difficulty_score, current_semester
@@ -1600,19 +2215,18 @@ class SmartCourseRecommendationService:
                     'course': course,
                     'priority_score': priority_score,
                     'difficulty_score': difficulty_score,
+                    'recommendation_score': float(composite[row]),
                     'recommendation_reason': recommendation_reason,
                     'suggested_semester': current_semester  # الترم الحالي
                 })
             
-            recommendations.sort(key=lambda x: x['priority_score'], reverse=True)
-            
             return recommendations  
             
         except Exception as e:
             logger.error(f"Error recommending mandatory courses: {str(e)}")
             return []
     
-    def _recommend_failed_courses_retry(self, failed_courses, student_data, academic_status):
+    def _recommend_failed_courses_retry(self, failed_courses, student_data, academic_status, course_scores=None):
         try:
             if not failed_courses:
                 return {
@@ -1625,9 +2239,14 @@ class SmartCourseRecommendationService:
             
             recommendations = []
             
-            for course in failed_courses:
-                priority_score = self._calculate_mandatory_priority(course, student_data)
-                difficulty_score = self._estimate_course_difficulty(course, student_data)
+            priority, difficulty, composite = self._select_scores(
+                failed_courses, student_data, course_scores, 'priority', 'difficulty', 'composite'
+            )
+            
+            for row in np.lexsort((-composite, -priority)):
+                course = failed_courses[row]
+                priority_score = float(priority[row])
+                difficulty_score = float(difficulty[row])
                 
                 suggested_semester = self._suggest_optimal_semester(course, student_data, academic_status)
                 
@@ -1639,12 +2258,11 @@ class SmartCourseRecommendationService:
                     'course': course,
                     'priority_score': priority_score,
                     'difficulty_score': difficulty_score,
+                    'recommendation_score': float(composite[row]),
                     'recommendation_reason': recommendation_reason,
                     'suggested_semester': suggested_semester
                 })
             
-            recommendations.sort(key=lambda x: x['priority_score'], reverse=True)
-            
             return {
                 'message': f'يوجد {len(recommendations)} مادة راسب فيها تحتاج إلى إعادة',
                 'current_gpa': student_data.get('current_gpa', 0),
@@ -1660,7 +2278,7 @@ class SmartCourseRecommendationService:
                 'courses': []
             }
     
-    def _recommend_gpa_improvement_courses(self, elective_courses, student_data, academic_status):
+    def _recommend_gpa_improvement_courses(self, elective_courses, student_data, academic_status, course_scores=None):
         """توصية مواد لتحسين المعدل التراكمي"""
         try:
             current_gpa = student_data.get('current_gpa', 0)
@@ -1677,31 +2295,37 @@ class SmartCourseRecommendationService:
             
             recommendations = []
             
-            for course in elective_courses:
-                high_grade_probability = self._calculate_high_grade_probability(course, student_data)
-                
-                ease_score = self._calculate_course_ease_score(course, student_data)
-                
-                gpa_impact = self._calculate_gpa_impact(course, student_data)
+            if academic_status['status'] == 'at_risk':
+                min_ease_score = 0.4
+                min_probability = 0.5
+            else:
+                min_ease_score = 0.6
+                min_probability = 0.7
+            
+            # احتمالية الدرجة العالية تعتمد على معدل الطالب فقط
+            high_grade_probability = self._calculate_high_grade_probability(None, student_data)
+            
+            if elective_courses and high_grade_probability > min_probability:
+                features, difficulty, composite = self._select_scores(
+                    elective_courses, student_data, course_scores, 'features', 'difficulty', 'composite'
+                )
+                ease = 1.0 - difficulty
+                gpa_impact = features[:, self.FEATURE_COLUMNS.index('gpa_improvement')]
                 
-                if academic_status['status'] == 'at_risk':
-                    min_ease_score = 0.4
-                    min_probability = 0.5
-                else:
-                    min_ease_score = 0.6
-                    min_probability = 0.7
+                eligible_rows = np.flatnonzero(ease > min_ease_score)
+                ranked_rows = eligible_rows[np.lexsort((-composite[eligible_rows], -gpa_impact[eligible_rows]))]
                 
-                if high_grade_probability > min_probability and ease_score > min_ease_score:
+                for row in ranked_rows:
+                    ease_score = float(ease[row])
                     recommendations.append({
-                        'course': course,
+                        'course': elective_courses[row],
                         'high_grade_probability': high_grade_probability,
                         'ease_score': ease_score,
-                        'gpa_impact': gpa_impact,
+                        'gpa_impact': float(gpa_impact[row]),
+                        'recommendation_score': float(composite[row]),
                         'recommendation_reason': f"مادة مناسبة مع احتمالية {high_grade_probability*100:.0f}% للحصول على درجة جيدة (سهولة: {ease_score*100:.0f}%)"
                     })
             
-            recommendations.sort(key=lambda x: x['gpa_impact'], reverse=True)
-            
             if not recommendations:
                 return {
                     'message': f'معدلك التراكمي ({current_gpa:.2f}) يحتاج تحسين لكن لا توجد مواد اختيارية سهلة متاحة حالياً',
@@ -1725,35 +2349,43 @@ class SmartCourseRecommendationService:
                 'courses': []
             }
     
-    def _recommend_elective_courses(self, elective_courses, student_data, academic_status):
+    def _recommend_elective_courses(self, elective_courses, student_data, academic_status, course_scores=None):
         try:
             recommendations = []
+            elective_courses = [course for course in elective_courses if not course['is_mandatory']]
+            if not elective_courses:
+                return recommendations
             
-            for course in elective_courses:
-                if not course['is_mandatory']:
-                    content_similarity = self._calculate_content_similarity(course, student_data)                   
-                    strength_alignment = self._calculate_strength_alignment(course, student_data)
-                    
-                    career_relevance = self._calculate_career_relevance(course, student_data)                   
-                    overall_score = (
-                        content_similarity * 0.3 +
-                        strength_alignment * 0.4 +
-                        career_relevance * 0.3
-                    )
-                    
-                    recommendations.append({
-                        'course': course,
-                        'content_similarity': content_similarity,
-                        'strength_alignment': strength_alignment,
-                        'career_relevance': career_relevance,
-                        'overall_score': overall_score,
-                        'recommendation_reason': self._generate_elective_reason(
-                            course, content_similarity, strength_alignment, career_relevance
-                        ),
-                        'course_type': 'elective'
-                    })
+            features, composite = self._select_scores(
+                elective_courses, student_data, course_scores, 'features', 'composite'
+            )
+            content_similarity = features[:, self.FEATURE_COLUMNS.index('content_based')]
+            
+            # التوافق والصلة المهنية لا يعتمدان على المادة حالياً
+            strength_alignment = self._calculate_strength_alignment(None, student_data)
+            career_relevance = self._calculate_career_relevance(None, student_data)
+            overall_score = (
+                content_similarity * 0.3 +
+                strength_alignment * 0.4 +
+                career_relevance * 0.3
+            )
             
-            recommendations.sort(key=lambda x: x['overall_score'], reverse=True)
+            for row in np.lexsort((-composite, -overall_score)):
+                course = elective_courses[row]
+                similarity = float(content_similarity[row])
+                
+                recommendations.append({
+                    'course': course,
+                    'content_similarity': similarity,
+                    'strength_alignment': strength_alignment,
+                    'career_relevance': career_relevance,
+                    'overall_score': float(overall_score[row]),
+                    'recommendation_score': float(composite[row]),
+                    'recommendation_reason': self._generate_elective_reason(
+                        course, similarity, strength_alignment, career_relevance
+                    ),
+                    'course_type': 'elective'
+                })
             
             return recommendations 
             
@@ -1785,26 +2417,10 @@ class SmartCourseRecommendationService:
     
     def _estimate_course_difficulty(self, course, student_data):
         try:
-            enrollments = Enrollments.query.filter(
-                Enrollments.CourseId == course['id'],
-                or_(
-                    Enrollments.Exam1Grade.isnot(None),
-                    Enrollments.Exam2Grade.isnot(None), 
-                    Enrollments.Grade.isnot(None)
-                )
-            ).all()
+            stats = CourseStatisticsService.get_course_statistics(course['id'])
             
-            if enrollments:
-                total_grades = []
-                for enrollment in enrollments:
-                    exam1_grade = float(enrollment.Exam1Grade) if enrollment.Exam1Grade else 0
-                    exam2_grade = float(enrollment.Exam2Grade) if enrollment.Exam2Grade else 0
-                    final_grade = float(enrollment.Grade) if enrollment.Grade else 0
-                    total_grade = exam1_grade + exam2_grade + final_grade
-                    total_grades.append(total_grade)
-                
-                avg_grade = sum(total_grades) / len(total_grades)
-                difficulty = 1.0 - (avg_grade / 150.0)
+            if stats and stats['attempt_count']:
+                difficulty = 1.0 - (stats['mean_grade'] / 150.0)
             else:
                 difficulty = 0.5  
             
@@ -1814,26 +2430,54 @@ class SmartCourseRecommendationService:
             logger.error(f"Error estimating course difficulty: {str(e)}")
             return 0.5
     
-    def _calculate_content_similarity(self, course, student_data):
+    def _estimate_course_difficulties(self, course_ids):
+        """صعوبة مجموعة مواد كمتجه من الإحصائيات المحسوبة مسبقاً"""
+        stats_map = CourseStatisticsService.get_statistics_map()
+        
+        mean_grades = np.full(len(course_ids), np.nan)
+        for row, course_id in enumerate(course_ids):
+            stats = stats_map.get(course_id)
+            if stats and stats['attempt_count']:
+                mean_grades[row] = stats['mean_grade']
+        
+        return np.where(np.isnan(mean_grades), 0.5, np.clip(1.0 - mean_grades / 150.0, 0.0, 1.0))
+    
+    def _calculate_prerequisite_readiness(self, course_ids, student_data):
+        """نسبة المتطلبات السابقة المستوفاة لكل مادة"""
+        completed_course_ids = {course['id'] for course in student_data['completed_courses']}
+        prerequisites_map = self._get_prerequisites_bulk(course_ids)
+        
+        return np.array([
+            len(prerequisites_map[course_id] & completed_course_ids) / len(prerequisites_map[course_id])
+            if prerequisites_map.get(course_id) else 1.0
+            for course_id in course_ids
+        ], dtype=float)
+    
+    def _get_dependent_counts_bulk(self, course_ids):
+        """عدد المواد التي تعتمد على كل مادة كمتطلب سابق في استعلام مجمع واحد"""
+        if not course_ids:
+            return {}
+        
+        return dict(
+            db.session.query(CoursePrerequisites.PrerequisiteCourseId, func.count(CoursePrerequisites.Id)).filter(
+                CoursePrerequisites.PrerequisiteCourseId.in_(list(course_ids))
+            ).group_by(CoursePrerequisites.PrerequisiteCourseId).all()
+        )
+    
+    def _calculate_content_similarities(self, courses, student_data):
+        """تشابه المحتوى لكل المواد المرشحة من فهرس الكتالوج المشترك"""
         try:
-            if not student_data['completed_courses']:
-                return 0.5
+            if not courses or not student_data['completed_courses']:
+                return {course['id']: 0.5 for course in courses}
             
-            course_desc = course.get('description', '')
-            completed_descs = [c['name'] for c in student_data['completed_courses']]
-            
-            if not course_desc or not any(completed_descs):
-                return 0.5
-            
-            vectorizer = TfidfVectorizer()
-            tfidf_matrix = vectorizer.fit_transform([course_desc] + completed_descs)
-            similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:])[0]
-            
-            return float(np.mean(similarity))
+            return CourseCatalogIndex.similarity_to_courses(
+                [course['id'] for course in courses],
+                [c['id'] for c in student_data['completed_courses']]
+            )
             
         except Exception as e:
             logger.error(f"Error calculating content similarity: {str(e)}")
-            return 0.5
+            return {course['id']: 0.5 for course in courses}
     
     def _calculate_strength_alignment(self, course, student_data):
         """حساب التوافق مع نقاط القوة - مبسط"""
@@ -1935,21 +2579,6 @@ class SmartCourseRecommendationService:
             logger.error(f"Error calculating high grade probability: {str(e)}")
             return 0.65
     
-    def _calculate_course_ease_score(self, course, student_data):
-        """حساب درجة سهولة المادة"""
-        # حساب بناءً على متوسط درجات الطلاب
-        difficulty = self._estimate_course_difficulty(course, student_data)
-        return 1.0 - difficulty
-    
-    def _calculate_gpa_impact(self, course, student_data):
-        """حساب تأثير المادة على المعدل التراكمي"""
-        credits = course['credits']
-        total_credits = student_data['credits_completed']
-        
-        # كلما زادت الساعات، زاد التأثير
-        impact = credits / (total_credits + credits) if total_credits > 0 else 0.1
-        return impact
-    
     def _generate_elective_reason(self, course, content_similarity, strength_alignment, career_relevance):
         """توليد سبب توصية المادة الاختيارية"""
         reasons = []
@@ -1982,15 +2611,7 @@ class SmartCourseRecommendationService:
             readiness_score += gpa_factor * 0.4
             
             # عامل المتطلبات السابقة (30%)
-            completed_course_ids = [course['id'] for course in student_data['completed_courses']]
-            prerequisites = CoursePrerequisites.query.filter_by(CourseId=course['id']).all()
-            
-            if prerequisites:
-                met_prerequisites = sum(1 for prereq in prerequisites 
-                                     if prereq.PrerequisiteCourseId in completed_course_ids)
-                prereq_factor = met_prerequisites / len(prerequisites)
-            else:
-                prereq_factor = 1.0  # لا توجد متطلبات سابقة
+            prereq_factor = float(self._calculate_prerequisite_readiness([course['id']], student_data)[0])
             
             readiness_score += prereq_factor * 0.3
             
@@ -2092,17 +2713,12 @@ class CourseEnrollmentService:
                     "message": availability_check["message"]
                 }
             
-           
-            final_check = Enrollments.query.filter_by(
-                StudentId=student_id,
-                CourseId=course_id,
-                IsCompleted="قيد الدراسة"
-            ).first()
-            
-            if final_check:
+            # حجز المقعد بتحديث شرطي داخل نفس معاملة التسجيل
+            if not CourseEnrollmentService._reserve_seat(course_id):
+                db.session.rollback()
                 return {
                     "success": False,
-                    "message": f"خطأ: تم اكتشاف تسجيل مكرر للمادة ({course.Name})"
+                    "message": f"المادة مكتملة العدد ({course.MaxSeats}/{course.MaxSeats})"
                 }
             
             new_enrollment = Enrollments(
@@ -2119,6 +2735,8 @@ class CourseEnrollmentService:
             
             db.session.add(new_enrollment)
             db.session.commit()
+            GraduationReportCache.invalidate(student_id)
+            PlanningDataCache.invalidate_student(student_id)
             
             return {
                 "success": True,
@@ -2141,6 +2759,188 @@ class CourseEnrollmentService:
                 "message": f"حدث خطأ أثناء التسجيل: {str(e)}"
             }
     
+    @staticmethod
+    def enroll_student_in_courses(student_id, course_ids):
+        """تسجيل الطالب في مجموعة مواد دفعة واحدة - إما تسجيل الكل أو لا شيء"""
+        try:
+            enrollment_check = CourseEnrollmentService._check_enrollment_period()
+            if not enrollment_check["is_active"]:
+                return {
+                    "success": False,
+                    "message": enrollment_check["message"]
+                }
+            
+            student = Students.query.get(student_id)
+            if not student:
+                return {
+                    "success": False,
+                    "message": "الطالب غير موجود"
+                }
+            
+            # إزالة التكرار مع الحفاظ على الترتيب
+            course_ids = list(dict.fromkeys(course_ids))
+            current_semester = CourseEnrollmentService._get_current_semester()
+            
+            courses = {course.Id: course for course in Courses.query.filter(Courses.Id.in_(course_ids)).all()}
+            
+            existing_statuses = dict(
+                db.session.query(Enrollments.CourseId, Enrollments.IsCompleted).filter(
+                    Enrollments.StudentId == student_id,
+                    Enrollments.CourseId.in_(course_ids),
+                    Enrollments.IsCompleted.in_(["قيد الدراسة", "مكتملة"])
+                ).all()
+            )
+            
+            division_course_ids = {
+                row.CourseId for row in db.session.query(CourseDivisions.CourseId).filter(
+                    CourseDivisions.DivisionId == student.DivisionId,
+                    CourseDivisions.CourseId.in_(course_ids)
+                ).all()
+            }
+            
+            completed_ids = {
+                row.CourseId for row in db.session.query(Enrollments.CourseId).filter(
+                    Enrollments.StudentId == student_id,
+                    Enrollments.IsCompleted == "مكتملة"
+                ).all()
+            }
+            
+            missing_prerequisites = {}
+            prerequisite_rows = db.session.query(
+                CoursePrerequisites.CourseId, CoursePrerequisites.PrerequisiteCourseId, Courses.Name
+            ).join(
+                Courses, CoursePrerequisites.PrerequisiteCourseId == Courses.Id
+            ).filter(
+                CoursePrerequisites.CourseId.in_(course_ids)
+            ).all()
+            for row in prerequisite_rows:
+                if row.PrerequisiteCourseId not in completed_ids:
+                    missing_prerequisites.setdefault(row.CourseId, []).append(row.Name)
+            
+            current_credits = db.session.query(func.coalesce(func.sum(Courses.Credits), 0)).join(
+                Enrollments, Enrollments.CourseId == Courses.Id
+            ).filter(
+                Enrollments.StudentId == student_id,
+                Enrollments.Semester == current_semester,
+                Enrollments.IsCompleted == "قيد الدراسة"
+            ).scalar() or 0
+            
+            results = []
+            for course_id in course_ids:
+                course = courses.get(course_id)
+                message = None
+                
+                if not course:
+                    message = "المادة غير موجودة"
+                elif existing_statuses.get(course_id) == "قيد الدراسة":
+                    message = f"الطالب مسجل بالفعل في هذه المادة ({course.Name}) وهي قيد الدراسة حالياً"
+                elif existing_statuses.get(course_id) == "مكتملة":
+                    message = f"الطالب أكمل هذه المادة ({course.Name}) مسبقاً ولا يمكن إعادة تسجيلها"
+                elif course.Status != 'متاح':
+                    message = "المادة غير متاحة حالياً"
+                elif course_id not in division_course_ids:
+                    message = "المادة غير متاحة لشعبة الطالب"
+                elif course_id in missing_prerequisites:
+                    message = f"يجب إكمال المواد التالية أولاً: {', '.join(missing_prerequisites[course_id])}"
+                elif course.MaxSeats and (course.CurrentEnrolledStudents or 0) >= course.MaxSeats:
+                    message = f"المادة مكتملة العدد ({course.CurrentEnrolledStudents}/{course.MaxSeats})"
+                
+                results.append({
+                    "course_id": course_id,
+                    "course_name": course.Name if course else None,
+                    "success": message is None,
+                    "message": message or "المادة متاحة للتسجيل"
+                })
+            
+            if not all(result["success"] for result in results):
+                return {
+                    "success": False,
+                    "message": "لم يتم تسجيل أي مادة لعدم استيفاء بعض المواد لشروط التسجيل",
+                    "data": {"results": results}
+                }
+            
+            average_gpa = CourseEnrollmentService._calculate_average_gpa(student)
+            max_credits = 18 if average_gpa and average_gpa >= 2.0 else 10
+            basket_credits = sum(courses[course_id].Credits or 0 for course_id in course_ids)
+            
+            if current_credits + basket_credits > max_credits:
+                # المواد التي تتجاوز الحد بترتيب الطلب
+                running_credits = current_credits
+                for result in results:
+                    running_credits += courses[result["course_id"]].Credits or 0
+                    if running_credits > max_credits:
+                        result["success"] = False
+                        result["message"] = f"تتجاوز المادة الحد الأقصى للساعات المسموحة ({max_credits} ساعة)"
+                
+                return {
+                    "success": False,
+                    "message": f"تجاوز الحد الأقصى للساعات المسموحة. الحد الأقصى: {max_credits} ساعة، المسجل حالياً: {current_credits} ساعة، المطلوب إضافته: {basket_credits} ساعة",
+                    "data": {"results": results}
+                }
+            
+            new_enrollments = []
+            for course_id in course_ids:
+                if not CourseEnrollmentService._reserve_seat(course_id):
+                    db.session.rollback()
+                    course = courses[course_id]
+                    message = f"المادة {course.Name} مكتملة العدد ({course.MaxSeats}/{course.MaxSeats})"
+                    for result in results:
+                        if result["course_id"] == course_id:
+                            result["success"] = False
+                            result["message"] = message
+                    return {
+                        "success": False,
+                        "message": f"{message} - لم يتم تسجيل أي مادة",
+                        "data": {"results": results}
+                    }
+                
+                new_enrollment = Enrollments(
+                    StudentId=student_id,
+                    CourseId=course_id,
+                    Semester=current_semester,
+                    NumberOFSemster=student.Semester,
+                    AddedEnrollmentDate=datetime.now().date(),
+                    IsCompleted="قيد الدراسة",
+                    Exam1Grade=None,
+                    Exam2Grade=None,
+                    Grade=None
+                )
+                db.session.add(new_enrollment)
+                new_enrollments.append(new_enrollment)
+            
+            db.session.commit()
+            GraduationReportCache.invalidate(student_id)
+            PlanningDataCache.invalidate_student(student_id)
+            
+            return {
+                "success": True,
+                "message": f"تم تسجيل الطالب في {len(new_enrollments)} مادة بنجاح",
+                "data": {
+                    "semester": current_semester,
+                    "total_credits": current_credits + basket_credits,
+                    "max_allowed_credits": max_credits,
+                    "enrollments": [
+                        {
+                            "enrollment_id": enrollment.Id,
+                            "course_name": courses[enrollment.CourseId].Name,
+                            "course_code": courses[enrollment.CourseId].Code,
+                            "credits": courses[enrollment.CourseId].Credits,
+                            "enrollment_date": enrollment.AddedEnrollmentDate.isoformat()
+                        }
+                        for enrollment in new_enrollments
+                    ],
+                    "results": results
+                }
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error in enroll_student_in_courses: {str(e)}")
+            return {
+                "success": False,
+                "message": f"حدث خطأ أثناء التسجيل: {str(e)}"
+            }
+    
     @staticmethod
     def cancel_enrollment(enrollment_id):
        
@@ -2163,7 +2963,12 @@ class CourseEnrollmentService:
             enrollment.DeletedEnrollmentDate = datetime.now().date()
             enrollment.IsCompleted = "ملغاة"
             
+            if enrollment.Semester == CourseEnrollmentService._get_current_semester():
+                CourseEnrollmentService._release_seat(enrollment.CourseId)
+            
             db.session.commit()
+            GraduationReportCache.invalidate(enrollment.StudentId)
+            PlanningDataCache.invalidate_student(enrollment.StudentId)
             
             return {
                 "success": True,
@@ -2197,9 +3002,16 @@ class CourseEnrollmentService:
             course = Courses.query.get(enrollment.CourseId)
             course_name = course.Name if course else "غير محدد"
             course_code = course.Code if course else "غير محدد"
+            student_id = enrollment.StudentId
+            
+            if (enrollment.IsCompleted == "قيد الدراسة" and
+                    enrollment.Semester == CourseEnrollmentService._get_current_semester()):
+                CourseEnrollmentService._release_seat(enrollment.CourseId)
             
             db.session.delete(enrollment)
             db.session.commit()
+            GraduationReportCache.invalidate(student_id)
+            PlanningDataCache.invalidate_student(student_id)
             
             return {
                 "success": True,
@@ -2315,11 +3127,8 @@ class CourseEnrollmentService:
     @staticmethod
     def _check_enrollment_period():
         try:
-            current_date = datetime.now()
-            current_period = EnrollmentPeriods.query.filter(
-                EnrollmentPeriods.StartDate <= current_date,
-                EnrollmentPeriods.EndDate >= current_date
-            ).first()
+            period_status = EnrollmentPeriodCache.get_status()
+            current_period = period_status["active"]
             
             if current_period:
                 return {
@@ -2328,9 +3137,7 @@ class CourseEnrollmentService:
                     "period": current_period
                 }
             else:
-                future_period = EnrollmentPeriods.query.filter(
-                    EnrollmentPeriods.StartDate > current_date
-                ).order_by(EnrollmentPeriods.StartDate).first()
+                future_period = period_status["next"]
                 
                 if future_period:
                     return {
@@ -2451,13 +3258,8 @@ class CourseEnrollmentService:
                 }
             
             if hasattr(course, 'MaxSeats') and course.MaxSeats:
-                current_semester = CourseEnrollmentService._get_current_semester()
-                
-                current_enrolled_count = Enrollments.query.filter_by(
-                    CourseId=course_id,
-                    Semester=current_semester,
-                    IsCompleted="قيد الدراسة"
-                ).count()
+                # فحص سريع من العداد، والحجز الفعلي يتم بالتحديث الشرطي عند التسجيل
+                current_enrolled_count = course.CurrentEnrolledStudents or 0
                 
                 if current_enrolled_count >= course.MaxSeats:
                     return {
@@ -2477,6 +3279,71 @@ class CourseEnrollmentService:
                 "message": f"حدث خطأ أثناء التحقق من توفر المادة: {str(e)}"
             }
     
+    @staticmethod
+    def _reserve_seat(course_id):
+        """حجز مقعد في المادة بتحديث شرطي واحد - يرجع False إذا اكتمل العدد"""
+        reserved = db.session.query(Courses).filter(
+            Courses.Id == course_id,
+            or_(
+                Courses.MaxSeats.is_(None),
+                Courses.MaxSeats <= 0,
+                func.coalesce(Courses.CurrentEnrolledStudents, 0) < Courses.MaxSeats
+            )
+        ).update(
+            {Courses.CurrentEnrolledStudents: func.coalesce(Courses.CurrentEnrolledStudents, 0) + 1},
+            synchronize_session=False
+        )
+        return reserved == 1
+
+    @staticmethod
+    def _release_seat(course_id):
+        """تحرير مقعد في المادة عند إلغاء أو حذف التسجيل"""
+        db.session.query(Courses).filter(
+            Courses.Id == course_id,
+            Courses.CurrentEnrolledStudents > 0
+        ).update(
+            {Courses.CurrentEnrolledStudents: Courses.CurrentEnrolledStudents - 1},
+            synchronize_session=False
+        )
+
+    @staticmethod
+    def sync_course_seat_counters():
+        """إعادة حساب عدادات المقاعد من تسجيلات الترم الحالي"""
+        try:
+            current_semester = CourseEnrollmentService._get_current_semester()
+            
+            # العد والكتابة في جملة UPDATE واحدة حتى لا يضيع حجز أو إلغاء يتم أثناء المزامنة
+            actual_count = db.session.query(func.count(Enrollments.Id)).filter(
+                Enrollments.CourseId == Courses.Id,
+                Enrollments.Semester == current_semester,
+                Enrollments.IsCompleted == "قيد الدراسة"
+            ).scalar_subquery()
+            
+            updated = db.session.query(Courses).filter(
+                or_(
+                    Courses.CurrentEnrolledStudents.is_(None),
+                    Courses.CurrentEnrolledStudents != actual_count
+                )
+            ).update(
+                {Courses.CurrentEnrolledStudents: actual_count},
+                synchronize_session=False
+            )
+            
+            db.session.commit()
+            return {
+                "success": True,
+                "message": f"تم تحديث عدادات المقاعد لعدد {updated} مادة",
+                "data": {"updated_courses": updated, "semester": current_semester}
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error in sync_course_seat_counters: {str(e)}")
+            return {
+                "success": False,
+                "message": f"حدث خطأ أثناء تحديث عدادات المقاعد: {str(e)}"
+            }
+
     @staticmethod
     def _check_course_division_availability(division_id, course_id):
         try:
@@ -2561,6 +3428,123 @@ class CourseEnrollmentService:
     
 
 
+class WarningSummaryService:
+    """ملخص مجمع لعدد الإنذارات حسب الحالة والنوع والمستوى يُحدّث مع كل تغيير في الإنذارات"""
+
+    @staticmethod
+    def apply_transitions(transitions):
+        """تحديث الملخص داخل نفس المعاملة - كل انتقال (المفتاح القديم، المفتاح الجديد) والمفتاح (الحالة، النوع، المستوى)"""
+        deltas = Counter()
+        for old_key, new_key in transitions:
+            if old_key == new_key:
+                continue
+            if old_key is not None:
+                deltas[old_key] -= 1
+            if new_key is not None:
+                deltas[new_key] += 1
+        
+        for (status, warning_type, warning_level), delta in deltas.items():
+            if delta:
+                WarningSummaryService._upsert_delta(status, warning_type, warning_level, delta)
+
+    @staticmethod
+    def _upsert_delta(status, warning_type, warning_level, delta):
+        """إضافة الفرق إلى عداد المفتاح أو إنشاؤه في جملة واحدة حتى لا تتسابق معاملتان على إنشاء نفس المفتاح"""
+        params = {'status': status, 'warning_type': warning_type, 'warning_level': warning_level, 'delta': delta}
+        
+        if db.engine.dialect.name == 'mssql':
+            db.session.execute(text(
+                "MERGE WarningSummary WITH (HOLDLOCK) AS target "
+                "USING (SELECT :status AS Status, :warning_type AS WarningType, :warning_level AS WarningLevel) AS source "
+                "ON target.Status = source.Status AND target.WarningType = source.WarningType "
+                "AND target.WarningLevel = source.WarningLevel "
+                "WHEN MATCHED THEN UPDATE SET [Count] = target.[Count] + :delta "
+                "WHEN NOT MATCHED THEN INSERT (Status, WarningType, WarningLevel, [Count]) "
+                "VALUES (:status, :warning_type, :warning_level, :delta);"
+            ), params)
+            return
+        
+        statement = postgresql_insert(WarningSummary).values(
+            Status=status, WarningType=warning_type, WarningLevel=warning_level, Count=delta
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[WarningSummary.Status, WarningSummary.WarningType, WarningSummary.WarningLevel],
+            set_={'Count': WarningSummary.Count + statement.excluded.Count}
+        ))
+
+    @staticmethod
+    def rebuild():
+        """إعادة بناء الملخص بالكامل من جدول الإنذارات"""
+        try:
+            rows = db.session.query(
+                AcademicWarnings.Status,
+                AcademicWarnings.WarningType,
+                AcademicWarnings.WarningLevel,
+                func.count(AcademicWarnings.Id)
+            ).group_by(
+                AcademicWarnings.Status, AcademicWarnings.WarningType, AcademicWarnings.WarningLevel
+            ).all()
+            
+            WarningSummary.query.delete(synchronize_session=False)
+            db.session.bulk_insert_mappings(WarningSummary, [
+                {'Status': status, 'WarningType': warning_type, 'WarningLevel': warning_level, 'Count': count}
+                for status, warning_type, warning_level, count in rows
+            ])
+            db.session.commit()
+            
+            return {
+                "success": True,
+                "message": f"تم إعادة بناء ملخص الإنذارات ({len(rows)} مجموعة)"
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error rebuilding warning summary: {str(e)}")
+            return {
+                "success": False,
+                "message": f"حدث خطأ أثناء إعادة بناء ملخص الإنذارات: {str(e)}"
+            }
+
+    @classmethod
+    def get_summary(cls):
+        """إحصائيات الإنذارات من الملخص المجمع بدون المرور على جدول الإنذارات - قراءة فقط
+        
+        الملخص يُبنى عند تشغيل التطبيق ويُصحح يومياً من المهمة المجدولة
+        """
+        rows = WarningSummary.query.all()
+        
+        totals_by_status = Counter()
+        active_by_type = Counter()
+        active_by_level = Counter()
+        for row in rows:
+            totals_by_status[row.Status] += row.Count
+            if row.Status == 'نشط':
+                active_by_type[row.WarningType] += row.Count
+                active_by_level[row.WarningLevel] += row.Count
+        
+        return {
+            'total_active': totals_by_status['نشط'],
+            'total_resolved': totals_by_status['محلول'],
+            'by_type': [(warning_type, count) for warning_type, count in active_by_type.items() if count],
+            'by_level': [(warning_level, count) for warning_level, count in sorted(active_by_level.items()) if count]
+        }
+
+
+_warning_worker_app = None
+
+
+def _init_warning_worker():
+    """تهيئة عملية عامل لفحص الإنذارات بتطبيق ومحرك قاعدة بيانات خاصين بها"""
+    global _warning_worker_app
+    from app import create_app
+    _warning_worker_app = create_app()
+
+
+def _run_warning_chunk_in_worker(semester, job_key, chunk_start, chunk_end, only_changed):
+    with _warning_worker_app.app_context():
+        return AcademicWarningService()._run_warning_chunk(semester, job_key, chunk_start, chunk_end, only_changed)
+
+
 class AcademicWarningService:
     
     WARNING_TYPES = {
@@ -2579,6 +3563,13 @@ class AcademicWarningService:
         4: 'إنذار نهائي'
     }
 
+    # حجم دفعة الطلاب في الفحص الشامل (أقل من حد معاملات SQL Server)
+    BATCH_SIZE = 1000
+    JOB_WORKERS = max(1, min(4, os.cpu_count() or 1))
+    CHECKPOINT_RETENTION_DAYS = 30
+    # طول عمود AcademicWarnings.Notes
+    NOTES_MAX_LENGTH = 255
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
 
@@ -2604,21 +3595,24 @@ class AcademicWarningService:
     def check_all_students_warnings(self, semester):
         """فحص جميع الطلاب وإصدار الإنذارات المطلوبة وحل الإنذارات المحسنة"""
         try:
-            students = Students.query.filter_by(status='نشط').all()
             warnings_issued = 0
             warnings_resolved = 0
-            
-            for student in students:
-                # فحص وحل الإنذارات المحسنة أولاً
-                resolved_count = self.check_and_resolve_warnings(student.Id)
-                warnings_resolved += resolved_count
+            last_student_id = 0
+            
+            # تحميل الطلاب على دفعات حسب المعرف لتقليل الذاكرة وحجم استعلامات IN
+            while True:
+                students = Students.query.filter(
+                    Students.status == 'نشط',
+                    Students.Id > last_student_id
+                ).order_by(Students.Id).limit(self.BATCH_SIZE).all()
                 
-                # ثم فحص الإنذارات الجديدة
-                warnings = self._evaluate_student_warnings(student, semester)
-                for warning in warnings:
-                    if self._should_issue_warning(student, warning):
-                        self._create_warning(student, warning, semester)
-                        warnings_issued += 1
+                if not students:
+                    break
+                
+                result = self.check_students_warnings_batch(students, semester)
+                warnings_issued += result['warnings_issued']
+                warnings_resolved += result['warnings_resolved']
+                last_student_id = students[-1].Id
             
             self.logger.info(f"تم إصدار {warnings_issued} إنذار أكاديمي وحل {warnings_resolved} إنذار")
             return {
@@ -2628,15 +3622,479 @@ class AcademicWarningService:
             }
             
         except Exception as e:
-            self.logger.error(f"خطأ في فحص الإنذارات: {str(e)}")
-            return {
-                'warnings_issued': 0,
-                'warnings_resolved': 0,
-                'total_processed': 0,
-                'error': str(e)
-            }
+            self.logger.error(f"خطأ في فحص الإنذارات: {str(e)}")
+            return {
+                'warnings_issued': 0,
+                'warnings_resolved': 0,
+                'total_processed': 0,
+                'error': str(e)
+            }
+
+    def run_chunked_warning_check(self, semester, job_key, chunk_size=None, max_workers=None, only_changed=False):
+        """فحص الإنذارات على نطاقات معرفات متوازية في عمليات منفصلة - لكل نطاق جلسة وcommit ونقطة استئناف خاصة به
+        
+        only_changed: تقييم الطلاب الذين تغيرت بياناتهم منذ آخر تقييم فقط
+        """
+        chunk_size = chunk_size or self.BATCH_SIZE
+        max_workers = max_workers or self.JOB_WORKERS
+        
+        try:
+            self._purge_old_checkpoints()
+            
+            min_id, max_id = db.session.query(func.min(Students.Id), func.max(Students.Id)).filter(
+                Students.status == 'نشط'
+            ).one()
+            
+            if min_id is None:
+                return {'chunks_total': 0, 'chunks_skipped': 0, 'chunks_failed': 0,
+                        'warnings_issued': 0, 'warnings_resolved': 0}
+            
+            # النطاقات ثابتة الحدود حتى تطابق نقاط الاستئناف عند إعادة التشغيل
+            chunk_starts = list(range((min_id // chunk_size) * chunk_size, max_id + 1, chunk_size))
+            completed_starts = {
+                row.ChunkStart for row in db.session.query(WarningJobCheckpoints.ChunkStart).filter(
+                    WarningJobCheckpoints.JobKey == job_key
+                ).all()
+            }
+            pending_starts = [start for start in chunk_starts if start not in completed_starts]
+            db.session.remove()
+            
+            summary = {
+                'chunks_total': len(chunk_starts),
+                'chunks_skipped': len(chunk_starts) - len(pending_starts),
+                'chunks_failed': 0,
+                'students_evaluated': 0,
+                'warnings_issued': 0,
+                'warnings_resolved': 0
+            }
+            
+            # عمليات منفصلة (spawn) لتجاوز GIL وعامل eventlet الوحيد - كل عملية تبني تطبيقها ومحركها
+            if pending_starts:
+                with ProcessPoolExecutor(
+                    max_workers=min(max_workers, len(pending_starts)),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_warning_worker
+                ) as executor:
+                    futures = {
+                        executor.submit(
+                            _run_warning_chunk_in_worker, semester, job_key, start, start + chunk_size, only_changed
+                        ): start
+                        for start in pending_starts
+                    }
+                    for future in as_completed(futures):
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = {'error': str(e)}
+                            self.logger.error(f"خطأ في عامل نطاق الإنذارات {futures[future]}: {str(e)}")
+                        
+                        if 'error' in result:
+                            summary['chunks_failed'] += 1
+                        else:
+                            summary['students_evaluated'] += result['students_evaluated']
+                            summary['warnings_issued'] += result['warnings_issued']
+                            summary['warnings_resolved'] += result['warnings_resolved']
+            
+            self.logger.info(
+                f"مهمة الإنذارات {job_key}: {summary['chunks_total']} نطاق "
+                f"(تم تخطي {summary['chunks_skipped']}, فشل {summary['chunks_failed']}) - "
+                f"تم تقييم {summary['students_evaluated']} طالب - تم إصدار {summary['warnings_issued']} إنذار وحل {summary['warnings_resolved']} إنذار"
+            )
+            return summary
+            
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"خطأ في مهمة الإنذارات المجزأة: {str(e)}")
+            return {'chunks_total': 0, 'chunks_skipped': 0, 'chunks_failed': 0,
+                    'warnings_issued': 0, 'warnings_resolved': 0, 'error': str(e)}
+
+    def _run_warning_chunk(self, semester, job_key, chunk_start, chunk_end, only_changed=False):
+        """معالجة نطاق معرفات واحد بجلسة ومعاملة مستقلتين"""
+        try:
+            students = Students.query.filter(
+                Students.status == 'نشط',
+                Students.Id >= chunk_start,
+                Students.Id < chunk_end
+            ).order_by(Students.Id).all()
+            
+            fingerprints = self._compute_student_fingerprints(students)
+            stored_fingerprints = {
+                row.StudentId: row for row in StudentWarningFingerprints.query.filter(
+                    StudentWarningFingerprints.StudentId.in_(list(fingerprints))
+                ).all()
+            } if fingerprints else {}
+            
+            if only_changed:
+                students = [
+                    student for student in students
+                    if student.Id not in stored_fingerprints
+                    or stored_fingerprints[student.Id].Fingerprint != fingerprints[student.Id]
+                ]
+            
+            plan = self._plan_warning_changes(students, semester)
+            
+            # نقطة الاستئناف وبصمات الطلاب تُكتب في نفس commit نتائج النطاق
+            now = datetime.now()
+            extra_rows = [WarningJobCheckpoints(
+                JobKey=job_key,
+                ChunkStart=chunk_start,
+                ChunkEnd=chunk_end,
+                StudentsProcessed=len(students),
+                WarningsIssued=len(plan['new_warnings']),
+                WarningsResolved=len(plan['resolved']),
+                CompletedAt=now
+            )]
+            for student in students:
+                stored = stored_fingerprints.get(student.Id)
+                if stored is None:
+                    extra_rows.append(StudentWarningFingerprints(
+                        StudentId=student.Id, Fingerprint=fingerprints[student.Id], EvaluatedAt=now
+                    ))
+                else:
+                    stored.Fingerprint = fingerprints[student.Id]
+                    stored.EvaluatedAt = now
+            
+            self._apply_warning_plan(plan, extra_rows=extra_rows)
+            
+            return {
+                'students_evaluated': len(students),
+                'warnings_issued': len(plan['new_warnings']),
+                'warnings_resolved': len(plan['resolved'])
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"خطأ في نطاق الإنذارات {chunk_start}-{chunk_end}: {str(e)}")
+            return {'error': str(e)}
+        finally:
+            db.session.remove()
+
+    def _compute_student_fingerprints(self, students):
+        """بصمة لكل طالب من كل البيانات التي تعتمد عليها قواعد الإنذارات"""
+        if not students:
+            return {}
+        
+        total_grade = (
+            func.coalesce(Enrollments.Exam1Grade, 0) +
+            func.coalesce(Enrollments.Exam2Grade, 0) +
+            func.coalesce(Enrollments.Grade, 0)
+        )
+        enrollment_rows = db.session.query(
+            Enrollments.StudentId,
+            Enrollments.IsCompleted,
+            func.count(Enrollments.Id),
+            func.sum(Enrollments.NumberOFSemster),
+            func.sum(Enrollments.CourseId),
+            func.sum(total_grade)
+        ).filter(
+            Enrollments.StudentId.in_([student.Id for student in students]),
+            Enrollments.IsCompleted.in_(['راسب', 'ناجح'])
+        ).group_by(Enrollments.StudentId, Enrollments.IsCompleted).all()
+        
+        enrollment_aggregates = {}
+        for student_id, status, count, semester_sum, course_sum, grade_sum in enrollment_rows:
+            enrollment_aggregates.setdefault(student_id, []).append(
+                (status, count, semester_sum, course_sum, float(grade_sum or 0))
+            )
+        
+        fingerprints = {}
+        for student in students:
+            state = (
+                student.Semester, student.StudentLevel, student.CreditsCompleted,
+                student.GPA1, student.GPA2, student.GPA3, student.GPA4,
+                student.GPA5, student.GPA6, student.GPA7, student.GPA8,
+                sorted(enrollment_aggregates.get(student.Id, []))
+            )
+            fingerprints[student.Id] = hashlib.sha1(repr(state).encode('utf-8')).hexdigest()
+        return fingerprints
+
+    def _purge_old_checkpoints(self):
+        cutoff = datetime.now() - timedelta(days=self.CHECKPOINT_RETENTION_DAYS)
+        WarningJobCheckpoints.query.filter(
+            WarningJobCheckpoints.CompletedAt < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def check_students_warnings_batch(self, students, semester):
+        """تقييم دفعة طلاب في الذاكرة وكتابة التغييرات بإدخال وتحديث مجمع ثم commit واحد"""
+        try:
+            plan = self._plan_warning_changes(students, semester)
+            self._apply_warning_plan(plan)
+            
+            return {
+                'warnings_issued': len(plan['new_warnings']),
+                'warnings_resolved': len(plan['resolved'])
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"خطأ في فحص دفعة الإنذارات: {str(e)}")
+            return {
+                'warnings_issued': 0,
+                'warnings_resolved': 0,
+                'error': str(e)
+            }
+
+    def _plan_warning_changes(self, students, semester):
+        """حساب الإنذارات الجديدة والمحلولة والمستبدلة لدفعة طلاب بدون أي كتابة"""
+        student_ids = [student.Id for student in students]
+        failed_courses_map = self._load_failed_courses(student_ids)
+        active_warnings_map = self._load_active_warnings(student_ids)
+        
+        now = datetime.now()
+        # changes: ملخص الفرق لكل طالب (للمحاكاة والتقارير)
+        plan = {'resolved': [], 'superseded': [], 'new_warnings': [], 'changes': {}}
+        
+        for student in students:
+            student_changes = {'issued': [], 'escalated': [], 'resolved': []}
+
+            evaluated = self._evaluate_student_warnings(
+                student, semester, failed_courses=failed_courses_map.get(student.Id, [])
+            )
+            evaluated_by_type = {warning['type']: warning for warning in evaluated}
+            
+            # حل الإنذارات التي تحسن وضعها أولاً
+            remaining_warnings = []
+            for active_warning in active_warnings_map.get(student.Id, []):
+                resolution_reason = self._get_resolution_reason(student, active_warning, evaluated_by_type)
+                if resolution_reason:
+                    plan['resolved'].append({
+                        'Id': active_warning.Id,
+                        'StudentId': student.Id,
+                        'WarningType': active_warning.WarningType,
+                        'WarningLevel': active_warning.WarningLevel,
+                        'Status': 'محلول',
+                        'ResolvedDate': now,
+                        'Notes': self._truncate_notes(f"{active_warning.Notes} | تم الحل تلقائياً: {resolution_reason}")
+                    })
+                    student_changes['resolved'].append({
+                        'warning_id': active_warning.Id,
+                        'type': active_warning.WarningType,
+                        'level': active_warning.WarningLevel,
+                        'reason': resolution_reason
+                    })
+                else:
+                    remaining_warnings.append(active_warning)
+            
+            # ثم إصدار الإنذارات الجديدة أو الأشد
+            for warning in evaluated:
+                same_type = [w for w in remaining_warnings if w.WarningType == warning['type']]
+                if same_type and warning['level'] <= max(w.WarningLevel for w in same_type):
+                    continue
+                
+                for existing in same_type:
+                    plan['superseded'].append({
+                        'Id': existing.Id,
+                        'StudentId': student.Id,
+                        'WarningType': existing.WarningType,
+                        'WarningLevel': existing.WarningLevel,
+                        'Status': 'Superseded',
+                        'ResolvedDate': now
+                    })
+                
+                if same_type:
+                    student_changes['escalated'].append({
+                        'type': warning['type'],
+                        'from_level': max(w.WarningLevel for w in same_type),
+                        'to_level': warning['level'],
+                        'description': warning['description']
+                    })
+                else:
+                    student_changes['issued'].append({
+                        'type': warning['type'],
+                        'level': warning['level'],
+                        'description': warning['description']
+                    })
+                
+                plan['new_warnings'].append({
+                    'StudentId': student.Id,
+                    'WarningType': warning['type'],
+                    'WarningLevel': warning['level'],
+                    'Description': warning['description'],
+                    'Semester': semester,
+                    'IssueDate': now,
+                    'Status': 'نشط',
+                    'ActionRequired': warning['action_required'],
+                    'Notes': self._build_warning_notes(warning)
+                })
+            
+            if any(student_changes.values()):
+                plan['changes'][student.Id] = student_changes
+        
+        return plan
+
+    def simulate_warning_check(self, semester):
+        """محاكاة الفحص الشامل للقراءة فقط: يُرجع فرق كل طالب تتغير إنذاراته ثم سطر الملخص بدون أي كتابة"""
+        summary = {
+            'students_evaluated': 0,
+            'students_affected': 0,
+            'warnings_issued': 0,
+            'warnings_escalated': 0,
+            'warnings_resolved': 0,
+            'by_type': {}
+        }
+        
+        try:
+            self._begin_snapshot_read()
+            last_student_id = 0
+            
+            while True:
+                students = Students.query.filter(
+                    Students.status == 'نشط',
+                    Students.Id > last_student_id
+                ).order_by(Students.Id).limit(self.BATCH_SIZE).all()
+                
+                if not students:
+                    break
+                
+                plan = self._plan_warning_changes(students, semester)
+                summary['students_evaluated'] += len(students)
+                
+                for student in students:
+                    changes = plan['changes'].get(student.Id)
+                    if not changes:
+                        continue
+                    
+                    summary['students_affected'] += 1
+                    for action in ('issued', 'escalated', 'resolved'):
+                        summary[f'warnings_{action}'] += len(changes[action])
+                        for change in changes[action]:
+                            type_counts = summary['by_type'].setdefault(
+                                change['type'], {'issued': 0, 'escalated': 0, 'resolved': 0}
+                            )
+                            type_counts[action] += 1
+                    
+                    yield {
+                        'student_id': student.Id,
+                        'student_name': student.Name,
+                        'semester': student.Semester,
+                        **changes
+                    }
+                
+                last_student_id = students[-1].Id
+                # القراءة فقط: لا داعي للاحتفاظ بالكائنات بين الدفعات
+                db.session.expunge_all()
+            
+            yield {'summary': summary}
+            
+        finally:
+            db.session.rollback()
+
+    def _begin_snapshot_read(self):
+        """بدء معاملة قراءة بلقطة ثابتة حتى لا تحجب المحاكاة الكتابات أثناء ساعات العمل"""
+        db.session.rollback()
+        isolation_level = 'SNAPSHOT' if db.engine.dialect.name == 'mssql' else 'REPEATABLE READ'
+        
+        try:
+            db.session.connection(execution_options={'isolation_level': isolation_level})
+            db.session.query(Students.Id).limit(1).all()
+        except Exception as e:
+            # قاعدة البيانات لا تدعم اللقطات (مثل SNAPSHOT غير مفعلة): القراءة بالمستوى الافتراضي
+            db.session.rollback()
+            self.logger.warning(f"تعذر بدء معاملة لقطة للمحاكاة: {str(e)}")
+
+    def _apply_warning_plan(self, plan, extra_rows=None):
+        """كتابة خطة الإنذارات بعمليات مجمعة"""
+        updates = [
+            {key: row[key] for key in ('Id', 'Status', 'ResolvedDate', 'Notes') if key in row}
+            for row in plan['resolved'] + plan['superseded']
+        ]
+        if updates:
+            db.session.bulk_update_mappings(AcademicWarnings, updates)
+        if plan['new_warnings']:
+            db.session.bulk_insert_mappings(AcademicWarnings, plan['new_warnings'])
+        if extra_rows:
+            db.session.add_all(extra_rows)
+        
+        WarningSummaryService.apply_transitions(
+            [
+                (('نشط', row['WarningType'], row['WarningLevel']), (row['Status'], row['WarningType'], row['WarningLevel']))
+                for row in plan['resolved'] + plan['superseded']
+            ] + [
+                (None, ('نشط', row['WarningType'], row['WarningLevel']))
+                for row in plan['new_warnings']
+            ]
+        )
+        
+        db.session.commit()
+        
+        affected_student_ids = {
+            row['StudentId'] for row in plan['resolved'] + plan['superseded'] + plan['new_warnings']
+        }
+        for student_id in affected_student_ids:
+            GraduationReportCache.invalidate(student_id)
+
+    def _load_failed_courses(self, student_ids):
+        """المواد الراسب فيها ولم ينجح فيها لاحقاً لمجموعة طلاب باستعلامين مجمعين"""
+        if not student_ids:
+            return {}
+        
+        failed_rows = db.session.query(
+            Enrollments.StudentId,
+            Enrollments.CourseId,
+            Enrollments.NumberOFSemster,
+            Enrollments.Semester,
+            Enrollments.Exam1Grade,
+            Enrollments.Exam2Grade,
+            Enrollments.Grade,
+            Courses.Name
+        ).outerjoin(
+            Courses, Enrollments.CourseId == Courses.Id
+        ).filter(
+            Enrollments.StudentId.in_(student_ids),
+            Enrollments.IsCompleted == 'راسب'
+        ).order_by(Enrollments.Id).all()
+        
+        if not failed_rows:
+            return {}
+        
+        # آخر ترم نجح فيه الطالب في كل مادة
+        last_passed_semester = {
+            (student_id, course_id): last_semester
+            for student_id, course_id, last_semester in db.session.query(
+                Enrollments.StudentId,
+                Enrollments.CourseId,
+                func.max(Enrollments.NumberOFSemster)
+            ).filter(
+                Enrollments.StudentId.in_(student_ids),
+                Enrollments.IsCompleted == 'ناجح'
+            ).group_by(Enrollments.StudentId, Enrollments.CourseId).all()
+        }
+        
+        failed_courses = {}
+        for student_id, course_id, number_of_semester, semester, exam1, exam2, final, course_name in failed_rows:
+            passed_semester = last_passed_semester.get((student_id, course_id))
+            if passed_semester is not None and passed_semester > number_of_semester:
+                continue
+            
+            student_failed = failed_courses.setdefault(student_id, {})
+            if course_id not in student_failed:
+                student_failed[course_id] = {
+                    'course_name': course_name if course_name else f'مادة {course_id}',
+                    'semester': semester,
+                    # الدرجة الإجمالية من 150 (للعرض فقط)
+                    'total_grade': float(exam1 or 0) + float(exam2 or 0) + float(final or 0)
+                }
+        
+        return {
+            student_id: list(courses.values())
+            for student_id, courses in failed_courses.items()
+        }
+
+    def _load_active_warnings(self, student_ids):
+        """الإنذارات النشطة لمجموعة طلاب في استعلام واحد"""
+        if not student_ids:
+            return {}
+        
+        active_warnings = {}
+        for warning in AcademicWarnings.query.filter(
+            AcademicWarnings.StudentId.in_(student_ids),
+            AcademicWarnings.Status == 'نشط'
+        ).all():
+            active_warnings.setdefault(warning.StudentId, []).append(warning)
+        return active_warnings
 
-    def _evaluate_student_warnings(self, student, semester):
+    def _evaluate_student_warnings(self, student, semester, failed_courses=None):
         """تقييم الطالب وتحديد الإنذارات المطلوبة"""
         warnings = []
         
@@ -2646,7 +4104,7 @@ class AcademicWarningService:
             warnings.append(gpa_warning)
         
         # 2. فحص الرسوب في المواد
-        failing_warning = self._check_failing_courses(student, semester)
+        failing_warning = self._check_failing_courses(student, semester, failed_courses)
         if failing_warning:
             warnings.append(failing_warning)
         
@@ -2710,7 +4168,7 @@ class AcademicWarningService:
         
         return None
 
-    def _check_failing_courses(self, student, semester):
+    def _check_failing_courses(self, student, semester, failed_courses=None):
         """فحص الرسوب في المواد - جميع المواد الراسب فيها الطالب في كل الترمات"""
         current_semester = student.Semester
         
@@ -2718,43 +4176,9 @@ class AcademicWarningService:
         if current_semester == 1:
             return None
         
-        # حساب جميع المواد الراسب فيها الطالب في كل الترمات (اعتماداً على IsCompleted فقط)
-        failed_enrollments = Enrollments.query.filter(
-            and_(
-                Enrollments.StudentId == student.Id,
-                Enrollments.IsCompleted == 'راسب'
-            )
-        ).all()
-        
-        # حساب المواد الراسب فيها والتي لم يعيدها بنجاح
-        failed_courses = {}
-        for enrollment in failed_enrollments:
-            course_id = enrollment.CourseId
-            
-            # فحص إذا كان الطالب نجح في هذه المادة في ترم لاحق (اعتماداً على IsCompleted فقط)
-            passed_later = Enrollments.query.filter(
-                and_(
-                    Enrollments.StudentId == student.Id,
-                    Enrollments.CourseId == course_id,
-                    Enrollments.NumberOFSemster > enrollment.NumberOFSemster,
-                    Enrollments.IsCompleted == 'ناجح'
-                )
-            ).first()
-            
-            # إذا لم ينجح في المادة لاحقاً، تُحسب كمادة راسب فيها
-            if not passed_later:
-                # حساب الدرجة الإجمالية للعرض فقط (ليس للحسابات)
-                exam1_grade = float(enrollment.Exam1Grade) if enrollment.Exam1Grade else 0
-                exam2_grade = float(enrollment.Exam2Grade) if enrollment.Exam2Grade else 0
-                final_grade = float(enrollment.Grade) if enrollment.Grade else 0
-                total_grade = exam1_grade + exam2_grade + final_grade
-                
-                if course_id not in failed_courses:
-                    failed_courses[course_id] = {
-                        'course_name': enrollment.course.Name if enrollment.course else f'مادة {course_id}',
-                        'semester': enrollment.Semester,
-                        'total_grade': total_grade  # الدرجة الإجمالية من 150 (للعرض فقط)
-                    }
+        # المواد الراسب فيها والتي لم يعيدها بنجاح (اعتماداً على IsCompleted فقط)
+        if failed_courses is None:
+            failed_courses = self._load_failed_courses([student.Id]).get(student.Id, [])
         
         failed_count = len(failed_courses)
         
@@ -2770,7 +4194,7 @@ class AcademicWarningService:
                     'level': 2,
                     'description': f'رسوب في {failed_count} مواد في بداية الدراسة',
                     'action_required': 'مراجعة مع المرشد الأكاديمي لتحسين الأداء',
-                    'failed_courses': list(failed_courses.values())
+                    'failed_courses': failed_courses
                 }
         
         # من الترم الثالث فما فوق: تطبيق القواعد العادية
@@ -2781,7 +4205,7 @@ class AcademicWarningService:
                     'level': 4,
                     'description': f'رسوب في {failed_count} مواد - خطر أكاديمي',
                     'action_required': 'مراجعة عاجلة مع عميد الكلية',
-                    'failed_courses': list(failed_courses.values())
+                    'failed_courses': failed_courses
                 }
             elif failed_count >= 3:
                 return {
@@ -2789,7 +4213,7 @@ class AcademicWarningService:
                     'level': 3,
                     'description': f'رسوب في {failed_count} مواد',
                     'action_required': 'مراجعة عاجلة مع المرشد الأكاديمي',
-                    'failed_courses': list(failed_courses.values())
+                    'failed_courses': failed_courses
                 }
             elif failed_count >= 2:
                 return {
@@ -2797,7 +4221,7 @@ class AcademicWarningService:
                     'level': 2,
                     'description': f'رسوب في {failed_count} مواد',
                     'action_required': 'تحسين الأداء في المواد',
-                    'failed_courses': list(failed_courses.values())
+                    'failed_courses': failed_courses
                 }
             elif failed_count >= 1:
                 return {
@@ -2805,7 +4229,7 @@ class AcademicWarningService:
                     'level': 1,
                     'description': f'رسوب في مادة واحدة',
                     'action_required': 'متابعة الأداء',
-                    'failed_courses': list(failed_courses.values())
+                    'failed_courses': failed_courses
                 }
         
         return None
@@ -2978,9 +4402,9 @@ class AcademicWarningService:
                 and_(
                     AcademicWarnings.StudentId == student.Id,
                     AcademicWarnings.WarningType == warning['type'],
-                    AcademicWarnings.Status == 'Active'
+                    AcademicWarnings.Status == 'نشط'
                 )
-            ).first()
+            ).order_by(AcademicWarnings.WarningLevel.desc()).first()
             
             if existing_warning:
                 if warning['level'] > existing_warning.WarningLevel:
@@ -3005,21 +4429,16 @@ class AcademicWarningService:
                 )
             ).all()
             
+            transitions = []
             for existing in existing_warnings:
                 existing.Status = 'Superseded'
                 existing.ResolvedDate = datetime.now()
+                transitions.append((
+                    ('نشط', existing.WarningType, existing.WarningLevel),
+                    ('Superseded', existing.WarningType, existing.WarningLevel)
+                ))
             
-            notes = f"تم إصدار الإنذار تلقائياً بواسطة النظام"
-            if 'failed_courses' in warning and warning['failed_courses']:
-                failed_courses_info = []
-                for course in warning['failed_courses']:
-                    course_info = f"- {course['course_name']} (الترم: {course['semester']}"
-                    if course.get('total_grade') is not None:
-                        course_info += f", الدرجة الإجمالية: {course['total_grade']}/150"
-                    course_info += ")"
-                    failed_courses_info.append(course_info)
-                
-                notes += f"\n\nالمواد الراسب فيها:\n" + "\n".join(failed_courses_info)
+            notes = self._build_warning_notes(warning)
             
             new_warning = AcademicWarnings(
                 StudentId=student.Id,
@@ -3034,7 +4453,10 @@ class AcademicWarningService:
             )
             
             db.session.add(new_warning)
+            transitions.append((None, ('نشط', warning['type'], warning['level'])))
+            WarningSummaryService.apply_transitions(transitions)
             db.session.commit()
+            GraduationReportCache.invalidate(student.Id)
             
             self.logger.info(f"تم إصدار إنذار للطالب {student.Name}: {warning['description']}")
             
@@ -3042,14 +4464,40 @@ class AcademicWarningService:
             db.session.rollback()
             self.logger.error(f"خطأ في إنشاء الإنذار: {str(e)}")
 
+    def _build_warning_notes(self, warning):
+        notes = f"تم إصدار الإنذار تلقائياً بواسطة النظام"
+        if 'failed_courses' in warning and warning['failed_courses']:
+            failed_courses_info = []
+            for course in warning['failed_courses']:
+                course_info = f"- {course['course_name']} (الترم: {course['semester']}"
+                if course.get('total_grade') is not None:
+                    course_info += f", الدرجة الإجمالية: {course['total_grade']}/150"
+                course_info += ")"
+                failed_courses_info.append(course_info)
+            
+            notes += f"\n\nالمواد الراسب فيها:\n" + "\n".join(failed_courses_info)
+        return self._truncate_notes(notes)
+
+    @classmethod
+    def _truncate_notes(cls, notes):
+        """قص الملاحظات إلى طول العمود مع الإشارة للقص"""
+        if len(notes) <= cls.NOTES_MAX_LENGTH:
+            return notes
+        return notes[:cls.NOTES_MAX_LENGTH - 3] + '...'
+
     def resolve_warning(self, warning_id, notes=""):
         try:
             warning = AcademicWarnings.query.get(warning_id)
             if warning:
+                WarningSummaryService.apply_transitions([(
+                    (warning.Status, warning.WarningType, warning.WarningLevel),
+                    ('Resolved', warning.WarningType, warning.WarningLevel)
+                )])
                 warning.Status = 'Resolved'
                 warning.ResolvedDate = datetime.now()
-                warning.Notes += f" | تم الحل: {notes}"
+                warning.Notes = self._truncate_notes(f"{warning.Notes} | تم الحل: {notes}")
                 db.session.commit()
+                GraduationReportCache.invalidate(warning.StudentId)
                 return True
         except Exception as e:
             db.session.rollback()
@@ -3068,16 +4516,33 @@ class AcademicWarningService:
             self.logger.error(f"خطأ في جلب الإنذارات: {str(e)}")
             return []
 
-    def get_all_active_warnings(self):
-        try:
-            warnings = AcademicWarnings.query.filter_by(Status='نشط').order_by(
-                AcademicWarnings.WarningLevel.desc(),
-                AcademicWarnings.IssueDate.desc()
-            ).all()
-            return warnings
-        except Exception as e:
-            self.logger.error(f"خطأ في جلب الإنذارات النشطة: {str(e)}")
-            return []
+    def get_active_warnings_page(self, limit=100, cursor=None):
+        """صفحة من الإنذارات النشطة بترقيم المؤشر (المستوى، المعرف) مع تحميل الطالب مسبقاً"""
+        query = AcademicWarnings.query.options(
+            joinedload(AcademicWarnings.student)
+        ).filter(AcademicWarnings.Status == 'نشط')
+        
+        # المعرف التصاعدي يتبع ترتيب الإصدار ويبقى فريداً حتى لإنذارات الدفعة الواحدة
+        # (مقارنة التاريخ بدقة مختلفة عن العمود تُسقط الصفوف المتساوية بين الصفحات)
+        if cursor:
+            level, warning_id = cursor
+            query = query.filter(or_(
+                AcademicWarnings.WarningLevel < level,
+                and_(AcademicWarnings.WarningLevel == level, AcademicWarnings.Id < warning_id)
+            ))
+        
+        warnings = query.order_by(
+            AcademicWarnings.WarningLevel.desc(),
+            AcademicWarnings.Id.desc()
+        ).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(warnings) > limit:
+            warnings = warnings[:limit]
+            last = warnings[-1]
+            next_cursor = (last.WarningLevel, last.Id)
+        
+        return warnings, next_cursor
 
     def get_current_semester(self):
         from datetime import datetime
@@ -3089,6 +4554,34 @@ class AcademicWarningService:
         else:
             return f"صيف {now.year}"
 
+    def _get_resolution_reason(self, student, warning, evaluated_by_type):
+        """سبب حل الإنذار النشط بناءً على التقييم الحالي للطالب، أو None إذا لم يتحسن"""
+        if warning.WarningType == 'رسوب في المواد':
+            failing_warning = evaluated_by_type.get('رسوب في المواد')
+            
+            if not failing_warning:
+                return "تم النجاح في جميع المواد المطلوبة"
+            elif failing_warning['level'] < warning.WarningLevel - 1:
+                return f"تحسن الأداء - انخفض عدد المواد الراسب فيها"
+        
+        elif warning.WarningType == 'انخفاض المعدل التراكمي':
+            current_gpa = self._get_current_gpa(student)
+            if current_gpa and current_gpa >= 2.5:
+                return f"تحسن المعدل التراكمي إلى {current_gpa:.2f}"
+            elif current_gpa and current_gpa >= 2.0 and warning.WarningLevel >= 3:
+                return f"تحسن المعدل التراكمي إلى {current_gpa:.2f}"
+        
+        elif 'الساعات المعتمدة' in warning.WarningType:
+            credit_warning = next(
+                (w for w in evaluated_by_type.values() if 'الساعات المعتمدة' in w['type']), None
+            )
+            if not credit_warning:
+                return "تم استكمال الساعات المطلوبة"
+            elif credit_warning['level'] < warning.WarningLevel:
+                return "تحسن في عدد الساعات المكتملة"
+        
+        return None
+
     def check_and_resolve_warnings(self, student_id):
         try:
             student = Students.query.get(student_id)
@@ -3103,53 +4596,30 @@ class AcademicWarningService:
             ).all()
             
             resolved_count = 0
+            resolved_transitions = []
+            
+            # تقييم الطالب مرة واحدة لجميع الإنذارات النشطة
+            evaluated_by_type = {
+                w['type']: w for w in self._evaluate_student_warnings(student, self.get_current_semester())
+            } if active_warnings else {}
             
             for warning in active_warnings:
-                should_resolve = False
-                resolution_reason = ""
-                
-                if warning.WarningType == 'رسوب في المواد':
-                    current_warnings = self._evaluate_student_warnings(student, self.get_current_semester())
-                    failing_warning = None
-                    
-                    for w in current_warnings:
-                        if w['type'] == 'رسوب في المواد':
-                            failing_warning = w
-                            break
-                    
-                    if not failing_warning:
-                        should_resolve = True
-                        resolution_reason = "تم النجاح في جميع المواد المطلوبة"
-                    elif failing_warning['level'] < warning.WarningLevel - 1:
-                        should_resolve = True
-                        resolution_reason = f"تحسن الأداء - انخفض عدد المواد الراسب فيها"
+                resolution_reason = self._get_resolution_reason(student, warning, evaluated_by_type)
                 
-                elif warning.WarningType == 'انخفاض المعدل التراكمي':
-                    current_gpa = self._get_current_gpa(student)
-                    if current_gpa and current_gpa >= 2.5:
-                        should_resolve = True
-                        resolution_reason = f"تحسن المعدل التراكمي إلى {current_gpa:.2f}"
-                    elif current_gpa and current_gpa >= 2.0 and warning.WarningLevel >= 3:
-                        should_resolve = True
-                        resolution_reason = f"تحسن المعدل التراكمي إلى {current_gpa:.2f}"
-                
-                elif 'الساعات المعتمدة' in warning.WarningType:
-                    credit_warning = self._check_credit_progress(student)
-                    if not credit_warning:
-                        should_resolve = True
-                        resolution_reason = "تم استكمال الساعات المطلوبة"
-                    elif credit_warning['level'] < warning.WarningLevel:
-                        should_resolve = True
-                        resolution_reason = "تحسن في عدد الساعات المكتملة"
-                
-                if should_resolve:
+                if resolution_reason:
                     warning.Status = 'محلول'
                     warning.ResolvedDate = datetime.now()
-                    warning.Notes += f" | تم الحل تلقائياً: {resolution_reason}"
+                    warning.Notes = self._truncate_notes(f"{warning.Notes} | تم الحل تلقائياً: {resolution_reason}")
+                    resolved_transitions.append((
+                        ('نشط', warning.WarningType, warning.WarningLevel),
+                        ('محلول', warning.WarningType, warning.WarningLevel)
+                    ))
                     resolved_count += 1
             
             if resolved_count > 0:
+                WarningSummaryService.apply_transitions(resolved_transitions)
                 db.session.commit()
+                GraduationReportCache.invalidate(student_id)
                 self.logger.info(f"تم حل {resolved_count} إنذار تلقائياً للطالب {student.Name}")
             
             return resolved_count
@@ -3163,27 +4633,193 @@ class AcademicWarningService:
 
 
 
+class CohortRankingIndex:
+    """فهرس ترتيب المعدلات لكل دفعة (الشعبة، الترم): مصفوفة معدلات مرتبة مع المجموع والعدد"""
+    
+    CHECK_SECONDS = 300
+    
+    _cohorts = None
+    _fingerprint = None
+    _checked_at = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _students_fingerprint():
+        """بصمة رخيصة تتغير عند تغير أي معدل أو ترم أو شعبة"""
+        gpa_sum = sum(
+            (func.coalesce(getattr(Students, f'GPA{i}'), 0) for i in range(2, 9)),
+            func.coalesce(Students.GPA1, 0)
+        )
+        # مجاميع بسيطة وأخرى موزونة بمعرف الطالب حتى لا يلغي تعديلان متعاكسان أثر بعضهما
+        # (BIGINT لتجنب تجاوز مجموع INT في SQL Server)
+        student_id = cast(Students.Id, BigInteger)
+        return tuple(db.session.query(
+            func.count(Students.Id),
+            func.sum(cast(Students.Semester, BigInteger)),
+            func.sum(cast(Students.DivisionId, BigInteger)),
+            func.sum(gpa_sum),
+            func.sum(student_id * func.coalesce(Students.Semester, 0)),
+            func.sum(student_id * func.coalesce(Students.DivisionId, 0)),
+            func.sum(student_id * gpa_sum)
+        ).one())
+
+    @classmethod
+    def _build(cls):
+        rows = db.session.query(
+            Students.Id, Students.DivisionId, Students.Semester,
+            Students.GPA1, Students.GPA2, Students.GPA3, Students.GPA4,
+            Students.GPA5, Students.GPA6, Students.GPA7, Students.GPA8
+        ).all()
+        
+        grouped = {}
+        for row in rows:
+            cohort = grouped.setdefault((row.DivisionId, row.Semester), {'member_gpas': {}, 'gpas': []})
+            gpa = AcademicStatusAnalysisService._get_current_gpa(row)
+            # المعدل المفهرس لكل عضو حتى يُحذف نفس الرقم من المصفوفة ولو تغير معدله بعد البناء
+            cohort['member_gpas'][row.Id] = gpa
+            # الطلاب بدون معدل لا يدخلون في الترتيب
+            if gpa > 0:
+                cohort['gpas'].append(gpa)
+        
+        for cohort in grouped.values():
+            cohort['gpas'].sort()
+            cohort['gpa_sum'] = sum(cohort['gpas'])
+        return grouped
+
+    @classmethod
+    def _get_cohorts(cls):
+        with cls._lock:
+            now_ts = time.time()
+            if cls._cohorts is not None and now_ts - cls._checked_at < cls.CHECK_SECONDS:
+                return cls._cohorts
+            
+            fingerprint = cls._students_fingerprint()
+            if cls._cohorts is None or fingerprint != cls._fingerprint:
+                cls._cohorts = cls._build()
+                cls._fingerprint = fingerprint
+            cls._checked_at = now_ts
+            return cls._cohorts
+
+    @classmethod
+    def get_peer_stats(cls, division_id, semester, student_id, student_gpa):
+        """ترتيب معدل الطالب الحالي بين زملائه (بدونه) وإحصائياتهم بالبحث الثنائي"""
+        cohort = cls._get_cohorts().get((division_id, semester), {'member_gpas': {}, 'gpas': [], 'gpa_sum': 0.0})
+        gpas = cohort['gpas']
+        member_gpas = cohort['member_gpas']
+        
+        peer_count = len(member_gpas) - (1 if student_id in member_gpas else 0)
+        
+        # إزالة معدل الطالب كما فُهرس (قد يختلف عن معدله الحالي حتى إعادة البناء)
+        indexed_gpa = member_gpas.get(student_id, 0)
+        own_included = indexed_gpa > 0
+        ranked_peer_count = len(gpas) - (1 if own_included else 0)
+        
+        if ranked_peer_count <= 0:
+            return {'peer_count': peer_count, 'ranked_peer_count': 0}
+        
+        peers_at_or_above = len(gpas) - bisect.bisect_left(gpas, student_gpa)
+        if own_included and indexed_gpa >= student_gpa:
+            peers_at_or_above -= 1
+        
+        if own_included:
+            lowest_gpa = gpas[1] if gpas[0] == indexed_gpa else gpas[0]
+            highest_gpa = gpas[-2] if gpas[-1] == indexed_gpa else gpas[-1]
+            gpa_sum = cohort['gpa_sum'] - indexed_gpa
+        else:
+            lowest_gpa, highest_gpa, gpa_sum = gpas[0], gpas[-1], cohort['gpa_sum']
+        
+        return {
+            'peer_count': peer_count,
+            'ranked_peer_count': ranked_peer_count,
+            # الزملاء المتساوون في المعدل يسبقون الطالب في الترتيب
+            'rank': peers_at_or_above + 1,
+            'average_gpa': gpa_sum / ranked_peer_count,
+            'highest_gpa': highest_gpa,
+            'lowest_gpa': lowest_gpa
+        }
+
+
+class StudentContext:
+    """بيانات طالب واحد تُحمّل مرة واحدة لكل طلب مع حفظ نتائج التحليلات الفرعية"""
+
+    def __init__(self, student_id):
+        self.student_id = student_id
+        self.student = Students.query.options(joinedload(Students.division)).filter_by(Id=student_id).first()
+        self._enrollments = None
+        self._warnings = None
+        self._attendance_counts = None
+        self._results = {}
+
+    @property
+    def enrollments(self):
+        if self._enrollments is None:
+            self._enrollments = Enrollments.query.options(joinedload(Enrollments.course)).filter_by(
+                StudentId=self.student_id
+            ).all()
+        return self._enrollments
+
+    @property
+    def warnings(self):
+        if self._warnings is None:
+            self._warnings = AcademicWarnings.query.filter_by(StudentId=self.student_id).all()
+        return self._warnings
+
+    @property
+    def attendance_counts(self):
+        """(إجمالي الجلسات، الجلسات المحضورة) في استعلام واحد"""
+        if self._attendance_counts is None:
+            total, attended = db.session.query(
+                func.count(Attendances.Id),
+                func.sum(db.case((Attendances.Status == True, 1), else_=0))
+            ).filter(Attendances.StudentId == self.student_id).one()
+            self._attendance_counts = (total or 0, int(attended or 0))
+        return self._attendance_counts
+
+    def memoize(self, key, compute):
+        if key not in self._results:
+            self._results[key] = compute()
+        return self._results[key]
+
+
+def student_analysis(key):
+    """تنفيذ التحليل مرة واحدة لكل سياق طالب - يُنشأ سياق جديد إذا لم يُمرر"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(student_id, context=None):
+            context = context or StudentContext(student_id)
+            return context.memoize(key, lambda: func(student_id, context))
+        return wrapper
+    return decorator
+
+
 class AcademicStatusAnalysisService:
     
     @staticmethod
     def get_comprehensive_analysis(student_id: int) -> Dict:
         try:
-            student = Students.query.get(student_id)
+            # سياق واحد يحمل بيانات الطالب مرة واحدة ويحفظ نتائج كل تحليل فرعي
+            context = StudentContext(student_id)
+            student = context.student
             if not student:
                 return {"error": "Student not found"}
             
             basic_info = AcademicStatusAnalysisService._get_student_basic_info(student)
-            gpa_trends = AcademicStatusAnalysisService._analyze_gpa_trends(student_id)
-            performance_patterns = AcademicStatusAnalysisService._analyze_performance_patterns(student_id)
-            risk_assessment = AcademicStatusAnalysisService._calculate_risk_assessment(student_id)
-            course_analysis = AcademicStatusAnalysisService._analyze_course_performance(student_id)
-            attendance_insights = AcademicStatusAnalysisService._analyze_attendance_patterns(student_id)
-            warnings_summary = AcademicStatusAnalysisService._get_warnings_summary(student_id)
-            peer_comparison = AcademicStatusAnalysisService._compare_with_peers(student_id)
-            predictions = AcademicStatusAnalysisService._get_merged_predictions(student_id)
-            interventions = AcademicStatusAnalysisService._predictive_intervention_system(student_id)
-            ai_insights = AcademicStatusAnalysisService._generate_ai_insights(student_id)
-            
+            gpa_trends = AcademicStatusAnalysisService._analyze_gpa_trends(student_id, context)
+            performance_patterns = AcademicStatusAnalysisService._analyze_performance_patterns(student_id, context)
+            risk_assessment = AcademicStatusAnalysisService._calculate_risk_assessment(student_id, context)
+            course_analysis = AcademicStatusAnalysisService._analyze_course_performance(student_id, context)
+            attendance_insights = AcademicStatusAnalysisService._analyze_attendance_patterns(student_id, context)
+            warnings_summary = AcademicStatusAnalysisService._get_warnings_summary(student_id, context)
+            peer_comparison = AcademicStatusAnalysisService._compare_with_peers(student_id, context)
+            predictions = AcademicStatusAnalysisService._get_merged_predictions(student_id, context)
+            interventions = AcademicStatusAnalysisService._predictive_intervention_system(student_id, context)
+            ai_insights = AcademicStatusAnalysisService._generate_ai_insights(student_id, context)
+            
+            
+            # نسخ قبل الحذف حتى لا تتغير النتائج المحفوظة في السياق
+            gpa_trends = dict(gpa_trends)
+            risk_assessment = dict(risk_assessment)
+            predictions = dict(predictions)
             
             if 'current_gpa' in gpa_trends:
                 del gpa_trends['current_gpa']
@@ -3225,9 +4861,10 @@ class AcademicStatusAnalysisService:
         }
     
     @staticmethod
-    def _analyze_gpa_trends(student_id: int) -> Dict:
+    @student_analysis('gpa_trends')
+    def _analyze_gpa_trends(student_id: int, context: 'StudentContext') -> Dict:
         try:
-            student = Students.query.get(student_id)
+            student = context.student
             if not student:
                 return {"error": "Student not found"}
             
@@ -3264,12 +4901,7 @@ class AcademicStatusAnalysisService:
                     "interpretation": "بيانات غير كافية لتحديد الاتجاه"
                 }
             
-            X = np.array(semesters).reshape(-1, 1)
-            y = np.array(cumulative_gpas)
-            
-            model = LinearRegression()
-            model.fit(X, y)
-            slope = model.coef_[0]
+            slope, _ = fit_trend(cumulative_gpas, semesters)
             
             if slope > 0.1:
                 trend = "متحسن"
@@ -3316,9 +4948,10 @@ class AcademicStatusAnalysisService:
                 return "أداء ضعيف يحتاج تدخل عاجل"
     
     @staticmethod
-    def _analyze_performance_patterns(student_id: int) -> Dict:
+    @student_analysis('performance_patterns')
+    def _analyze_performance_patterns(student_id: int, context: 'StudentContext') -> Dict:
         try:
-            enrollments = Enrollments.query.filter_by(StudentId=student_id).all()
+            enrollments = context.enrollments
             if not enrollments:
                 return {"error": "No enrollment data found"}
             
@@ -3568,10 +5201,11 @@ class AcademicStatusAnalysisService:
         return "أداء مستقر"
     
     @staticmethod
-    def _calculate_risk_assessment(student_id: int) -> Dict:
+    @student_analysis('risk_assessment')
+    def _calculate_risk_assessment(student_id: int, context: 'StudentContext') -> Dict:
         """حساب تقييم المخاطر الأكاديمية"""
         try:
-            student = Students.query.get(student_id)
+            student = context.student
             if not student:
                 return {"error": "Student not found"}
         
@@ -3591,7 +5225,7 @@ class AcademicStatusAnalysisService:
                 risk_score += 10
             
             # تقييم الإنذارات الأكاديمية
-            warnings_count = AcademicWarnings.query.filter_by(StudentId=student_id).count()
+            warnings_count = len(context.warnings)
             if warnings_count >= 3:
                 risk_factors.append("عدد كبير من الإنذارات الأكاديمية")
                 risk_score += 30
@@ -3600,7 +5234,7 @@ class AcademicStatusAnalysisService:
                 risk_score += 15
             
             # تقييم معدل الحضور
-            attendance_rate = AcademicStatusAnalysisService._calculate_attendance_rate(student_id)
+            attendance_rate = AcademicStatusAnalysisService._calculate_attendance_rate(student_id, context)
             if attendance_rate < 0.7:
                 risk_factors.append("معدل حضور منخفض")
                 risk_score += 20
@@ -3630,17 +5264,13 @@ class AcademicStatusAnalysisService:
             return {"error": f"Risk assessment failed: {str(e)}"}
     
     @staticmethod
-    def _calculate_attendance_rate(student_id: int) -> float:
+    @student_analysis('attendance_rate')
+    def _calculate_attendance_rate(student_id: int, context: 'StudentContext') -> float:
         """حساب معدل الحضور"""
         try:
-            total_sessions = Attendances.query.filter_by(StudentId=student_id).count()
+            total_sessions, attended_sessions = context.attendance_counts
             if total_sessions == 0:
                 return 1.0  # افتراض حضور كامل إذا لم توجد بيانات
-            
-            attended_sessions = Attendances.query.filter_by(
-            StudentId=student_id, 
-                Status='1'
-        ).count()
         
             return round(attended_sessions / total_sessions, 2)
             
@@ -3683,10 +5313,11 @@ class AcademicStatusAnalysisService:
         return list(set(recommendations))  # إزالة التكرار
     
     @staticmethod
-    def _analyze_course_performance(student_id: int) -> Dict:
+    @student_analysis('course_performance')
+    def _analyze_course_performance(student_id: int, context: 'StudentContext') -> Dict:
         """تحليل أداء المواد الدراسية"""
         try:
-            enrollments = Enrollments.query.filter_by(StudentId=student_id).all()
+            enrollments = context.enrollments
             if not enrollments:
                 return {"error": "No enrollment data found"}
             
@@ -3727,6 +5358,11 @@ class AcademicStatusAnalysisService:
                     course_data[course_key]["exam2_grades"].append(float(enrollment.Exam2Grade))
                     course_data[course_key]["coursework_grades"].append(float(enrollment.Grade))
             
+            # مجاميع درجات كل المواد في استعلام مجمع واحد
+            peer_aggregates = AcademicStatusAnalysisService._get_course_grade_aggregates(
+                {data["course_id"] for data in course_data.values()}
+            )
+            
             # حساب متوسط الأداء لكل مادة ومقارنة مع متوسط الطلاب
             course_performance = {}
             for course_key, data in course_data.items():
@@ -3745,26 +5381,21 @@ class AcademicStatusAnalysisService:
                     )
                 }
                 
-                # حساب متوسط جميع الطلاب في هذه المادة
-                course_id = data["course_id"]
-                all_enrollments = Enrollments.query.filter_by(CourseId=course_id).all()
-                
-                peer_grades = []
-                for enroll in all_enrollments:
-                    if (enroll.StudentId != student_id and 
-                        enroll.Grade is not None and 
-                        enroll.Exam1Grade is not None and 
-                        enroll.Exam2Grade is not None):
-                        
-                        peer_total = (float(enroll.Exam1Grade) + 
-                                    float(enroll.Exam2Grade) + 
-                                    float(enroll.Grade))
-                        peer_percentage = (peer_total / 150.0) * 100
-                        peer_grades.append(peer_percentage)
+                # متوسط الزملاء = مجاميع المادة بعد طرح صفوف الطالب نفسه حسابياً
+                course_total_sum, course_total_squares, course_count = peer_aggregates.get(
+                    data["course_id"], (0.0, 0.0, 0)
+                )
+                peer_count = course_count - len(data["total_grades"])
+                peer_sum = course_total_sum - sum(data["total_grades"])
+                peer_squares = course_total_squares - sum(grade * grade for grade in data["total_grades"])
                 
                 # تحديد حالة الطالب بالنسبة للمتوسط
-                if peer_grades:
-                    peer_avg = round(statistics.mean(peer_grades), 2)
+                peer_std_dev = 0
+                if peer_count > 0:
+                    peer_mean_total = peer_sum / peer_count
+                    peer_variance = max(peer_squares / peer_count - peer_mean_total ** 2, 0.0)
+                    peer_avg = round((peer_mean_total / 150.0) * 100, 2)
+                    peer_std_dev = round((math.sqrt(peer_variance) / 150.0) * 100, 2)
                     comparison = AcademicStatusAnalysisService._compare_with_class_average(student_avg, peer_avg)
                 else:
                     peer_avg = 0
@@ -3780,6 +5411,8 @@ class AcademicStatusAnalysisService:
                     "detailed_analysis": detailed_analysis,
                     "peer_comparison": {
                         "peer_average": peer_avg,
+                        "peer_std_dev": peer_std_dev,
+                        "peer_count": max(peer_count, 0),
                         "comparison": comparison
                     },
                     "improvement_suggestions": AcademicStatusAnalysisService._generate_course_suggestions(
@@ -3800,6 +5433,30 @@ class AcademicStatusAnalysisService:
         except Exception as e:
             return {"error": f"Course performance analysis failed: {str(e)}"}
     
+    @staticmethod
+    def _get_course_grade_aggregates(course_ids) -> Dict:
+        """مجموع الدرجات ومجموع مربعاتها وعددها لكل مادة (الصفوف المكتملة الدرجات فقط)"""
+        if not course_ids:
+            return {}
+        
+        total_grade = Enrollments.Exam1Grade + Enrollments.Exam2Grade + Enrollments.Grade
+        rows = db.session.query(
+            Enrollments.CourseId,
+            func.sum(total_grade),
+            func.sum(total_grade * total_grade),
+            func.count(Enrollments.Id)
+        ).filter(
+            Enrollments.CourseId.in_(list(course_ids)),
+            Enrollments.Exam1Grade.isnot(None),
+            Enrollments.Exam2Grade.isnot(None),
+            Enrollments.Grade.isnot(None)
+        ).group_by(Enrollments.CourseId).all()
+        
+        return {
+            course_id: (float(total_sum or 0), float(total_squares or 0), count)
+            for course_id, total_sum, total_squares, count in rows
+        }
+    
     @staticmethod
     def _analyze_grade_trend(grades: List[float]) -> Dict:
         """تحليل اتجاه الدرجات في المادة"""
@@ -4059,11 +5716,12 @@ class AcademicStatusAnalysisService:
         return insights
     
     @staticmethod
-    def _analyze_attendance_patterns(student_id: int) -> Dict:
+    @student_analysis('attendance_patterns')
+    def _analyze_attendance_patterns(student_id: int, context: 'StudentContext') -> Dict:
         """تحليل مبسط للحضور"""
         try:
             # حساب معدل الحضور من دالة موجودة
-            attendance_rate = AcademicStatusAnalysisService._calculate_attendance_rate(student_id)
+            attendance_rate = AcademicStatusAnalysisService._calculate_attendance_rate(student_id, context)
             
             # تحديد حالة الحضور
             if attendance_rate >= 0.9:
@@ -4093,9 +5751,10 @@ class AcademicStatusAnalysisService:
             }
     
     @staticmethod
-    def _get_warnings_summary(student_id: int) -> Dict:
+    @student_analysis('warnings_summary')
+    def _get_warnings_summary(student_id: int, context: 'StudentContext') -> Dict:
         try:
-            warnings = AcademicWarnings.query.filter_by(StudentId=student_id).all()
+            warnings = context.warnings
             
             if not warnings:
                 return {
@@ -4145,9 +5804,10 @@ class AcademicStatusAnalysisService:
             return {"error": f"Warnings summary failed: {str(e)}"}
     
     @staticmethod
-    def _compare_with_peers(student_id: int) -> Dict:
+    @student_analysis('peer_comparison')
+    def _compare_with_peers(student_id: int, context: 'StudentContext') -> Dict:
         try:
-            student = Students.query.get(student_id)
+            student = context.student
             if not student:
                 return {"error": "Student not found"}
             
@@ -4155,13 +5815,12 @@ class AcademicStatusAnalysisService:
             student_semester = student.Semester
             student_current_gpa = AcademicStatusAnalysisService._get_current_gpa(student)
             
-            peers = Students.query.filter(
-                Students.DivisionId == student_division,
-                Students.Semester == student_semester,
-                Students.Id != student_id
-            ).all()
+            # ترتيب الدفعة من الفهرس المحسوب مسبقاً بدلاً من تحميل جميع الزملاء
+            cohort = CohortRankingIndex.get_peer_stats(
+                student_division, student_semester, student_id, student_current_gpa
+            )
             
-            if not peers:
+            if not cohort["peer_count"]:
                 return {
                     "student_info": {
                         "rank": 1,
@@ -4183,20 +5842,7 @@ class AcademicStatusAnalysisService:
                     ]
                 }
             
-            peer_gpas = []
-            peer_data = []
-            
-            for peer in peers:
-                peer_gpa = AcademicStatusAnalysisService._get_current_gpa(peer)
-                if peer_gpa > 0:  
-                    peer_gpas.append(peer_gpa)
-                    peer_data.append({
-                        "student_id": peer.Id,
-                        "name": peer.Name,
-                        "gpa": peer_gpa
-                    })
-            
-            if not peer_gpas:
+            if not cohort["ranked_peer_count"]:
                 return {
                     "student_info": {
                         "rank": 1,
@@ -4218,28 +5864,11 @@ class AcademicStatusAnalysisService:
                     ]
                 }
             
-            # إضافة الطالب الحالي للقائمة لحساب الترتيب
-            all_students_data = peer_data + [{
-                "student_id": student.Id,
-                "name": student.Name,
-                "gpa": student_current_gpa
-            }]
-            
-            # ترتيب الطلاب حسب المعدل التراكمي (من الأعلى للأقل)
-            all_students_data.sort(key=lambda x: x["gpa"], reverse=True)
-            
-            # العثور على ترتيب الطالب
-            student_rank = None
-            for i, student_data in enumerate(all_students_data):
-                if student_data["student_id"] == student.Id:
-                    student_rank = i + 1
-                    break
-            
-            # حساب الإحصائيات
-            total_students = len(all_students_data)
-            average_gpa = statistics.mean(peer_gpas)
-            max_gpa = max(peer_gpas)
-            min_gpa = min(peer_gpas)
+            student_rank = cohort["rank"]
+            total_students = cohort["ranked_peer_count"] + 1
+            average_gpa = cohort["average_gpa"]
+            max_gpa = cohort["highest_gpa"]
+            min_gpa = cohort["lowest_gpa"]
             
             # تحديد الأداء النسبي
             if student_current_gpa >= average_gpa + 0.5:
@@ -4324,10 +5953,11 @@ class AcademicStatusAnalysisService:
             return f"أداء الطالب أعلى المتوسط (معدل التراكمي: {current_gpa:.2f})"
 
     @staticmethod
-    def _get_merged_predictions(student_id: int) -> Dict:
+    @student_analysis('predictions')
+    def _get_merged_predictions(student_id: int, context: 'StudentContext') -> Dict:
         """توقع أداء الطالب المدمج"""
         try:
-            student = Students.query.get(student_id)
+            student = context.student
             if not student:
                 return {"error": "Student not found"}
             
@@ -4368,13 +5998,8 @@ class AcademicStatusAnalysisService:
                     "interpretation": "بيانات غير كافية للتنبؤ الدقيق"
                 }
             
-            # حساب التوقع باستخدام الانحدار الخطي
-            X = np.array(range(1, len(cumulative_gpas) + 1)).reshape(-1, 1)
-            y = np.array(cumulative_gpas)
-            
-            model = LinearRegression()
-            model.fit(X, y)
-            predicted_gpa = model.predict(np.array([[len(cumulative_gpas) + 1]]))[0]
+            # حساب التوقع بالانحدار الخطي بصيغة مغلقة
+            predicted_gpa = predict_next(cumulative_gpas)
             
             # تحديد مستوى المخاطرة والاتجاه
             current_gpa = cumulative_gpas[-1]
@@ -4434,16 +6059,17 @@ class AcademicStatusAnalysisService:
             return {"error": f"Merged predictions failed: {str(e)}"}
     
     @staticmethod
-    def _predictive_intervention_system(student_id: int) -> Dict:
+    @student_analysis('interventions')
+    def _predictive_intervention_system(student_id: int, context: 'StudentContext') -> Dict:
         """نظام التدخل التنبؤي المبسط"""
         try:
-            student = Students.query.get(student_id)
+            student = context.student
             if not student:
                 return {"error": "Student not found"}
             
             current_gpa = AcademicStatusAnalysisService._get_current_gpa(student)
-            risk_assessment = AcademicStatusAnalysisService._calculate_risk_assessment(student_id)
-            future_prediction = AcademicStatusAnalysisService._get_merged_predictions(student_id)
+            risk_assessment = AcademicStatusAnalysisService._calculate_risk_assessment(student_id, context)
+            future_prediction = AcademicStatusAnalysisService._get_merged_predictions(student_id, context)
             
             # تحديد التدخل الأساسي بناءً على المعدل ومستوى المخاطرة
             intervention = {}
@@ -4545,10 +6171,11 @@ class AcademicStatusAnalysisService:
             return 50
     
     @staticmethod
-    def _generate_personalized_learning_path(student_id: int) -> Dict:
+    @student_analysis('learning_path')
+    def _generate_personalized_learning_path(student_id: int, context: 'StudentContext') -> Dict:
         """مسار تعلم شخصي"""
         try:
-            student = Students.query.get(student_id)
+            student = context.student
             if not student:
                 return {"error": "Student not found"}
             
@@ -4556,8 +6183,8 @@ class AcademicStatusAnalysisService:
             current_gpa = AcademicStatusAnalysisService._get_current_gpa(student)
             
             # تحليل نقاط القوة والضعف
-            enrollments = Enrollments.query.filter_by(StudentId=student_id).all()
-            course_performance = AcademicStatusAnalysisService._analyze_course_performance(student_id)
+            enrollments = context.enrollments
+            course_performance = AcademicStatusAnalysisService._analyze_course_performance(student_id, context)
             
             # تحديد المسار بناءً على الأداء
             if current_gpa >= 3.5:
@@ -4680,18 +6307,19 @@ class AcademicStatusAnalysisService:
             }
 
     @staticmethod
-    def _generate_ai_insights(student_id: int) -> Dict:
+    @student_analysis('ai_insights')
+    def _generate_ai_insights(student_id: int, context: 'StudentContext') -> Dict:
         """توليد تلميحات AI"""
         try:
-            student = Students.query.get(student_id)
+            student = context.student
             if not student:
                 return {"error": "Student not found"}
             
             # جمع البيانات للتحليل
             current_gpa = AcademicStatusAnalysisService._get_current_gpa(student)
-            gpa_trends = AcademicStatusAnalysisService._analyze_gpa_trends(student_id)
-            course_performance = AcademicStatusAnalysisService._analyze_course_performance(student_id)
-            risk_assessment = AcademicStatusAnalysisService._calculate_risk_assessment(student_id)
+            gpa_trends = AcademicStatusAnalysisService._analyze_gpa_trends(student_id, context)
+            course_performance = AcademicStatusAnalysisService._analyze_course_performance(student_id, context)
+            risk_assessment = AcademicStatusAnalysisService._calculate_risk_assessment(student_id, context)
             
             # توليد الرؤى الذكية
             insights = []
@@ -4871,12 +6499,7 @@ class AcademicStatusAnalysisService:
                 return {"trend": "insufficient_data", "slope": 0}
             
             # حساب الاتجاه باستخدام الانحدار الخطي
-            X = np.array(range(len(cumulative_gpas))).reshape(-1, 1)
-            y = np.array(cumulative_gpas)
-            
-            model = LinearRegression()
-            model.fit(X, y)
-            slope = model.coef_[0]
+            slope, _ = fit_trend(cumulative_gpas, range(len(cumulative_gpas)))
             
             if slope > 0.1:
                 trend = "متحسن"
@@ -5548,44 +7171,508 @@ class AcademicStatusAnalysisService:
         """اقتراح استراتيجيات التأقلم"""
         strategies = []
         
-        if stress_level == "high":
-            strategies.extend([
-                "طلب المساعدة من المرشد الأكاديمي فوراً",
-                "تقليل العبء الدراسي إذا أمكن",
-                "وضع خطة دراسية مكثفة",
-                "البحث عن دعم نفسي إذا لزم الأمر",
-                "تنظيم الوقت بشكل صارم"
-            ])
-        elif stress_level == "medium":
-            strategies.extend([
-                "مراجعة الخطة الدراسية",
-                "تحسين تنظيم الوقت",
-                "طلب المساعدة في المواد الصعبة",
-                "ممارسة تقنيات الاسترخاء"
-            ])
-        else:
-            strategies.extend([
-                "الحفاظ على التوازن الحالي",
-                "التطلع لتحديات جديدة",
-                "مساعدة الزملاء المحتاجين"
-            ])
+        if stress_level == "high":
+            strategies.extend([
+                "طلب المساعدة من المرشد الأكاديمي فوراً",
+                "تقليل العبء الدراسي إذا أمكن",
+                "وضع خطة دراسية مكثفة",
+                "البحث عن دعم نفسي إذا لزم الأمر",
+                "تنظيم الوقت بشكل صارم"
+            ])
+        elif stress_level == "medium":
+            strategies.extend([
+                "مراجعة الخطة الدراسية",
+                "تحسين تنظيم الوقت",
+                "طلب المساعدة في المواد الصعبة",
+                "ممارسة تقنيات الاسترخاء"
+            ])
+        else:
+            strategies.extend([
+                "الحفاظ على التوازن الحالي",
+                "التطلع لتحديات جديدة",
+                "مساعدة الزملاء المحتاجين"
+            ])
+        
+        return strategies 
+
+
+
+
+
+
+
+
+
+
+
+
+class RiskSnapshotService:
+    """تقييم المخاطر لكل الطلاب النشطين دفعة واحدة وحفظه كلقطات مؤرخة للترتيب والتصفية"""
+    
+    BATCH_SIZE = 2000
+    RETENTION_DAYS = 180
+    SCHEDULE_HOUR = 5
+    RISK_LEVELS = ("عالي", "متوسط", "منخفض")
+    
+    # نفس قواعد _calculate_risk_assessment: (الحد، النقاط، عامل المخاطرة)
+    GPA_RULES = (
+        (2.0, 40, "معدل تراكمي منخفض جداً"),
+        (2.5, 25, "معدل تراكمي منخفض"),
+        (3.0, 10, "معدل تراكمي يحتاج تحسين"),
+    )
+    WARNING_RULES = (
+        (3, 30, "عدد كبير من الإنذارات الأكاديمية"),
+        (1, 15, "وجود إنذارات أكاديمية"),
+    )
+    ATTENDANCE_RULES = (
+        (0.7, 20, "معدل حضور منخفض"),
+        (0.8, 10, "معدل حضور يحتاج تحسين"),
+    )
+    
+    @classmethod
+    def run_snapshot(cls, snapshot_date=None):
+        """حساب لقطة المخاطر لكل الطلاب النشطين - تُستبدل لقطة نفس اليوم إن وجدت"""
+        snapshot_date = snapshot_date or datetime.now().date()
+        created_at = datetime.now()
+        gpa_columns = [getattr(Students, f'GPA{i}') for i in range(1, 9)]
+        
+        # تشغيل جديد تُكتب صفوفه بمعاملة لكل دفعة ولا يراه القراء قبل تعيين CompletedAt
+        # حتى لا تحجب معاملة طويلة قراءات اللقطة السابقة
+        try:
+            run = RiskSnapshotRuns(SnapshotDate=snapshot_date, StartedAt=created_at, StudentsScored=0)
+            db.session.add(run)
+            db.session.commit()
+            run_id = run.Id
+            
+            total = 0
+            level_counts = Counter()
+            last_id = 0
+            while True:
+                rows = db.session.query(
+                    Students.Id, Students.DivisionId, Students.Semester, *gpa_columns
+                ).filter(
+                    Students.status == 'نشط',
+                    Students.Id > last_id
+                ).order_by(Students.Id).limit(cls.BATCH_SIZE).all()
+                
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                
+                mappings = cls._score_batch(rows, run_id, snapshot_date, created_at)
+                db.session.bulk_insert_mappings(StudentRiskSnapshots, mappings)
+                db.session.commit()
+                
+                total += len(mappings)
+                level_counts.update(mapping['RiskLevel'] for mapping in mappings)
+            
+            # اللقطة تظهر كاملة أو لا تظهر
+            db.session.query(RiskSnapshotRuns).filter(RiskSnapshotRuns.Id == run_id).update(
+                {RiskSnapshotRuns.CompletedAt: datetime.now(), RiskSnapshotRuns.StudentsScored: total},
+                synchronize_session=False
+            )
+            db.session.commit()
+            
+            cls._purge_runs(run_id, snapshot_date)
+            
+            return {
+                "success": True,
+                "message": f"تم حساب المخاطر لـ {total} طالب",
+                "data": {
+                    "snapshot_date": snapshot_date.isoformat(),
+                    "students_scored": total,
+                    "by_level": {level: level_counts[level] for level in cls.RISK_LEVELS}
+                }
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error running risk snapshot: {str(e)}")
+            # التشغيل غير المكتمل لا يُقرأ أبداً ويُحذف مع التشغيل الناجح التالي
+            return {
+                "success": False,
+                "message": f"حدث خطأ أثناء حساب لقطة المخاطر: {str(e)}",
+                "data": None
+            }
+    
+    @classmethod
+    def _purge_runs(cls, current_run_id, snapshot_date):
+        """حذف التشغيلات المنتهية الصلاحية والمستبدلة والناقصة بعد اكتمال التشغيل الحالي"""
+        try:
+            stale_run_ids = [run_id for run_id, in db.session.query(RiskSnapshotRuns.Id).filter(
+                RiskSnapshotRuns.Id < current_run_id,
+                or_(
+                    RiskSnapshotRuns.SnapshotDate < snapshot_date - timedelta(days=cls.RETENTION_DAYS),
+                    RiskSnapshotRuns.SnapshotDate == snapshot_date,
+                    RiskSnapshotRuns.CompletedAt.is_(None)
+                )
+            ).all()]
+            
+            for run_id in stale_run_ids:
+                StudentRiskSnapshots.query.filter(
+                    StudentRiskSnapshots.RunId == run_id
+                ).delete(synchronize_session=False)
+                RiskSnapshotRuns.query.filter(RiskSnapshotRuns.Id == run_id).delete(synchronize_session=False)
+                db.session.commit()
+                
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error purging risk snapshot runs: {str(e)}")
+    
+    @classmethod
+    def _latest_run(cls, since=None):
+        """آخر تشغيل مكتمل - بدءاً من وقت محدد إن مُرر"""
+        query = RiskSnapshotRuns.query.filter(RiskSnapshotRuns.CompletedAt.isnot(None))
+        if since is not None:
+            query = query.filter(RiskSnapshotRuns.StartedAt >= since)
+        return query.order_by(RiskSnapshotRuns.Id.desc()).first()
+    
+    @classmethod
+    def _last_scheduled_time(cls, now=None):
+        now = now or datetime.now()
+        scheduled = now.replace(hour=cls.SCHEDULE_HOUR, minute=0, second=0, microsecond=0)
+        return scheduled if now >= scheduled else scheduled - timedelta(days=1)
+    
+    @classmethod
+    def _score_batch(cls, rows, run_id, snapshot_date, created_at):
+        """تقييم دفعة من الطلاب بمصفوفات numpy من تجميعات SQL للإنذارات والحضور"""
+        first_id, last_id = rows[0][0], rows[-1][0]
+        
+        # نطاق المعرفات بدلاً من IN لتجنب حد عدد المعاملات في SQL Server
+        warning_counts = dict(
+            db.session.query(AcademicWarnings.StudentId, func.count(AcademicWarnings.Id))
+            .filter(AcademicWarnings.StudentId.between(first_id, last_id))
+            .group_by(AcademicWarnings.StudentId)
+            .all()
+        )
+        attendance_counts = {
+            student_id: (total or 0, int(attended or 0))
+            for student_id, total, attended in db.session.query(
+                Attendances.StudentId,
+                func.count(Attendances.Id),
+                func.sum(db.case((Attendances.Status == True, 1), else_=0))
+            ).filter(
+                Attendances.StudentId.between(first_id, last_id)
+            ).group_by(Attendances.StudentId).all()
+        }
+        
+        student_ids = [row[0] for row in rows]
+        semesters = np.array([row[2] for row in rows], dtype=int)
+        gpa_matrix = np.array(
+            [[np.nan if value is None else float(value) for value in row[3:]] for row in rows],
+            dtype=float
+        )
+        
+        # المعدل التراكمي = متوسط معدلات الترمات المكتملة (مثل _get_current_gpa)
+        completed = np.arange(1, gpa_matrix.shape[1] + 1) <= (semesters - 1)[:, None]
+        completed_gpa = np.where(completed, gpa_matrix, np.nan)
+        valid = ~np.isnan(completed_gpa)
+        gpa_counts = valid.sum(axis=1)
+        gpa_sums = np.where(valid, completed_gpa, 0.0).sum(axis=1)
+        current_gpa = np.where(gpa_counts > 0, np.round(gpa_sums / np.maximum(gpa_counts, 1), 2), 0.0)
+        
+        warnings_count = np.array([warning_counts.get(sid, 0) for sid in student_ids], dtype=int)
+        
+        attendance = np.array([attendance_counts.get(sid, (0, 0)) for sid in student_ids], dtype=float)
+        attendance_rate = np.where(
+            attendance[:, 0] > 0,
+            np.round(attendance[:, 1] / np.maximum(attendance[:, 0], 1), 2),
+            1.0
+        )
+        
+        gpa_points = np.select(
+            [current_gpa < limit for limit, _, _ in cls.GPA_RULES],
+            [points for _, points, _ in cls.GPA_RULES], 0
+        )
+        warning_points = np.select(
+            [warnings_count >= limit for limit, _, _ in cls.WARNING_RULES],
+            [points for _, points, _ in cls.WARNING_RULES], 0
+        )
+        attendance_points = np.select(
+            [attendance_rate < limit for limit, _, _ in cls.ATTENDANCE_RULES],
+            [points for _, points, _ in cls.ATTENDANCE_RULES], 0
+        )
+        risk_scores = gpa_points + warning_points + attendance_points
+        
+        _, _, predictions, _ = fit_trends_batch(completed_gpa)
+        predictions = np.round(np.clip(predictions, 0.0, 4.0), 2)
+        
+        factor_labels = [
+            {points: factor for _, points, factor in rules}
+            for rules in (cls.GPA_RULES, cls.WARNING_RULES, cls.ATTENDANCE_RULES)
+        ]
+        
+        mappings = []
+        for index, row in enumerate(rows):
+            risk_factors = [
+                labels[int(points[index])]
+                for labels, points in zip(factor_labels, (gpa_points, warning_points, attendance_points))
+                if points[index]
+            ]
+            risk_score = int(risk_scores[index])
+            
+            mappings.append({
+                'RunId': run_id,
+                'StudentId': row[0],
+                'DivisionId': row[1],
+                'Semester': row[2],
+                'SnapshotDate': snapshot_date,
+                'RiskScore': risk_score,
+                'RiskLevel': cls._risk_level(risk_score),
+                'RiskFactors': json.dumps(risk_factors, ensure_ascii=False),
+                'CurrentGPA': float(current_gpa[index]),
+                'PredictedGPA': None if np.isnan(predictions[index]) else float(predictions[index]),
+                'AttendanceRate': float(attendance_rate[index]),
+                'WarningsCount': int(warnings_count[index]),
+                'CreatedAt': created_at
+            })
+        
+        return mappings
+    
+    @staticmethod
+    def _risk_level(risk_score):
+        if risk_score >= 60:
+            return "عالي"
+        elif risk_score >= 30:
+            return "متوسط"
+        return "منخفض"
+    
+    @staticmethod
+    def _format_snapshot(snapshot):
+        risk_factors = json.loads(snapshot.RiskFactors or '[]')
+        return {
+            "risk_level": snapshot.RiskLevel,
+            "risk_score": snapshot.RiskScore,
+            "risk_factors": risk_factors,
+            "recommendations": AcademicStatusAnalysisService._get_risk_recommendations(snapshot.RiskLevel, risk_factors),
+            "current_gpa": snapshot.CurrentGPA,
+            "predicted_gpa": snapshot.PredictedGPA,
+            "attendance_rate": snapshot.AttendanceRate,
+            "warnings_count": snapshot.WarningsCount,
+            "snapshot_date": snapshot.SnapshotDate.isoformat()
+        }
+    
+    @classmethod
+    def get_student_risk(cls, student_id):
+        """لقطة مخاطر الطالب من آخر تشغيل مجدول - أو حساب مباشر إذا كانت أقدم منه أو لم يعد الطالب نشطاً"""
+        snapshot = None
+        run = cls._latest_run(since=cls._last_scheduled_time())
+        if run is not None:
+            snapshot = StudentRiskSnapshots.query.filter_by(RunId=run.Id, StudentId=student_id).first()
+        
+        if snapshot is None:
+            return cls._live_risk(student_id)
+        
+        return cls._format_snapshot(snapshot)
+    
+    @staticmethod
+    def _live_risk(student_id):
+        """حساب مباشر بنفس مفاتيح اللقطة - المعدل المتوقع من الترمات المكتملة كما في run_snapshot"""
+        context = StudentContext(student_id)
+        assessment = AcademicStatusAnalysisService._calculate_risk_assessment(student_id, context)
+        if "error" in assessment:
+            return assessment
+        
+        student = context.student
+        positions = []
+        completed_gpa = []
+        for i in range(1, min(student.Semester or 1, 9)):
+            value = getattr(student, f'GPA{i}', None)
+            if value is not None:
+                positions.append(i)
+                completed_gpa.append(float(value))
+        
+        predicted_gpa = None
+        if completed_gpa:
+            predicted_gpa = round(min(max(predict_next(completed_gpa, positions), 0.0), 4.0), 2)
+        
+        return {
+            **assessment,
+            "predicted_gpa": predicted_gpa,
+            "snapshot_date": None
+        }
+    
+    @classmethod
+    def get_risk_ranking(cls, division_id=None, semester=None, risk_level=None, page=1, per_page=50):
+        """ترتيب الطلاب حسب درجة المخاطرة من أحدث لقطة مكتملة مع التصفية والتقسيم إلى صفحات"""
+        run = cls._latest_run()
+        if run is None:
+            return {
+                "snapshot_date": None,
+                "students": [],
+                "pagination": {"page": page, "per_page": per_page, "total": 0, "pages": 0}
+            }
+        
+        snapshot_date = run.SnapshotDate
+        query = StudentRiskSnapshots.query.filter(StudentRiskSnapshots.RunId == run.Id)
+        if division_id is not None:
+            query = query.filter(StudentRiskSnapshots.DivisionId == division_id)
+        if semester is not None:
+            query = query.filter(StudentRiskSnapshots.Semester == semester)
+        if risk_level is not None:
+            query = query.filter(StudentRiskSnapshots.RiskLevel == risk_level)
+        
+        total = query.count()
+        offset = (page - 1) * per_page
+        snapshots = query.options(joinedload(StudentRiskSnapshots.student)).order_by(
+            StudentRiskSnapshots.RiskScore.desc(),
+            StudentRiskSnapshots.CurrentGPA.asc(),
+            StudentRiskSnapshots.StudentId.asc()
+        ).offset(offset).limit(per_page).all()
+        
+        students = []
+        for rank, snapshot in enumerate(snapshots, start=offset + 1):
+            entry = cls._format_snapshot(snapshot)
+            del entry["recommendations"], entry["snapshot_date"]
+            entry.update({
+                "rank": rank,
+                "student_id": snapshot.StudentId,
+                "student_name": snapshot.student.Name if snapshot.student else None,
+                "division_id": snapshot.DivisionId,
+                "semester": snapshot.Semester
+            })
+            students.append(entry)
         
-        return strategies 
+        return {
+            "snapshot_date": snapshot_date.isoformat(),
+            "students": students,
+            "pagination": {
+                "page": page,
+                "per_page": per_page,
+                "total": total,
+                "pages": (total + per_page - 1) // per_page
+            }
+        }
 
 
+PlanningDivision = namedtuple('PlanningDivision', ['Id', 'Name'])
+PlanningDepartment = namedtuple('PlanningDepartment', ['Id', 'Name'])
+PlanningCourse = namedtuple('PlanningCourse', [
+    'Id', 'Name', 'Code', 'Credits', 'Semester', 'DepartmentId', 'department', 'subject_type'
+])
+PlanningEnrollment = namedtuple('PlanningEnrollment', [
+    'Id', 'CourseId', 'Exam1Grade', 'Exam2Grade', 'Grade', 'NumberOFSemster', 'IsCompleted', 'course'
+])
+PlanningStudent = namedtuple('PlanningStudent', [
+    'Id', 'Name', 'Semester', 'DivisionId', 'CreditsCompleted',
+    'GPA1', 'GPA2', 'GPA3', 'GPA4', 'GPA5', 'GPA6', 'GPA7', 'GPA8', 'division'
+])
 
 
+class PlanningDataCache:
+    """ذاكرة مؤقتة مشتركة لبيانات التخطيط الأكاديمي (كتالوج الشعب ولقطات الطلاب) كبيانات عادية بدون كائنات ORM"""
+    
+    TTL_SECONDS = 300
+    MAX_ENTRIES = 5000
+    
+    # المفتاح (النطاق، المعرف، الاسم) والقيمة (الإصدار، وقت التخزين، البيانات)
+    _entries = OrderedDict()
+    _scope_versions = {}
+    _versions = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _current_version(cls, scope, scope_id):
+        return (cls._scope_versions.get(scope, 0), cls._versions.get((scope, scope_id), 0))
 
+    @classmethod
+    def get(cls, scope, scope_id, name, loader):
+        """القيمة المخزنة إن كانت صالحة وإلا تحميلها بالدالة loader وتخزينها - القيم للقراءة فقط"""
+        key = (scope, scope_id, name)
+        with cls._lock:
+            version = cls._current_version(scope, scope_id)
+            entry = cls._entries.get(key)
+            if entry is not None:
+                entry_version, stored_at, value = entry
+                if entry_version == version and time.time() - stored_at <= cls.TTL_SECONDS:
+                    cls._entries.move_to_end(key)
+                    return value
+                cls._entries.pop(key, None)
+        
+        value = loader()
+        
+        with cls._lock:
+            # تجاهل القيمة إذا أُبطلت البيانات أثناء تحميلها
+            if cls._current_version(scope, scope_id) == version:
+                cls._entries[key] = (version, time.time(), value)
+                while len(cls._entries) > cls.MAX_ENTRIES:
+                    cls._entries.popitem(last=False)
+        return value
 
+    @classmethod
+    def invalidate(cls, scope, scope_id=None):
+        """إبطال بيانات معرف واحد أو النطاق بالكامل عند عدم تحديد المعرف"""
+        with cls._lock:
+            if scope_id is None:
+                cls._scope_versions[scope] = cls._scope_versions.get(scope, 0) + 1
+                stale_keys = [key for key in cls._entries if key[0] == scope]
+            else:
+                cls._versions[(scope, scope_id)] = cls._versions.get((scope, scope_id), 0) + 1
+                stale_keys = [key for key in cls._entries if key[0] == scope and key[1] == scope_id]
+            for key in stale_keys:
+                cls._entries.pop(key, None)
 
+    @classmethod
+    def invalidate_student(cls, student_id):
+        """إبطال لقطة الطالب وكل ما اشتُق منها بعد تعديل تسجيلاته"""
+        if student_id is None:
+            return
+        cls.invalidate('student', student_id)
 
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+
+
+class SchedulePlanContext:
+    """مدخلات توليد الخطط الدراسية تُحمّل مرة واحدة وتُشارك بين كل الخطط البديلة مع توقيت كل مرحلة"""
+
+    def __init__(self, service, student_data):
+        started = time.perf_counter()
+        self.service = service
+        self.student = student_data['student']
+        self.completed_course_ids = set(service._get_completed_course_ids_fast(student_data['enrollments']))
+        self.available_courses = service._get_all_division_data_bulk(self.student.DivisionId)
+        self._results = {}
+        self.timings = {}
+        self._record('load_inputs', started)
+
+    def _record(self, stage, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.timings[stage] = round(self.timings.get(stage, 0) + elapsed_ms, 2)
+
+    def run_stage(self, stage, compute):
+        """تنفيذ مرحلة وإضافة زمنها إلى توقيتات الخطة"""
+        started = time.perf_counter()
+        try:
+            return compute()
+        finally:
+            self._record(stage, started)
 
+    def memoize(self, key, compute):
+        if key not in self._results:
+            self._results[key] = compute()
+        return self._results[key]
 
+    def specialization_courses(self, specialization):
+        """مقررات الشعبة مرتبة حسب صلتها بالتخصص - تُحسب مرة لكل تخصص"""
+        def compute():
+            courses = self.service._filter_specialization_courses_fast(self.available_courses, specialization)
+            return courses or self.available_courses
+        return self.memoize(('specialization_courses', specialization), compute)
 
 
 class AcademicPathPlanningService:
     """خدمة التخطيط الأكاديمي المحسنة للسرعة"""
     
+    # خيارات التخصص خارج specialization_system التي تُعرض في التوصيات
+    EXTRA_SPECIALIZATION_OPTIONS = (
+        'علم الحيوان', 'النبات والكيمياء', 'علم الحيوان والكيمياء', 'الكيمياء والكيمياء الحيوية',
+        'الجيولوجيا والكيمياء', 'الرياضيات والفيزياء', 'الكيمياء والفيزياء',
+        'الرياضيات الخاصة', 'الفيزياء الخاصة', 'الرياضيات وعلوم الحاسب', 'الكيمياء الخاصة'
+    )
+    
     def __init__(self):
         # نظام الشعب والتشعيبات - محسن
         self.specialization_system = {
@@ -5612,17 +7699,16 @@ class AcademicPathPlanningService:
                 }
             }
         }
-        
-        # إعدادات الكاش المحسنة - إضافة الكاش المفقود
-        self._cache = {}
-        self._cache_timeout = 300  # 5 دقائق
-        self._performance_cache = {}  # كاش الأداء المفقود
-        self._student_cache = {}      # كاش بيانات الطلاب  
-        self._courses_cache = {}      # كاش المقررات
 
-    # تحسين جذري لاستعلامات قاعدة البيانات
-    @lru_cache(maxsize=200)
+
+    # البيانات مشتركة بين الطلبات عبر PlanningDataCache لأن الخدمة تُنشأ مع كل طلب
     def _get_student_data_bulk(self, student_id):
+        """لقطة بيانات الطالب وتسجيلاته من الذاكرة المشتركة"""
+        return PlanningDataCache.get(
+            'student', student_id, 'snapshot', lambda: self._load_student_snapshot(student_id)
+        )
+
+    def _load_student_snapshot(self, student_id):
         """استعلام واحد شامل لكل بيانات الطالب - محسن جداً"""
         from models import Students, Enrollments
         
@@ -5635,20 +7721,63 @@ class AcademicPathPlanningService:
         if not student:
             return None
             
-        # جلب التسجيلات مع المقررات في استعلام واحد
+        # جلب التسجيلات مع المقررات والأقسام في استعلام واحد
         enrollments = db.session.query(Enrollments)\
-            .options(joinedload(Enrollments.course))\
+            .options(joinedload(Enrollments.course).joinedload(Courses.department))\
             .filter_by(StudentId=student_id)\
             .all()
+        
+        division = PlanningDivision(student.division.Id, student.division.Name)
+        student_snapshot = PlanningStudent(
+            Id=student.Id,
+            Name=student.Name,
+            Semester=student.Semester,
+            DivisionId=student.DivisionId,
+            CreditsCompleted=student.CreditsCompleted,
+            GPA1=student.GPA1, GPA2=student.GPA2, GPA3=student.GPA3, GPA4=student.GPA4,
+            GPA5=student.GPA5, GPA6=student.GPA6, GPA7=student.GPA7, GPA8=student.GPA8,
+            division=division
+        )
+        
+        enrollment_snapshots = []
+        for enrollment in enrollments:
+            course = enrollment.course
+            course_snapshot = None
+            if course:
+                course_snapshot = PlanningCourse(
+                    Id=course.Id,
+                    Name=course.Name,
+                    Code=course.Code,
+                    Credits=course.Credits,
+                    Semester=course.Semester,
+                    DepartmentId=course.DepartmentId,
+                    department=PlanningDepartment(course.department.Id, course.department.Name),
+                    subject_type=self._determine_subject_type(course.department.Name.lower(), course.Name.lower())
+                )
+            enrollment_snapshots.append(PlanningEnrollment(
+                Id=enrollment.Id,
+                CourseId=enrollment.CourseId,
+                Exam1Grade=enrollment.Exam1Grade,
+                Exam2Grade=enrollment.Exam2Grade,
+                Grade=enrollment.Grade,
+                NumberOFSemster=enrollment.NumberOFSemster,
+                IsCompleted=enrollment.IsCompleted,
+                course=course_snapshot
+            ))
             
         return {
-            'student': student,
-            'enrollments': enrollments,
-            'division': student.division
+            'student': student_snapshot,
+            'enrollments': enrollment_snapshots,
+            'division': division
         }
 
-    @lru_cache(maxsize=50)
     def _get_all_division_data_bulk(self, division_id):
+        """مقررات الشعبة من الذاكرة المشتركة"""
+        return PlanningDataCache.get(
+            'division', division_id, 'courses', lambda: self._load_division_courses(division_id)
+        )
+
+    def _load_division_courses(self, division_id):
         """جلب كل بيانات الشعبة في استعلام واحد - محسن جداً"""
         # استعلام واحد شامل
         course_divisions = db.session.query(CourseDivisions)\
@@ -5663,6 +7792,8 @@ class AcademicPathPlanningService:
         for cd in course_divisions:
             course = cd.course
             department = course.department
+            # تصنيف المادة وصلتها بالتخصصات يُحسب مرة واحدة مع الكتالوج
+            labels = SUBJECT_CLASSIFIER.label_course(department.Name.lower(), course.Name.lower())
             courses_data.append({
                 'course_id': course.Id,
                 'name': course.Name,
@@ -5673,7 +7804,9 @@ class AcademicPathPlanningService:
                 'description': course.Description,
                 'department_id': course.DepartmentId,
                 'department_name': department.Name,
-                'subject_type': self._determine_subject_type_cached(department.Name.lower(), course.Name.lower())
+                'subject_type': labels['subject_type'],
+                'specialization_scores': labels['specialization_scores'],
+                'related_specializations': labels['related_specializations']
             })
             
         return courses_data
@@ -5789,8 +7922,8 @@ class AcademicPathPlanningService:
         ]
         
         # إنشاء خطة الترمات
-        semester_plans = self._create_fast_semester_plans(
-            student, stage, current_semester, available_courses_filtered, max_credits
+        semester_plans, schedule = self._create_fast_semester_plans(
+            student, stage, current_semester, available_courses_filtered, max_credits, completed_course_ids
         )
         
         return {
@@ -5805,7 +7938,8 @@ class AcademicPathPlanningService:
                 'max_credits_per_semester': max_credits
             },
             'semester_plans': semester_plans,
-            'total_remaining_semesters': len(semester_plans)
+            'total_remaining_semesters': len(semester_plans),
+            'scheduling_summary': self._summarize_schedule(schedule)
         }
 
     def _create_optimized_natural_sciences_plan(self, student, division_info, available_courses, completed_course_ids, max_credits):
@@ -5827,8 +7961,8 @@ class AcademicPathPlanningService:
         ]
         
         # إنشاء خطة الترمات
-        semester_plans = self._create_fast_semester_plans(
-            student, stage, current_semester, available_courses_filtered, max_credits
+        semester_plans, schedule = self._create_fast_semester_plans(
+            student, stage, current_semester, available_courses_filtered, max_credits, completed_course_ids
         )
         
         return {
@@ -5843,21 +7977,24 @@ class AcademicPathPlanningService:
                 'max_credits_per_semester': max_credits
             },
             'semester_plans': semester_plans,
-            'total_remaining_semesters': len(semester_plans)
+            'total_remaining_semesters': len(semester_plans),
+            'scheduling_summary': self._summarize_schedule(schedule)
         }
 
-    def _create_fast_semester_plans(self, student, stage, current_semester, available_courses, max_credits):
-        """إنشاء خطط الترمات بشكل سريع"""
+    def _create_fast_semester_plans(self, student, stage, current_semester, available_courses, max_credits,
+                                    completed_course_ids=None):
+        """إنشاء خطط الترمات بشكل سريع - يُرجع (خطط الترمات، نتيجة الجدولة)"""
         semester_plans = {}
         
         # حساب عدد الترمات المتبقية
         max_semesters = 8
         remaining_semesters = max_semesters - current_semester
         
-        # توزيع المقررات على الترمات - خوارزمية محسنة
-        courses_per_semester = self._distribute_courses_optimized(
-            available_courses, remaining_semesters, max_credits
+        # جدولة المقررات حسب المتطلبات السابقة وحد الساعات
+        schedule = self._schedule_courses(
+            available_courses, remaining_semesters, max_credits, completed_course_ids
         )
+        courses_per_semester = self._format_schedule(schedule)
         
         for i in range(remaining_semesters):
             semester_number = current_semester + i + 1
@@ -5876,50 +8013,51 @@ class AcademicPathPlanningService:
                 'note': f'مقررات مرحلة {stage}'
             }
         
-        return semester_plans
+        return semester_plans, schedule
 
-    def _distribute_courses_optimized(self, available_courses, remaining_semesters, max_credits):
-        """توزيع المقررات على الترمات بطريقة محسنة"""
-        if not available_courses or remaining_semesters <= 0:
-            return {}
+    def _get_prerequisite_map(self):
+        """خريطة المتطلبات السابقة لكل المقررات من الذاكرة المشتركة"""
+        def load():
+            prerequisite_map = {}
+            for course_id, prerequisite_id in db.session.query(
+                CoursePrerequisites.CourseId, CoursePrerequisites.PrerequisiteCourseId
+            ).all():
+                prerequisite_map.setdefault(course_id, []).append(prerequisite_id)
+            return {course_id: tuple(ids) for course_id, ids in prerequisite_map.items()}
         
-        # ترتيب المقررات حسب الأولوية - معالجة سريعة
-        sorted_courses = sorted(
+        return PlanningDataCache.get('catalog', 'prerequisites', 'map', load)
+
+    def _schedule_courses(self, available_courses, remaining_semesters, max_credits, completed_course_ids=None):
+        """جدولة المقررات على الترمات المتبقية بترتيب المتطلبات السابقة وحد الساعات"""
+        return schedule_courses(
             available_courses,
-            key=lambda x: (not x.get('is_mandatory', False), x.get('semester', 99), x.get('credits', 0))
+            self._get_prerequisite_map(),
+            max_credits,
+            completed_ids=completed_course_ids,
+            max_semesters=max(remaining_semesters, 0)
         )
-        
-        semester_plans = {}
-        course_index = 0
-        
-        for semester_idx in range(remaining_semesters):
-            current_credits = 0
-            semester_courses = []
-            
-            # إضافة المقررات للترم الحالي
-            while course_index < len(sorted_courses) and current_credits < max_credits:
-                course = sorted_courses[course_index]
-                course_credits = course.get('credits', 0)
-                
-                if current_credits + course_credits <= max_credits:
-                    semester_courses.append({
-                        'course_id': course['course_id'],
-                        'course_name': course['name'],
-                        'course_code': course['code'],
-                        'credits': course_credits
-                    })
-                    current_credits += course_credits
-                    course_index += 1
-                else:
-                    break
-            
-            semester_plans[semester_idx] = semester_courses
-            
-            # إذا انتهت المقررات، توقف
-            if course_index >= len(sorted_courses):
-                break
-        
-        return semester_plans
+
+    def _format_schedule(self, schedule):
+        """تحويل نتيجة الجدولة إلى {رقم الترم النسبي: مقررات الترم}"""
+        return {
+            semester_idx: [{
+                'course_id': course['course_id'],
+                'course_name': course['name'],
+                'course_code': course['code'],
+                'credits': course.get('credits', 0)
+            } for course in semester_courses]
+            for semester_idx, semester_courses in enumerate(schedule['semesters'])
+        }
+
+    def _summarize_schedule(self, schedule):
+        """ملخص الجدولة: أقل عدد ترمات ممكن والمقررات التي لم تُجدول"""
+        return {
+            'minimum_semesters_to_graduate': schedule['minimum_semesters'],
+            'scheduled_semesters': schedule['scheduled_semesters'],
+            'prerequisite_chain_length': schedule['critical_path_length'],
+            'remaining_credits': schedule['total_credits'],
+            'unscheduled_courses': schedule['unscheduled']
+        }
 
     def _get_division_info(self, student):
         """الحصول على معلومات الشعبة"""
@@ -6202,15 +8340,18 @@ class AcademicPathPlanningService:
             
         return plan
 
-    def _get_general_courses_for_semester(self, student, semester, max_credits):
+    def _get_general_courses_for_semester(self, student, semester, max_credits, context=None):
         """الحصول على المقررات العامة لترم معين مع البيانات الكاملة"""
-        from models import Courses
-        
-        # الحصول على المقررات المتاحة للشعبة
-        available_courses = self._get_available_courses_for_division(student.DivisionId)
-        
-        # تصفية المقررات حسب الترم ومتطلبات الطالب
-        completed_courses = self._get_completed_course_ids(student.Id)
+        context = context or SchedulePlanContext(self, self._get_student_data_bulk(student.Id))
+        return context.memoize(
+            ('general_courses', max_credits),
+            lambda: self._select_general_courses(
+                context.available_courses, context.completed_course_ids, max_credits
+            )
+        )
+
+    def _select_general_courses(self, available_courses, completed_courses, max_credits):
+        """اختيار المقررات العامة من كتالوج الشعبة (بيانات المقرر من الكتالوج بدون استعلام لكل مقرر)"""
         
         # اختيار المقررات بنسبة 3:1 (إجباري:اختياري)
         mandatory_courses = [c for c in available_courses if c['is_mandatory'] and c['course_id'] not in completed_courses]
@@ -6222,30 +8363,24 @@ class AcademicPathPlanningService:
         # إضافة المقررات الإجبارية أولاً
         for course_data in mandatory_courses:
             if total_credits + course_data['credits'] <= max_credits:
-                # الحصول على بيانات المقرر الكاملة من قاعدة البيانات
-                course = Courses.query.get(course_data['course_id'])
-                if course:
-                    selected_courses.append({
-                        'course_id': course.Id,
-                        'course_name': course.Name,
-                        'course_code': course.Code,
-                        'credits': course.Credits
-                    })
-                    total_credits += course.Credits
+                selected_courses.append({
+                    'course_id': course_data['course_id'],
+                    'course_name': course_data['name'],
+                    'course_code': course_data['code'],
+                    'credits': course_data['credits']
+                })
+                total_credits += course_data['credits']
                 
         # إضافة بعض المقررات الاختيارية
-        remaining_credits = max_credits - total_credits
         for course_data in elective_courses:
             if total_credits + course_data['credits'] <= max_credits and len([c for c in selected_courses if not course_data['is_mandatory']]) < len(selected_courses) // 3:
-                course = Courses.query.get(course_data['course_id'])
-                if course:
-                    selected_courses.append({
-                        'course_id': course.Id,
-                        'course_name': course.Name,
-                        'course_code': course.Code,
-                        'credits': course.Credits
-                    })
-                    total_credits += course.Credits
+                selected_courses.append({
+                    'course_id': course_data['course_id'],
+                    'course_name': course_data['name'],
+                    'course_code': course_data['code'],
+                    'credits': course_data['credits']
+                })
+                total_credits += course_data['credits']
                 
         return selected_courses[:6]  # حد أقصى 6 مقررات
 
@@ -6255,18 +8390,23 @@ class AcademicPathPlanningService:
 
     def _analyze_student_performance(self, student):
         """تحليل أداء الطالب مع تحليل شامل للدرجات من جدول Enrollments - محسن للسرعة"""
-        # التحقق من الكاش أولاً
-        cache_key = f"performance_{student.Id}_{student.Semester}"
-        if cache_key in self._performance_cache:
-            return self._performance_cache[cache_key]
-            
-        from models import Enrollments
-        
-        # استعلام محسن واحد بدلاً من عدة استعلامات
-        enrollments = Enrollments.query.filter_by(
-            StudentId=student.Id,
-            IsCompleted='مكتملة'
-        ).join(Enrollments.course).join(Courses.department).all()
+        # التحليل مشتق من لقطة الطالب ويُبطل معها
+        return PlanningDataCache.get(
+            'student', student.Id, 'performance', lambda: self._compute_student_performance(student)
+        )
+
+    def _get_completed_enrollments(self, student_id):
+        """التسجيلات المكتملة للطالب من لقطته المشتركة"""
+        student_data = self._get_student_data_bulk(student_id)
+        if not student_data:
+            return []
+        return [
+            enrollment for enrollment in student_data['enrollments']
+            if enrollment.IsCompleted == 'مكتملة' and enrollment.course is not None
+        ]
+
+    def _compute_student_performance(self, student):
+        enrollments = self._get_completed_enrollments(student.Id)
         
         performance = {
             'math_performance': [],
@@ -6295,8 +8435,6 @@ class AcademicPathPlanningService:
         for enrollment in enrollments:
             if enrollment.Grade is not None:
                 course = enrollment.course
-                department_name = course.department.Name.lower()
-                course_name = course.Name.lower()
                 
                 # جمع جميع الدرجات
                 exam1 = float(enrollment.Exam1Grade) if enrollment.Exam1Grade else 0
@@ -6333,8 +8471,8 @@ class AcademicPathPlanningService:
                     final_total += final_grade
                 courses_count += 1
                 
-                # تصنيف المواد حسب القسم - استخدام كاش
-                subject_type = self._determine_subject_type_cached(department_name, course_name)
+                # تصنيف المادة محسوب مسبقاً في لقطة الطالب
+                subject_type = course.subject_type
                 
                 if subject_type == 'math':
                     performance['math_performance'].append(grade_4_scale)
@@ -6371,87 +8509,17 @@ class AcademicPathPlanningService:
                 performance[f'{subject}_avg'] = 0.0
                 performance[f'{subject}_count'] = 0
         
-        # حفظ في الكاش
-        self._performance_cache[cache_key] = performance
         return performance
 
-    @lru_cache(maxsize=500)
-    def _determine_subject_type_cached(self, department_name, course_name):
-        """نسخة محسنة من تحديد نوع المادة مع كاش"""
-        return self._determine_subject_type(department_name, course_name)
-
-    def _determine_subject_type(self, department_name, course_name):
+    @staticmethod
+    def _determine_subject_type(department_name, course_name):
         """تحديد نوع المادة بناءً على اسم القسم واسم المقرر"""
-        
-        # أولاً: التصنيف حسب أسماء الأقسام (الأولوية الأولى)
-        department_mappings = {
-            'رياضيات': 'math',
-            'mathematics': 'math',
-            'math': 'math',
-            'الرياضيات': 'math',
-            
-            'فيزياء': 'physics', 
-            'physics': 'physics',
-            'الفيزياء': 'physics',
-            
-            'كيمياء': 'chemistry',
-            'chemistry': 'chemistry',
-            'الكيمياء': 'chemistry',
-            'كيمياء حيوية': 'chemistry',
-            'biochemistry': 'chemistry',
-            
-            'أحياء': 'biology',
-            'biology': 'biology',
-            'الأحياء': 'biology',
-            'علم الحيوان': 'biology',
-            'zoology': 'biology',
-            'علم النبات': 'biology', 
-            'botany': 'biology',
-            'نبات': 'biology',
-            'حيوان': 'biology',
-            
-            'جيولوجيا': 'geology',
-            'geology': 'geology',
-            'الجيولوجيا': 'geology',
-            'علوم الأرض': 'geology',
-            'earth sciences': 'geology',
-            
-            'حاسب': 'computer_science',
-            'computer': 'computer_science',
-            'علوم الحاسب': 'computer_science',
-            'computer science': 'computer_science',
-            'حاسوب': 'computer_science'
-        }
-        
-        # التحقق من اسم القسم أولاً
-        for dept_keyword, subject_type in department_mappings.items():
-            if dept_keyword in department_name:
-                return subject_type
-        
-        # ثانياً: التصنيف حسب أسماء المقررات (كدعم إضافي)
-        course_mappings = {
-            'math': ['رياض', 'math', 'calculus', 'algebra', 'geometry', 'statistics', 'إحصاء', 'جبر', 'هندسة', 'تفاضل', 'تكامل'],
-            'physics': ['فيزياء', 'physics', 'mechanics', 'thermodynamics', 'optics', 'ميكانيكا', 'بصريات', 'حرارة'],
-            'chemistry': ['كيمياء', 'chemistry', 'organic', 'inorganic', 'analytical', 'عضوية', 'غير عضوية', 'تحليلية'],
-            'biology': ['أحياء', 'biology', 'حيوان', 'نبات', 'zoology', 'botany', 'anatomy', 'physiology', 'تشريح', 'وظائف'],
-            'geology': ['جيولوج', 'geology', 'minerals', 'rocks', 'معادن', 'صخور', 'أرض'],
-            'computer_science': ['حاسب', 'computer', 'programming', 'software', 'algorithm', 'برمجة', 'خوارزميات', 'نظم']
-        }
-        
-        for subject_type, keywords in course_mappings.items():
-            for keyword in keywords:
-                if keyword in course_name:
-                    return subject_type
-        
-        # إذا لم يتم العثور على تصنيف، إرجاع None
-        return None
+        # المصنف مبني مرة واحدة بآلة Aho-Corasick بدلاً من فحص الكلمات واحدة تلو الأخرى
+        return SUBJECT_CLASSIFIER.classify(department_name, course_name)
         
     def _get_department_based_courses(self, student):
         """الحصول على الكورسات مصنفة حسب الأقسام للطالب"""
-        enrollments = Enrollments.query.filter_by(
-            StudentId=student.Id,
-            IsCompleted='مكتملة'
-        ).all()
+        enrollments = self._get_completed_enrollments(student.Id)
         
         department_courses = {}
         
@@ -6475,15 +8543,19 @@ class AcademicPathPlanningService:
 
     def _recommend_specialization(self, student, available_specializations, performance):
         """اقتراح التخصص بناءً على الأداء"""
+        scores = self._get_specialization_scores(student, performance)
         recommendations = []
         
         for specialization in available_specializations:
-            score = self._calculate_specialization_score(specialization, performance)
+            score = round(scores.score('specialization', specialization), 2)
             recommendations.append({
                 'specialization': specialization,
                 'suitability_score': score,
                 'recommendation_level': self._get_recommendation_level(score),
-                'reasoning': self._get_specialization_reasoning(specialization, performance)
+                'reasoning': scores.assess('specialization', specialization)['strengths'] or [
+                    f"بناءً على المعدل التراكمي العام ({performance['overall_gpa']})"
+                ],
+                'score_breakdown': scores.explain('specialization', specialization)
             })
         
         # ترتيب التوصيات حسب النقاط
@@ -6495,94 +8567,21 @@ class AcademicPathPlanningService:
             'performance_summary': self._summarize_performance(performance)
         }
 
-    def _calculate_specialization_score(self, specialization, performance):
-        """حساب نقاط الملاءمة للتخصص بناءً على الأداء الفعلي في الأقسام"""
-        score = 0
-        base_gpa = performance['overall_gpa']
+    def _get_specialization_scores(self, student, performance=None):
+        """جدول نقاط كل خيارات التخصص للطالب - يُحسب مرة واحدة ويُشارك بين نقاط النهاية"""
+        def build():
+            options = list(self.EXTRA_SPECIALIZATION_OPTIONS)
+            for group, info in self.specialization_system.items():
+                options.append(group)
+                options.extend(info['intermediate_specializations'])
+                for finals in info['final_specializations'].values():
+                    options.extend(finals)
+            return SpecializationScoreTable(
+                performance or self._analyze_student_performance(student),
+                list(dict.fromkeys(options))
+            )
         
-        if 'حيوان' in specialization:
-            # تخصص علم الحيوان
-            biology_avg = performance['biology_performance_avg']
-            chemistry_avg = performance['chemistry_performance_avg']
-            
-            score += biology_avg * 0.6  # أداء الأحياء أولوية قصوى
-            score += chemistry_avg * 0.3  # الكيمياء مهمة كدعم
-            score += base_gpa * 0.1  # المعدل العام
-            
-        elif 'نبات' in specialization:
-            # تخصص النبات والكيمياء
-            biology_avg = performance['biology_performance_avg']
-            chemistry_avg = performance['chemistry_performance_avg']
-            
-            score += biology_avg * 0.5  # أداء الأحياء
-            score += chemistry_avg * 0.4  # الكيمياء أساسية
-            score += base_gpa * 0.1
-            
-        elif 'كيمياء' in specialization and 'حيوية' in specialization:
-            # تخصص الكيمياء الحيوية
-            chemistry_avg = performance['chemistry_performance_avg']
-            biology_avg = performance['biology_performance_avg']
-            
-            score += chemistry_avg * 0.6  # الكيمياء أساسية
-            score += biology_avg * 0.3   # الأحياء مساندة
-            score += base_gpa * 0.1
-            
-        elif 'كيمياء' in specialization:
-            # تخصص الكيمياء العامة
-            chemistry_avg = performance['chemistry_performance_avg']
-            math_avg = performance['math_performance_avg']
-            physics_avg = performance['physics_performance_avg']
-            
-            score += chemistry_avg * 0.7  # الكيمياء أساسية
-            score += math_avg * 0.15      # الرياضيات مساندة
-            score += physics_avg * 0.05   # الفيزياء مساندة
-            score += base_gpa * 0.1
-            
-        elif 'جيولوج' in specialization:
-            # تخصص الجيولوجيا والكيمياء
-            geology_avg = performance['geology_performance_avg']
-            chemistry_avg = performance['chemistry_performance_avg']
-            physics_avg = performance['physics_performance_avg']
-            
-            score += geology_avg * 0.6    # الجيولوجيا أساسية
-            score += chemistry_avg * 0.2  # الكيمياء مساندة
-            score += physics_avg * 0.1    # الفيزياء مساندة
-            score += base_gpa * 0.1
-            
-        elif 'رياضيات' in specialization and 'حاسب' in specialization:
-            # تخصص الرياضيات وعلوم الحاسب
-            math_avg = performance['math_performance_avg']
-            cs_avg = performance['computer_science_performance_avg']
-            physics_avg = performance['physics_performance_avg']
-            
-            score += math_avg * 0.5       # الرياضيات أساسية
-            score += cs_avg * 0.3         # علوم الحاسب مهمة
-            score += physics_avg * 0.1    # الفيزياء مساندة
-            score += base_gpa * 0.1
-            
-        elif 'رياضيات' in specialization:
-            # تخصص الرياضيات
-            math_avg = performance['math_performance_avg']
-            physics_avg = performance['physics_performance_avg']
-            
-            score += math_avg * 0.7       # الرياضيات أساسية
-            score += physics_avg * 0.2    # الفيزياء مساندة
-            score += base_gpa * 0.1
-            
-        elif 'فيزياء' in specialization:
-            # تخصص الفيزياء
-            physics_avg = performance['physics_performance_avg']
-            math_avg = performance['math_performance_avg']
-            
-            score += physics_avg * 0.7    # الفيزياء أساسية
-            score += math_avg * 0.2       # الرياضيات مساندة
-            score += base_gpa * 0.1
-            
-        else:
-            # تخصص غير معروف - استخدام المعدل العام فقط
-            score = base_gpa
-            
-        return round(score, 2)
+        return PlanningDataCache.get('student', student.Id, 'specialization_scores', build)
 
     def _get_recommendation_level(self, score):
         """تحديد مستوى التوصية"""
@@ -6597,108 +8596,6 @@ class AcademicPathPlanningService:
         else:
             return 'ضعيف'
 
-    def _get_specialization_reasoning(self, specialization, performance):
-        """تفسير سبب التوصية بناءً على الأداء الفعلي في الأقسام"""
-        reasons = []
-        
-        # الحصول على متوسطات الأداء
-        biology_avg = performance['biology_performance_avg']
-        chemistry_avg = performance['chemistry_performance_avg']
-        math_avg = performance['math_performance_avg']
-        physics_avg = performance['physics_performance_avg']
-        geology_avg = performance['geology_performance_avg']
-        cs_avg = performance['computer_science_performance_avg']
-        overall_gpa = performance['overall_gpa']
-        
-        if 'حيوان' in specialization:
-            if biology_avg >= 3.5:
-                reasons.append(f'أداء ممتاز في مقررات الأحياء (متوسط: {biology_avg})')
-            elif biology_avg >= 3.0:
-                reasons.append(f'أداء جيد جداً في مقررات الأحياء (متوسط: {biology_avg})')
-            elif biology_avg >= 2.5:
-                reasons.append(f'أداء جيد في مقررات الأحياء (متوسط: {biology_avg})')
-            
-            if chemistry_avg >= 3.0:
-                reasons.append(f'أداء قوي في الكيمياء يدعم التخصص (متوسط: {chemistry_avg})')
-            elif chemistry_avg >= 2.5:
-                reasons.append(f'أداء مقبول في الكيمياء (متوسط: {chemistry_avg})')
-                
-        elif 'نبات' in specialization:
-            if biology_avg >= 3.0:
-                reasons.append(f'أداء ممتاز في علوم النبات والأحياء (متوسط: {biology_avg})')
-            
-            if chemistry_avg >= 3.0:
-                reasons.append(f'أداء قوي في الكيمياء المطلوبة للتخصص (متوسط: {chemistry_avg})')
-            
-        elif 'كيمياء' in specialization:
-            if chemistry_avg >= 3.5:
-                reasons.append(f'أداء ممتاز في مقررات الكيمياء (متوسط: {chemistry_avg})')
-            elif chemistry_avg >= 3.0:
-                reasons.append(f'أداء جيد جداً في مقررات الكيمياء (متوسط: {chemistry_avg})')
-            elif chemistry_avg >= 2.5:
-                reasons.append(f'أداء جيد في مقررات الكيمياء (متوسط: {chemistry_avg})')
-            
-            if 'حيوية' in specialization and biology_avg >= 2.5:
-                reasons.append(f'أداء جيد في الأحياء يدعم الكيمياء الحيوية (متوسط: {biology_avg})')
-            
-            if math_avg >= 3.0:
-                reasons.append(f'أداء قوي في الرياضيات يدعم الكيمياء (متوسط: {math_avg})')
-                
-        elif 'جيولوج' in specialization:
-            if geology_avg >= 3.0:
-                reasons.append(f'أداء ممتاز في مقررات الجيولوجيا (متوسط: {geology_avg})')
-            elif geology_avg > 0:
-                reasons.append(f'أداء في مقررات الجيولوجيا (متوسط: {geology_avg})')
-            
-            if chemistry_avg >= 2.5:
-                reasons.append(f'أداء جيد في الكيمياء المساندة (متوسط: {chemistry_avg})')
-                
-        elif 'رياضيات' in specialization:
-            if math_avg >= 3.5:
-                reasons.append(f'أداء ممتاز في مقررات الرياضيات (متوسط: {math_avg})')
-            elif math_avg >= 3.0:
-                reasons.append(f'أداء جيد جداً في مقررات الرياضيات (متوسط: {math_avg})')
-            elif math_avg >= 2.5:
-                reasons.append(f'أداء جيد في مقررات الرياضيات (متوسط: {math_avg})')
-            
-            if 'حاسب' in specialization:
-                if cs_avg >= 3.0:
-                    reasons.append(f'أداء قوي في علوم الحاسب (متوسط: {cs_avg})')
-                elif cs_avg > 0:
-                    reasons.append(f'خبرة في علوم الحاسب (متوسط: {cs_avg})')
-                else:
-                    reasons.append('إمكانية جيدة للتطور في علوم الحاسب')
-            
-            if physics_avg >= 2.5:
-                reasons.append(f'أداء جيد في الفيزياء يدعم الرياضيات (متوسط: {physics_avg})')
-                
-        elif 'فيزياء' in specialization:
-            if physics_avg >= 3.5:
-                reasons.append(f'أداء ممتاز في مقررات الفيزياء (متوسط: {physics_avg})')
-            elif physics_avg >= 3.0:
-                reasons.append(f'أداء جيد جداً في مقررات الفيزياء (متوسط: {physics_avg})')
-            elif physics_avg >= 2.5:
-                reasons.append(f'أداء جيد في مقررات الفيزياء (متوسط: {physics_avg})')
-            
-            if math_avg >= 3.0:
-                reasons.append(f'أداء قوي في الرياضيات يدعم الفيزياء (متوسط: {math_avg})')
-        
-        # إضافة معلومة عن المعدل العام إذا كان جيد
-        if overall_gpa >= 3.5:
-            reasons.append(f'معدل تراكمي ممتاز ({overall_gpa})')
-        elif overall_gpa >= 3.0:
-            reasons.append(f'معدل تراكمي جيد جداً ({overall_gpa})')
-        elif overall_gpa >= 2.5:
-            reasons.append(f'معدل تراكمي جيد ({overall_gpa})')
-        
-        # إذا لم توجد أسباب واضحة
-        if not reasons:
-            reasons.append(f'بناءً على المعدل التراكمي العام ({overall_gpa})')
-            if overall_gpa < 2.0:
-                reasons.append('يُنصح بالتركيز على تحسين الأداء العام أولاً')
-            
-        return reasons
-
     def _summarize_performance(self, performance):
         """ملخص الأداء المحسن"""
         return {
@@ -6893,15 +8790,17 @@ class AcademicPathPlanningService:
     def _recommend_intermediate_specialization(self, student):
         """اقتراح التشعيب المتوسط لمسار العلوم الطبيعية"""
         performance = self._analyze_student_performance(student)
+        scores = self._get_specialization_scores(student, performance)
         intermediate_options = ['الرياضيات والفيزياء', 'الكيمياء والفيزياء']
         
         recommendations = []
         for option in intermediate_options:
-            score = self._calculate_intermediate_score(option, performance)
+            score = scores.score('intermediate', option)
             recommendations.append({
                 'specialization': option,
                 'suitability_score': score,
-                'recommendation_level': self._get_recommendation_level(score)
+                'recommendation_level': self._get_recommendation_level(score),
+                'score_breakdown': scores.explain('intermediate', option)
             })
             
         recommendations.sort(key=lambda x: x['suitability_score'], reverse=True)
@@ -6911,28 +8810,17 @@ class AcademicPathPlanningService:
             'all_options': recommendations
         }
 
-    def _calculate_intermediate_score(self, option, performance):
-        """حساب نقاط التشعيب المتوسط"""
-        if 'رياضيات' in option and 'فيزياء' in option:
-            return (performance['math_performance_avg'] * 0.5 + 
-                   performance['physics_performance_avg'] * 0.4 + 
-                   performance['overall_gpa'] * 0.1)
-        elif 'كيمياء' in option and 'فيزياء' in option:
-            return (performance['chemistry_performance_avg'] * 0.5 + 
-                   performance['physics_performance_avg'] * 0.4 + 
-                   performance['overall_gpa'] * 0.1)
-        return performance['overall_gpa']
-
     def _recommend_final_specialization(self, student, current_specialization, options, performance):
         """التوصية بالتخصص النهائي مع تحليل معمق"""
+        scores = self._get_specialization_scores(student, performance)
         recommendations = []
         
         for option in options:
-            # حساب نقاط الملاءمة
-            suitability_score = self._calculate_final_score(option, performance)
+            # حساب نقاط الملاءمة من جدول النقاط المحسوب مرة واحدة
+            suitability_score = scores.score('final', option)
             
-            # التحليل المفصل
-            detailed_analysis = self._get_detailed_specialization_analysis(option, performance)
+            # التحليل المفصل من صفوف مساهمات المواد في نفس الجدول
+            detailed_analysis = self._get_detailed_specialization_analysis(option, scores.assess('final', option))
             
             # تحديد مستوى التوصية
             confidence_level = "عالي" if suitability_score >= 3.5 else "متوسط" if suitability_score >= 3.0 else "منخفض"
@@ -6950,6 +8838,7 @@ class AcademicPathPlanningService:
                 'confidence_level': confidence_level,
                 'key_reasons': key_reasons,
                 'detailed_analysis': detailed_analysis,
+                'score_breakdown': scores.explain('final', option),
                 'recommendation_text': self._generate_recommendation_text(option, suitability_score, detailed_analysis)
             }
             
@@ -7101,41 +8990,17 @@ class AcademicPathPlanningService:
         
         return division_rules.get(current_division, [])
 
-    def _calculate_final_score(self, option, performance):
-        """حساب نقاط التخصص النهائي"""
-        if 'رياضيات' in option:
-            return (performance['math_performance_avg'] * 0.7 + 
-                   performance['overall_gpa'] * 0.3)
-        elif 'فيزياء' in option:
-            return (performance['physics_performance_avg'] * 0.7 + 
-                   performance['overall_gpa'] * 0.3)
-        elif 'كيمياء' in option:
-            return (performance['chemistry_performance_avg'] * 0.7 + 
-                   performance['overall_gpa'] * 0.3)
-        return performance['overall_gpa']
-
-    def _get_detailed_specialization_analysis(self, specialization, performance):
-        """تحليل مفصل لملاءمة التخصص للطالب"""
+    def _get_detailed_specialization_analysis(self, specialization, assessment):
+        """تحليل مفصل لملاءمة التخصص: نقاط القوة والقلق من صفوف جدول النقاط ومتطلبات ومجالات التخصص"""
         analysis = {
-            'strengths': [],
-            'concerns': [],
+            'strengths': list(assessment['strengths']),
+            'concerns': list(assessment['concerns']),
             'requirements': [],
             'career_prospects': []
         }
         
         # تحليل حسب التخصص
         if 'رياضيات' in specialization:
-            math_avg = performance['math_performance_avg']
-            
-            if math_avg >= 3.5:
-                analysis['strengths'].append(f'أداء ممتاز في الرياضيات ({math_avg:.2f})')
-            elif math_avg >= 3.0:
-                analysis['strengths'].append(f'أداء جيد جداً في الرياضيات ({math_avg:.2f})')
-            elif math_avg >= 2.5:
-                analysis['strengths'].append(f'أداء جيد في الرياضيات ({math_avg:.2f})')
-            else:
-                analysis['concerns'].append(f'أداء ضعيف في الرياضيات ({math_avg:.2f})')
-            
             analysis['requirements'] = [
                 'التفوق في مقررات التحليل الرياضي المتقدم',
                 'إتقان الجبر الخطي والمعادلات التفاضلية',
@@ -7143,12 +9008,6 @@ class AcademicPathPlanningService:
             ]
             
             if 'حاسب' in specialization:
-                cs_avg = performance['computer_science_performance_avg']
-                if cs_avg > 0:
-                    analysis['strengths'].append(f'خبرة في علوم الحاسب ({cs_avg:.2f})')
-                else:
-                    analysis['concerns'].append('لا توجد خبرة واضحة في علوم الحاسب')
-                    
                 analysis['career_prospects'] = [
                     'مطور برمجيات',
                     'محلل بيانات',
@@ -7164,19 +9023,6 @@ class AcademicPathPlanningService:
                 ]
                 
         elif 'فيزياء' in specialization:
-            physics_avg = performance['physics_performance_avg']
-            math_avg = performance['math_performance_avg']
-            
-            if physics_avg >= 3.0:
-                analysis['strengths'].append(f'أداء قوي في الفيزياء ({physics_avg:.2f})')
-            else:
-                analysis['concerns'].append(f'أداء ضعيف في الفيزياء ({physics_avg:.2f})')
-                
-            if math_avg >= 3.0:
-                analysis['strengths'].append(f'أساس رياضي قوي يدعم الفيزياء ({math_avg:.2f})')
-            else:
-                analysis['concerns'].append('الرياضيات ضرورية لفهم الفيزياء المتقدمة')
-            
             analysis['requirements'] = [
                 'فهم عميق للميكانيكا الكلاسيكية والكمية',
                 'مهارات رياضية متقدمة',
@@ -7191,17 +9037,6 @@ class AcademicPathPlanningService:
             ]
             
         elif 'كيمياء' in specialization:
-            chemistry_avg = performance['chemistry_performance_avg']
-            math_avg = performance['math_performance_avg']
-            
-            if chemistry_avg >= 3.0:
-                analysis['strengths'].append(f'أداء قوي في الكيمياء ({chemistry_avg:.2f})')
-            else:
-                analysis['concerns'].append(f'أداء ضعيف في الكيمياء ({chemistry_avg:.2f})')
-                
-            if math_avg >= 2.5:
-                analysis['strengths'].append('أساس رياضي مناسب للكيمياء')
-            
             analysis['requirements'] = [
                 'فهم عميق للكيمياء العضوية وغير العضوية',
                 'مهارات مختبرية متقدمة',
@@ -7215,17 +9050,6 @@ class AcademicPathPlanningService:
                 'محلل كيميائي'
             ]
         
-        # تحليل المعدل العام
-        overall_gpa = performance['overall_gpa']
-        if overall_gpa >= 3.5:
-            analysis['strengths'].append(f'معدل تراكمي ممتاز ({overall_gpa:.2f})')
-        elif overall_gpa >= 3.0:
-            analysis['strengths'].append(f'معدل تراكمي جيد جداً ({overall_gpa:.2f})')
-        elif overall_gpa >= 2.5:
-            analysis['strengths'].append(f'معدل تراكمي جيد ({overall_gpa:.2f})')
-        else:
-            analysis['concerns'].append(f'معدل تراكمي منخفض ({overall_gpa:.2f}) - يحتاج تحسين')
-        
         return analysis
 
     def _create_intermediate_specialization_plans(self, student, options, current_semester, max_credits):
@@ -7290,8 +9114,9 @@ class AcademicPathPlanningService:
             is_relevant = self._is_course_relevant_to_specialization(course, specialization)
             
             if is_relevant:
-                course['relevance_score'] = self._calculate_course_relevance_score(course, specialization)
-                relevant_courses.append(course)
+                relevant_courses.append(dict(
+                    course, relevance_score=self._calculate_course_relevance_score(course, specialization)
+                ))
         
         # ترتيب المقررات حسب الأهمية
         relevant_courses.sort(key=lambda x: (x['is_mandatory'], x['relevance_score']), reverse=True)
@@ -7463,10 +9288,9 @@ class AcademicPathPlanningService:
 
     def get_division_recommendations(self, student_id):
         """الحصول على توصيات التخصص للطالب"""
-        from models import Students
-        
         try:
-            student = Students.query.get(student_id)
+            student_data = self._get_student_data_bulk(student_id)
+            student = student_data['student'] if student_data else None
             if not student:
                 return self._error_response('الطالب غير موجود')
             
@@ -7703,13 +9527,17 @@ class AcademicPathPlanningService:
     def get_course_schedule(self, student_id, semester_count=None):
         """الحصول على الخطة الدراسية الذكية حسب مرحلة الطالب"""
         try:
-            from models import Students
+            started = time.perf_counter()
             
             # الحصول على بيانات الطالب
-            student = Students.query.get(student_id)
+            student_data = self._get_student_data_bulk(student_id)
+            student = student_data['student'] if student_data else None
             if not student:
                 return self._error_response('الطالب غير موجود')
             
+            # مدخلات مشتركة تُحمّل مرة واحدة لكل الخطط البديلة
+            context = SchedulePlanContext(self, student_data)
+            
             # تحديد المرحلة والتخصص الحالي
             current_stage = self._determine_student_stage(student)
             current_semester = student.Semester
@@ -7729,27 +9557,40 @@ class AcademicPathPlanningService:
             # إنشاء الخطة حسب المرحلة
             if 'العام الأول' in current_stage or 'مجموعة العلوم الطبيعية' in current_stage:
                 # طالب في المرحلة العامة
-                return self._create_general_student_plan(student, student_info, current_stage)
+                result = context.run_stage('plan:general', lambda: self._create_general_student_plan(
+                    student, student_info, current_stage, context
+                ))
                 
             elif 'آخر ترم قبل التخصص' in current_stage or current_semester == 2:
                 # طالب علوم طبيعية في الترم الثاني - يحتاج خطط متعددة
-                return self._create_pre_specialization_plans(student, student_info)
+                result = self._create_pre_specialization_plans(student, student_info, context)
                 
             elif 'التشعيب المتوسط' in current_stage or current_semester == 4:
                 # طالب في الترم الرابع - يحتاج خطط متعددة للتخصصات النهائية
-                return self._create_intermediate_stage_plans(student, student_info, current_stage)
+                result = self._create_intermediate_stage_plans(student, student_info, current_stage, context)
                 
             elif 'التخصص النهائي' in current_stage or current_semester >= 5:
                 # طالب في التخصص النهائي - خطة واحدة لباقي الترمات
-                return self._create_final_stage_plan(student, student_info, current_stage)
+                result = context.run_stage('plan:final', lambda: self._create_final_stage_plan(
+                    student, student_info, current_stage, context
+                ))
                 
             else:
                 return self._error_response('لا يمكن تحديد المرحلة الدراسية للطالب')
+            
+            if result.get('status') != 'error':
+                result['performance_info'] = {
+                    'execution_time_ms': round((time.perf_counter() - started) * 1000, 2),
+                    # الخطط المتعددة تُعد كما هي (ولو صفراً) والخطة الواحدة تُعد 1
+                    'plans_generated': len(result['available_plans']) if 'available_plans' in result else 1,
+                    'stage_timings_ms': context.timings
+                }
+            return result
                 
         except Exception as e:
             return self._error_response(f'خطأ في إنشاء الخطة الدراسية: {str(e)}')
 
-    def _create_general_student_plan(self, student, student_info, current_stage):
+    def _create_general_student_plan(self, student, student_info, current_stage, context=None):
         """إنشاء خطة دراسية للطلاب في المرحلة العامة"""
         current_semester = student.Semester
         max_credits = student_info['max_credits_per_semester']
@@ -7770,7 +9611,7 @@ class AcademicPathPlanningService:
             semester_key = f'semester_{semester_number}'
             
             # الحصول على المقررات للترم
-            courses = self._get_general_courses_for_semester(student, semester_number, max_credits)
+            courses = self._get_general_courses_for_semester(student, semester_number, max_credits, context)
             
             semester_plans[semester_key] = {
                 'semester_number': semester_number,
@@ -7790,38 +9631,51 @@ class AcademicPathPlanningService:
             'note': 'خطة دراسية للمرحلة العامة - سيتم اختيار التخصص لاحقاً'
         }
 
-    def _create_pre_specialization_plans(self, student, student_info):
-        """إنشاء خطط متعددة للطلاب قبل اختيار التخصص المتوسط"""
-        # الحصول على التوصيات من division-recommendations
-        recommendations = self.get_division_recommendations(student.Id)
-        
-        if 'error' in recommendations:
-            return self._error_response('خطأ في الحصول على التوصيات')
+    def _get_recommended_paths(self, student, context):
+        """المسار الموصى به والمسارات البديلة من توصيات مرحلة الطالب - تُحسب مرة واحدة لكل الخطط"""
+        def compute():
+            recommendations = self._get_stage_appropriate_recommendations(
+                student, self._determine_student_stage(student)
+            )
+            
+            smart_recommendation = recommendations.get('smart_recommendation') or {}
+            recommended = smart_recommendation.get('recommended_specialization')
+            alternatives = [option['specialization'] for option in recommendations.get('alternative_options', [])]
+            
+            # توصيات التشعيب المتوسط لها شكل مختلف
+            if recommended is None and recommendations.get('recommended'):
+                recommended = recommendations['recommended']['specialization']
+                alternatives = [option['specialization'] for option in recommendations.get('all_options', [])[1:]]
+            
+            return recommended, alternatives
         
-        recommended_path = None
-        alternative_path = None
+        return context.run_stage('recommendations', lambda: context.memoize('recommended_paths', compute))
+
+    def _create_pre_specialization_plans(self, student, student_info, context=None):
+        """إنشاء خطط متعددة للطلاب قبل اختيار التخصص المتوسط"""
+        context = context or SchedulePlanContext(self, self._get_student_data_bulk(student.Id))
         
-        # استخراج المسار الموصى به والمسار البديل
-        if 'smart_recommendation' in recommendations.get('data', {}):
-            recommended_spec = recommendations['data']['smart_recommendation']['recommended_specialization']
-            recommended_path = recommended_spec
-            
-            # الحصول على المسار البديل
-            alternatives = recommendations['data'].get('alternative_options', [])
-            if alternatives:
-                alternative_path = alternatives[0]['specialization']
+        # المسار الموصى به والمسار البديل بدون إعادة تحميل بيانات الطالب
+        recommended_path, alternatives = self._get_recommended_paths(student, context)
+        alternative_path = alternatives[0] if alternatives else None
         
-        # إنشاء خطط متعددة
+        # إنشاء خطط متعددة من نفس المدخلات المشتركة
         plans = {}
         
         if recommended_path:
-            plans['recommended_plan'] = self._create_specialization_path_plan(
-                student, student_info, recommended_path, 'المسار الموصى به'
+            plans['recommended_plan'] = context.run_stage(
+                f'plan:{recommended_path}',
+                lambda: self._create_specialization_path_plan(
+                    student, student_info, recommended_path, 'المسار الموصى به', context
+                )
             )
         
         if alternative_path:
-            plans['alternative_plan'] = self._create_specialization_path_plan(
-                student, student_info, alternative_path, 'المسار البديل'
+            plans['alternative_plan'] = context.run_stage(
+                f'plan:{alternative_path}',
+                lambda: self._create_specialization_path_plan(
+                    student, student_info, alternative_path, 'المسار البديل', context
+                )
             )
         
         return {
@@ -7833,8 +9687,9 @@ class AcademicPathPlanningService:
             'note': 'اختر المسار المناسب لك بناءً على أدائك وتوصيات النظام'
         }
 
-    def _create_intermediate_stage_plans(self, student, student_info, current_stage):
+    def _create_intermediate_stage_plans(self, student, student_info, current_stage, context=None):
         """إنشاء خطط متعددة للطلاب في التشعيب المتوسط"""
+        context = context or SchedulePlanContext(self, self._get_student_data_bulk(student.Id))
         current_division = student.division.Name if student.division else 'غير محدد'
         
         # الحصول على التخصصات النهائية المتاحة
@@ -7844,19 +9699,18 @@ class AcademicPathPlanningService:
             return self._error_response(f'لا توجد تخصصات نهائية متاحة للتشعيب: {current_division}')
         
         # الحصول على التوصيات
-        recommendations = self.get_division_recommendations(student.Id)
-        recommended_spec = None
-        
-        if 'smart_recommendation' in recommendations.get('data', {}):
-            recommended_spec = recommendations['data']['smart_recommendation']['recommended_specialization']
+        recommended_spec, _ = self._get_recommended_paths(student, context)
         
-        # إنشاء خطط لكل التخصصات المتاحة
+        # إنشاء خطط لكل التخصصات المتاحة من نفس المدخلات المشتركة
         plans = {}
         
         for specialization in available_specializations:
             plan_type = 'المسار الموصى به' if specialization == recommended_spec else 'مسار بديل'
-            plans[f'plan_{specialization.lower().replace(" ", "_")}'] = self._create_final_specialization_path_plan(
-                student, student_info, specialization, plan_type
+            plans[f'plan_{specialization.lower().replace(" ", "_")}'] = context.run_stage(
+                f'plan:{specialization}',
+                lambda: self._create_final_specialization_path_plan(
+                    student, student_info, specialization, plan_type, context
+                )
             )
             
         return {
@@ -7868,7 +9722,7 @@ class AcademicPathPlanningService:
             'note': 'اختر التخصص النهائي المناسب لك بناءً على أدائك وأهدافك المهنية'
         }
 
-    def _create_final_stage_plan(self, student, student_info, current_stage):
+    def _create_final_stage_plan(self, student, student_info, current_stage, context=None):
         """إنشاء خطة دراسية للطلاب في التخصص النهائي"""
         current_semester = student.Semester
         current_specialization = student.division.Name if student.division else 'غير محدد'
@@ -7887,7 +9741,7 @@ class AcademicPathPlanningService:
             
             # الحصول على مقررات التخصص للترم
             courses = self._get_specialization_courses_for_semester(
-                student, current_specialization, semester_number, max_credits
+                student, current_specialization, semester_number, max_credits, context
             )
             
             semester_plans[semester_key] = {
@@ -7919,7 +9773,7 @@ class AcademicPathPlanningService:
             }
         }
 
-    def _create_specialization_path_plan(self, student, student_info, specialization, plan_type):
+    def _create_specialization_path_plan(self, student, student_info, specialization, plan_type, context=None):
         """إنشاء خطة دراسية لمسار تخصص معين"""
         current_semester = student.Semester
         max_credits = student_info['max_credits_per_semester']
@@ -7938,7 +9792,7 @@ class AcademicPathPlanningService:
             if semester_number <= 4:
                 # ترمات التشعيب المتوسط
                 courses = self._get_intermediate_specialization_courses(
-                    student, specialization, semester_number, max_credits
+                    student, specialization, semester_number, max_credits, context
                 )
                 stage_name = f'التشعيب المتوسط: {specialization}'
             else:
@@ -7947,7 +9801,7 @@ class AcademicPathPlanningService:
                 if final_specs:
                     recommended_final = final_specs[0]  # أول تخصص متاح
                     courses = self._get_specialization_courses_for_semester(
-                        student, recommended_final, semester_number, max_credits
+                        student, recommended_final, semester_number, max_credits, context
                     )
                     stage_name = f'التخصص النهائي: {recommended_final}'
                 else:
@@ -7970,20 +9824,15 @@ class AcademicPathPlanningService:
             'total_semesters': len(semester_plans)
         }
 
-    def _create_final_specialization_path_plan(self, student, student_info, specialization, plan_type):
+    def _create_final_specialization_path_plan(self, student, student_info, specialization, plan_type, context=None):
         """إنشاء خطة دراسية للتخصص النهائي"""
         current_semester = student.Semester
         max_credits = student_info['max_credits_per_semester']
         
-        # الحصول على جميع المقررات المتاحة مرة واحدة
-        student_data = self._get_student_data_bulk(student.Id)
-        completed_course_ids = self._get_completed_course_ids_fast(student_data['enrollments'])
-        available_courses = self._get_all_division_data_bulk(student.DivisionId)
-        
-        # تصفية المقررات حسب التخصص
-        specialization_courses = self._filter_specialization_courses_fast(available_courses, specialization)
-        if not specialization_courses:
-            specialization_courses = available_courses
+        # المدخلات المشتركة بين كل الخطط البديلة
+        context = context or SchedulePlanContext(self, self._get_student_data_bulk(student.Id))
+        completed_course_ids = context.completed_course_ids
+        specialization_courses = context.specialization_courses(specialization)
         
         # تتبع المقررات المقترحة لتجنب التكرار
         suggested_course_ids = set()
@@ -8120,33 +9969,16 @@ class AcademicPathPlanningService:
             'is_mandatory': course_data.get('is_mandatory', False)
         }
 
-    def _get_specialization_courses_for_semester(self, student, specialization, semester, max_credits):
+    def _get_specialization_courses_for_semester(self, student, specialization, semester, max_credits, context=None):
         """الحصول على مقررات التخصص لترم معين مع البيانات الكاملة - محسن"""
         try:
-            # استخدام البيانات المحملة مسبقاً
-            student_data = self._get_student_data_bulk(student.Id)
-            completed_course_ids = self._get_completed_course_ids_fast(student_data['enrollments'])
-            
-            # الحصول على مقررات الشعبة من الكاش
-            available_courses = self._get_all_division_data_bulk(student.DivisionId)
-            
-            # تصفية المقررات حسب التخصص أولاً
-            specialization_courses = self._filter_specialization_courses_fast(available_courses, specialization)
-            
-            # إذا لم نجد مقررات متخصصة، استخدم المقررات العامة للشعبة
-            if not specialization_courses:
-                specialization_courses = available_courses
-            
-            # استخدام دالة التحديد المحسنة للمقررات
-            empty_suggested = set()  # لا توجد مقررات مقترحة مسبقاً في هذا السياق
-            
-            filtered_courses = self._get_specialization_courses_for_specific_semester(
-                specialization_courses, completed_course_ids, empty_suggested, 
+            context = context or SchedulePlanContext(self, self._get_student_data_bulk(student.Id))
+            # لا توجد مقررات مقترحة مسبقاً في هذا السياق
+            return self._get_specialization_courses_for_specific_semester(
+                context.specialization_courses(specialization), context.completed_course_ids, set(),
                 semester, max_credits, specialization
             )
             
-            return filtered_courses
-            
         except Exception as e:
             # في حالة الخطأ، أرجع قائمة فارغة مع رسالة
             return [{'error': f'خطأ في جلب المقررات: {str(e)}'}]
@@ -8155,85 +9987,23 @@ class AcademicPathPlanningService:
         """تصفية مقررات التخصص بسرعة من البيانات المحملة"""
         relevant_courses = []
         
-        # تعريف كلمات مفتاحية أكثر تفصيلاً لكل تخصص
-        specialization_detailed_keywords = {
-            'الرياضيات الخاصة': {
-                'primary': ['رياضيات', 'حساب', 'جبر', 'هندسة', 'إحصاء', 'تفاضل', 'تكامل'],
-                'secondary': ['منطق', 'نظرية', 'خطي'],
-                'departments': ['قسم الرياضيات']
-            },
-            'الفيزياء الخاصة': {
-                'primary': ['فيزياء', 'ميكانيكا', 'كهرباء', 'مغناطيس', 'بصريات', 'ضوء'],
-                'secondary': ['طاقة', 'حركة', 'موجات', 'ذرية'],
-                'departments': ['قسم الفيزياء']
-            },
-            'الرياضيات وعلوم الحاسب': {
-                'primary': ['رياضيات', 'حاسب', 'برمجة', 'خوارزميات', 'بيانات'],
-                'secondary': ['منطق', 'نظم', 'تحليل', 'تصميم'],
-                'departments': ['قسم الرياضيات', 'قسم علوم الحاسب']
-            },
-            'الأحياء': {
-                'primary': ['أحياء', 'حيوان', 'نبات', 'خلية', 'جزيئي'],
-                'secondary': ['وراثة', 'تطور', 'بيئة', 'تشريح'],
-                'departments': ['قسم علم الحيوان', 'قسم النبات']
-            },
-            'الكيمياء': {
-                'primary': ['كيمياء', 'تحليلي', 'عضوي', 'فيزيائي'],
-                'secondary': ['معادن', 'تفاعل', 'محلول', 'تركيب'],
-                'departments': ['قسم الكيمياء']
-            },
-            'الجيولوجيا': {
-                'primary': ['جيولوجيا', 'معادن', 'صخور', 'أرض'],
-                'secondary': ['طبقات', 'حفريات', 'بترول', 'مياه'],
-                'departments': ['قسم الجيولوجيا']
-            }
-        }
-        
-        # الحصول على كلمات التخصص
-        spec_keywords = specialization_detailed_keywords.get(specialization, {
-            'primary': [specialization.lower()],
-            'secondary': [],
-            'departments': []
-        })
-        
         for course in available_courses:
-            relevance_score = 0
-            course_name = course.get('name', '').lower()
-            department_name = course.get('department_name', '').lower()
-            
-            # فحص الكلمات الأساسية
-            for keyword in spec_keywords['primary']:
-                if keyword in course_name:
-                    relevance_score += 10
-                if keyword in department_name:
-                    relevance_score += 5
-            
-            # فحص الكلمات الثانوية
-            for keyword in spec_keywords['secondary']:
-                if keyword in course_name:
-                    relevance_score += 3
-                if keyword in department_name:
-                    relevance_score += 2
-            
-            # فحص القسم
-            for dept in spec_keywords['departments']:
-                if dept.lower() in department_name:
-                    relevance_score += 8
+            relevance_score = self._get_specialization_keyword_score(course, specialization)
             
             # إضافة درجة للمقررات الإجبارية
             if course.get('is_mandatory', False):
                 relevance_score += 15
             
-            # إضافة المقرر إذا كان ذا صلة
+            # نسخة من المقرر لأن بيانات الكتالوج مشتركة بين الطلبات
             if relevance_score > 0:
-                course['relevance_score'] = relevance_score
-                relevant_courses.append(course)
+                relevant_courses.append(dict(course, relevance_score=relevance_score))
         
         # إذا لم نجد مقررات مرتبطة، أرجع جميع المقررات مع درجات منخفضة
         if not relevant_courses:
             for course in available_courses:
-                course['relevance_score'] = 1 if course.get('is_mandatory', False) else 0.5
-                relevant_courses.append(course)
+                relevant_courses.append(dict(
+                    course, relevance_score=1 if course.get('is_mandatory', False) else 0.5
+                ))
         
         # ترتيب حسب الأهمية والصلة
         relevant_courses.sort(key=lambda x: (
@@ -8244,22 +10014,29 @@ class AcademicPathPlanningService:
         
         return relevant_courses
 
-    def _is_course_relevant_to_specialization_fast(self, course, specialization):
-        """تحديد صلة المقرر بالتخصص - سريع"""
+    def _get_specialization_keyword_score(self, course, specialization):
+        """درجة صلة المقرر بالتخصص من الكلمات المفتاحية - محسوبة مسبقاً مع الكتالوج"""
         course_name = course.get('name', '').lower()
         department_name = course.get('department_name', '').lower()
         
-        # قواعد تحديد الصلة - محسنة
-        specialization_keywords = {
-            'الأحياء': ['أحياء', 'حيوان', 'نبات', 'جزيئي', 'خلوي'],
-            'الكيمياء': ['كيمياء', 'تحليلي', 'عضوي', 'فيزيائي'],
-            'الفيزياء': ['فيزياء', 'ميكانيكا', 'كهرباء', 'مغناطيس'],
-            'الرياضيات': ['رياضيات', 'حساب', 'جبر', 'هندسة'],
-            'الجيولوجيا': ['جيولوجيا', 'معادن', 'صخور', 'أرض']
-        }
+        if specialization not in SPECIALIZATION_KEYWORDS:
+            # تخصص غير معرف: البحث باسم التخصص نفسه
+            keyword = specialization.lower()
+            return (10 if keyword in course_name else 0) + (5 if keyword in department_name else 0)
         
-        keywords = specialization_keywords.get(specialization, [])
-        return any(keyword in course_name or keyword in department_name for keyword in keywords)
+        scores = course.get('specialization_scores')
+        if scores is None:
+            scores = SUBJECT_CLASSIFIER.label_course(department_name, course_name)['specialization_scores']
+        return scores.get(specialization, 0)
+
+    def _is_course_relevant_to_specialization_fast(self, course, specialization):
+        """تحديد صلة المقرر بالتخصص - سريع"""
+        related = course.get('related_specializations')
+        if related is None:
+            related = SUBJECT_CLASSIFIER.label_course(
+                course.get('department_name', '').lower(), course.get('name', '').lower()
+            )['related_specializations']
+        return specialization in related
 
     def _calculate_course_relevance_score_fast(self, course, specialization):
         """حساب درجة صلة المقرر بالتخصص - سريع"""
@@ -8337,50 +10114,46 @@ class AcademicPathPlanningService:
         
         return backup_courses
 
-    def _get_intermediate_specialization_courses(self, student, specialization, semester, max_credits):
+    def _get_intermediate_specialization_courses(self, student, specialization, semester, max_credits, context=None):
         """الحصول على مقررات التشعيب المتوسط مع البيانات الكاملة"""
-        from models import Courses
-        
         try:
-            # الحصول على المقررات المكتملة للطالب
-            completed_course_ids = self._get_completed_course_ids(student.Id)
-            
-            # الحصول على المقررات العامة للترم
-            courses = self._get_courses_for_semester(student, semester, max_credits)
-            
-            filtered_courses = []
-            current_credits = 0
-            
-            for course_data in courses:
-                if current_credits >= max_credits:
-                    break
-                    
-                course_id = course_data.get('course_id') if isinstance(course_data, dict) else getattr(course_data, 'CourseID', None)
-                
-                if course_id and course_id not in completed_course_ids:
-                    course = Courses.query.get(course_id)
-                    if course:
-                        course_credits = course.Credits
-                        if current_credits + course_credits <= max_credits:
-                            filtered_courses.append({
-                                'course_id': course.Id,
-                                'course_name': course.Name,
-                                'course_code': course.Code,
-                                'credits': course_credits
-                            })
-                            current_credits += course_credits
-            
-            return filtered_courses
+            context = context or SchedulePlanContext(self, self._get_student_data_bulk(student.Id))
+            # لا تعتمد على التخصص أو الترم - تُحسب مرة واحدة لكل الخطط
+            return context.memoize(
+                ('intermediate_courses', max_credits),
+                lambda: self._select_intermediate_courses(
+                    self._get_general_courses_for_semester(student, semester, max_credits, context),
+                    context.completed_course_ids,
+                    max_credits
+                )
+            )
             
         except Exception as e:
             return []
 
+    def _select_intermediate_courses(self, courses, completed_course_ids, max_credits):
+        """المقررات العامة غير المكتملة في حدود الساعات المسموحة"""
+        filtered_courses = []
+        current_credits = 0
+        
+        for course_data in courses:
+            if current_credits >= max_credits:
+                break
+                
+            course_id = course_data.get('course_id')
+            if course_id and course_id not in completed_course_ids:
+                course_credits = course_data['credits']
+                if current_credits + course_credits <= max_credits:
+                    filtered_courses.append(dict(course_data))
+                    current_credits += course_credits
+        
+        return filtered_courses
+
     def analyze_student_performance(self, student_id):
         """تحليل شامل لأداء الطالب الأكاديمي"""
-        from models import Students
-        
         try:
-            student = Students.query.get(student_id)
+            student_data = self._get_student_data_bulk(student_id)
+            student = student_data['student'] if student_data else None
             if not student:
                 return self._error_response('الطالب غير موجود')
                 
@@ -0,0 +1,153 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+# محاور متجه أداء الطالب: متوسط كل مادة على مقياس 4.0 ثم المعدل العام
+SUBJECT_AXES = ('math', 'physics', 'chemistry', 'biology', 'geology', 'computer_science', 'overall_gpa')
+SUBJECT_LABELS = {
+    'math': 'الرياضيات',
+    'physics': 'الفيزياء',
+    'chemistry': 'الكيمياء',
+    'biology': 'الأحياء',
+    'geology': 'الجيولوجيا',
+    'computer_science': 'علوم الحاسب',
+    'overall_gpa': 'المعدل التراكمي'
+}
+
+# (أدنى متوسط، الوصف) لنقاط القوة - ما دون آخر حد يُعد نقطة قلق
+STRENGTH_LEVELS = ((3.5, 'ممتاز'), (3.0, 'جيد جداً'), (2.5, 'جيد'))
+
+
+def _specialization_weights(name):
+    """أوزان نقاط الملاءمة العامة للتخصص (نفس ترتيب قواعد الأسماء السابق)"""
+    if 'حيوان' in name:
+        return {'biology': 0.6, 'chemistry': 0.3, 'overall_gpa': 0.1}
+    if 'نبات' in name:
+        return {'biology': 0.5, 'chemistry': 0.4, 'overall_gpa': 0.1}
+    if 'كيمياء' in name and 'حيوية' in name:
+        return {'chemistry': 0.6, 'biology': 0.3, 'overall_gpa': 0.1}
+    if 'كيمياء' in name:
+        return {'chemistry': 0.7, 'math': 0.15, 'physics': 0.05, 'overall_gpa': 0.1}
+    if 'جيولوج' in name:
+        return {'geology': 0.6, 'chemistry': 0.2, 'physics': 0.1, 'overall_gpa': 0.1}
+    if 'رياضيات' in name and 'حاسب' in name:
+        return {'math': 0.5, 'computer_science': 0.3, 'physics': 0.1, 'overall_gpa': 0.1}
+    if 'رياضيات' in name:
+        return {'math': 0.7, 'physics': 0.2, 'overall_gpa': 0.1}
+    if 'فيزياء' in name:
+        return {'physics': 0.7, 'math': 0.2, 'overall_gpa': 0.1}
+    return {'overall_gpa': 1.0}
+
+
+def _intermediate_weights(name):
+    """أوزان نقاط التشعيب المتوسط"""
+    if 'رياضيات' in name and 'فيزياء' in name:
+        return {'math': 0.5, 'physics': 0.4, 'overall_gpa': 0.1}
+    if 'كيمياء' in name and 'فيزياء' in name:
+        return {'chemistry': 0.5, 'physics': 0.4, 'overall_gpa': 0.1}
+    return {'overall_gpa': 1.0}
+
+
+def _final_weights(name):
+    """أوزان نقاط التخصص النهائي"""
+    if 'رياضيات' in name:
+        return {'math': 0.7, 'overall_gpa': 0.3}
+    if 'فيزياء' in name:
+        return {'physics': 0.7, 'overall_gpa': 0.3}
+    if 'كيمياء' in name:
+        return {'chemistry': 0.7, 'overall_gpa': 0.3}
+    return {'overall_gpa': 1.0}
+
+
+WEIGHT_RULES = {
+    'specialization': _specialization_weights,
+    'intermediate': _intermediate_weights,
+    'final': _final_weights
+}
+
+
+@lru_cache(maxsize=1024)
+def weight_row(scheme, option):
+    """صف أوزان خيار واحد في نظام تقييم محدد - للقراءة فقط"""
+    weights = WEIGHT_RULES[scheme](option)
+    row = np.array([weights.get(axis, 0.0) for axis in SUBJECT_AXES], dtype=float)
+    row.setflags(write=False)
+    return row
+
+
+def subject_vector(performance):
+    """متجه متوسطات الطالب بترتيب SUBJECT_AXES من نتيجة تحليل الأداء"""
+    return np.array(
+        [performance.get(f'{axis}_performance_avg', 0.0) for axis in SUBJECT_AXES[:-1]] +
+        [performance.get('overall_gpa', 0.0)],
+        dtype=float
+    )
+
+
+class SpecializationScoreTable:
+    """نقاط كل الخيارات في كل أنظمة التقييم لطالب واحد بضرب مصفوفة الأوزان في متجه أدائه مرة واحدة"""
+
+    def __init__(self, performance, options):
+        self.vector = subject_vector(performance)
+        self._index = {}
+        rows = []
+        for scheme in WEIGHT_RULES:
+            for option in options:
+                self._index[(scheme, option)] = len(rows)
+                rows.append(weight_row(scheme, option))
+
+        self._weights = np.vstack(rows) if rows else np.zeros((0, len(SUBJECT_AXES)))
+        self._contributions = self._weights * self.vector
+        self._scores = self._contributions.sum(axis=1)
+
+    def _row(self, scheme, option):
+        index = self._index.get((scheme, option))
+        if index is not None:
+            return self._weights[index], self._contributions[index], float(self._scores[index])
+
+        # خيار غير معروف مسبقاً: حساب صفه عند الطلب
+        weights = weight_row(scheme, option)
+        contributions = weights * self.vector
+        return weights, contributions, float(contributions.sum())
+
+    def score(self, scheme, option):
+        return self._row(scheme, option)[2]
+
+    def explain(self, scheme, option):
+        """مساهمة كل مادة في نقاط الخيار مرتبة من الأكبر"""
+        weights, contributions, _ = self._row(scheme, option)
+        breakdown = [
+            {
+                'subject': SUBJECT_LABELS[axis],
+                'weight': float(weight),
+                'average': round(float(value), 2),
+                'contribution': round(float(contribution), 2)
+            }
+            for axis, weight, value, contribution in zip(SUBJECT_AXES, weights, self.vector, contributions)
+            if weight
+        ]
+        breakdown.sort(key=lambda item: item['contribution'], reverse=True)
+        return breakdown
+
+    def assess(self, scheme, option):
+        """نقاط القوة والقلق للخيار من صفوف explain بترتيب المساهمة"""
+        strengths, concerns = [], []
+        for row in self.explain(scheme, option):
+            subject, average = row['subject'], row['average']
+            level = next((label for limit, label in STRENGTH_LEVELS if average >= limit), None)
+            is_gpa = subject == SUBJECT_LABELS['overall_gpa']
+            
+            if level:
+                strengths.append(
+                    f'معدل تراكمي {level} ({average:.2f})' if is_gpa
+                    else f'أداء {level} في مقررات {subject} (متوسط: {average:.2f})'
+                )
+            elif is_gpa:
+                concerns.append(f'معدل تراكمي منخفض ({average:.2f}) - يحتاج تحسين')
+            elif average > 0:
+                concerns.append(f'أداء ضعيف في مقررات {subject} (متوسط: {average:.2f})')
+            else:
+                concerns.append(f'لا توجد مقررات مكتملة في {subject}')
+        
+        return {'strengths': strengths, 'concerns': concerns}
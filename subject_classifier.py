@@ -0,0 +1,226 @@
+from collections import deque
+
+
+# تصنيف المادة حسب اسم القسم (الأولوية بترتيب القائمة)
+DEPARTMENT_SUBJECTS = (
+    ('رياضيات', 'math'),
+    ('mathematics', 'math'),
+    ('math', 'math'),
+    ('الرياضيات', 'math'),
+
+    ('فيزياء', 'physics'),
+    ('physics', 'physics'),
+    ('الفيزياء', 'physics'),
+
+    ('كيمياء', 'chemistry'),
+    ('chemistry', 'chemistry'),
+    ('الكيمياء', 'chemistry'),
+    ('كيمياء حيوية', 'chemistry'),
+    ('biochemistry', 'chemistry'),
+
+    ('أحياء', 'biology'),
+    ('biology', 'biology'),
+    ('الأحياء', 'biology'),
+    ('علم الحيوان', 'biology'),
+    ('zoology', 'biology'),
+    ('علم النبات', 'biology'),
+    ('botany', 'biology'),
+    ('نبات', 'biology'),
+    ('حيوان', 'biology'),
+
+    ('جيولوجيا', 'geology'),
+    ('geology', 'geology'),
+    ('الجيولوجيا', 'geology'),
+    ('علوم الأرض', 'geology'),
+    ('earth sciences', 'geology'),
+
+    ('حاسب', 'computer_science'),
+    ('computer', 'computer_science'),
+    ('علوم الحاسب', 'computer_science'),
+    ('computer science', 'computer_science'),
+    ('حاسوب', 'computer_science'),
+)
+
+# تصنيف المادة حسب اسم المقرر إذا لم يُصنف القسم (الأولوية بترتيب المواد)
+COURSE_SUBJECT_KEYWORDS = (
+    ('math', ('رياض', 'math', 'calculus', 'algebra', 'geometry', 'statistics', 'إحصاء', 'جبر', 'هندسة', 'تفاضل', 'تكامل')),
+    ('physics', ('فيزياء', 'physics', 'mechanics', 'thermodynamics', 'optics', 'ميكانيكا', 'بصريات', 'حرارة')),
+    ('chemistry', ('كيمياء', 'chemistry', 'organic', 'inorganic', 'analytical', 'عضوية', 'غير عضوية', 'تحليلية')),
+    ('biology', ('أحياء', 'biology', 'حيوان', 'نبات', 'zoology', 'botany', 'anatomy', 'physiology', 'تشريح', 'وظائف')),
+    ('geology', ('جيولوج', 'geology', 'minerals', 'rocks', 'معادن', 'صخور', 'أرض')),
+    ('computer_science', ('حاسب', 'computer', 'programming', 'software', 'algorithm', 'برمجة', 'خوارزميات', 'نظم')),
+)
+
+# كلمات صلة المقرر بالتخصص: أساسية (+10 اسم المقرر / +5 القسم) وثانوية (+3 / +2) وأقسام (+8)
+SPECIALIZATION_KEYWORDS = {
+    'الرياضيات الخاصة': {
+        'primary': ('رياضيات', 'حساب', 'جبر', 'هندسة', 'إحصاء', 'تفاضل', 'تكامل'),
+        'secondary': ('منطق', 'نظرية', 'خطي'),
+        'departments': ('قسم الرياضيات',)
+    },
+    'الفيزياء الخاصة': {
+        'primary': ('فيزياء', 'ميكانيكا', 'كهرباء', 'مغناطيس', 'بصريات', 'ضوء'),
+        'secondary': ('طاقة', 'حركة', 'موجات', 'ذرية'),
+        'departments': ('قسم الفيزياء',)
+    },
+    'الرياضيات وعلوم الحاسب': {
+        'primary': ('رياضيات', 'حاسب', 'برمجة', 'خوارزميات', 'بيانات'),
+        'secondary': ('منطق', 'نظم', 'تحليل', 'تصميم'),
+        'departments': ('قسم الرياضيات', 'قسم علوم الحاسب')
+    },
+    'الأحياء': {
+        'primary': ('أحياء', 'حيوان', 'نبات', 'خلية', 'جزيئي'),
+        'secondary': ('وراثة', 'تطور', 'بيئة', 'تشريح'),
+        'departments': ('قسم علم الحيوان', 'قسم النبات')
+    },
+    'الكيمياء': {
+        'primary': ('كيمياء', 'تحليلي', 'عضوي', 'فيزيائي'),
+        'secondary': ('معادن', 'تفاعل', 'محلول', 'تركيب'),
+        'departments': ('قسم الكيمياء',)
+    },
+    'الجيولوجيا': {
+        'primary': ('جيولوجيا', 'معادن', 'صخور', 'أرض'),
+        'secondary': ('طبقات', 'حفريات', 'بترول', 'مياه'),
+        'departments': ('قسم الجيولوجيا',)
+    }
+}
+
+# كلمات الصلة المختصرة: المقرر مرتبط إذا ظهرت أي كلمة في اسمه أو اسم قسمه
+SPECIALIZATION_RELEVANCE_KEYWORDS = {
+    'الأحياء': ('أحياء', 'حيوان', 'نبات', 'جزيئي', 'خلوي'),
+    'الكيمياء': ('كيمياء', 'تحليلي', 'عضوي', 'فيزيائي'),
+    'الفيزياء': ('فيزياء', 'ميكانيكا', 'كهرباء', 'مغناطيس'),
+    'الرياضيات': ('رياضيات', 'حساب', 'جبر', 'هندسة'),
+    'الجيولوجيا': ('جيولوجيا', 'معادن', 'صخور', 'أرض')
+}
+
+
+class KeywordAutomaton:
+    """آلة Aho-Corasick تجد كل الكلمات المفتاحية الموجودة في النص بمرور واحد عليه"""
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [frozenset()]
+
+        for keyword in set(keywords):
+            if not keyword:
+                continue
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(frozenset())
+                    self._goto[node][char] = next_node
+                node = next_node
+            self._output[node] = self._output[node] | {keyword}
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] | self._output[self._fail[child]]
+                queue.append(child)
+
+    def find(self, text):
+        """مجموعة الكلمات المفتاحية الموجودة كنص جزئي في text"""
+        found = set()
+        node = 0
+        for char in text or '':
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            if self._output[node]:
+                found |= self._output[node]
+        return found
+
+
+class SubjectClassifier:
+    """مصنف نوع المادة وصلة المقرر بالتخصصات مبني مرة واحدة من جداول الكلمات المفتاحية"""
+
+    def __init__(self):
+        # أولوية كل كلمة = ترتيبها في الفحص المتسلسل الأصلي
+        self._department_priority = {}
+        for index, (keyword, subject_type) in enumerate(DEPARTMENT_SUBJECTS):
+            self._department_priority.setdefault(keyword.lower(), (index, subject_type))
+
+        self._course_priority = {}
+        for index, (subject_type, keywords) in enumerate(COURSE_SUBJECT_KEYWORDS):
+            for keyword in keywords:
+                self._course_priority.setdefault(keyword.lower(), (index, subject_type))
+
+        keywords = set(self._department_priority) | set(self._course_priority)
+        for spec_keywords in SPECIALIZATION_KEYWORDS.values():
+            for group in spec_keywords.values():
+                keywords.update(keyword.lower() for keyword in group)
+        for group in SPECIALIZATION_RELEVANCE_KEYWORDS.values():
+            keywords.update(keyword.lower() for keyword in group)
+
+        self._automaton = KeywordAutomaton(keywords)
+
+    def classify(self, department_name, course_name):
+        """نوع المادة من اسم القسم أولاً ثم اسم المقرر - None إذا لم يُصنف"""
+        return self._classify(self._automaton.find(department_name), self._automaton.find(course_name))
+
+    def _classify(self, department_matches, course_matches):
+        department_hits = [self._department_priority[keyword] for keyword in department_matches
+                           if keyword in self._department_priority]
+        if department_hits:
+            return min(department_hits)[1]
+
+        course_hits = [self._course_priority[keyword] for keyword in course_matches
+                       if keyword in self._course_priority]
+        if course_hits:
+            return min(course_hits)[1]
+
+        return None
+
+    @staticmethod
+    def _specialization_scores(department_matches, course_matches):
+        scores = {}
+        for specialization, spec_keywords in SPECIALIZATION_KEYWORDS.items():
+            score = 0
+            for keyword in spec_keywords['primary']:
+                if keyword in course_matches:
+                    score += 10
+                if keyword in department_matches:
+                    score += 5
+            for keyword in spec_keywords['secondary']:
+                if keyword in course_matches:
+                    score += 3
+                if keyword in department_matches:
+                    score += 2
+            for keyword in spec_keywords['departments']:
+                if keyword.lower() in department_matches:
+                    score += 8
+            if score:
+                scores[specialization] = score
+        return scores
+
+    @staticmethod
+    def _related_specializations(department_matches, course_matches):
+        matches = department_matches | course_matches
+        return tuple(
+            specialization for specialization, keywords in SPECIALIZATION_RELEVANCE_KEYWORDS.items()
+            if any(keyword in matches for keyword in keywords)
+        )
+
+    def label_course(self, department_name, course_name):
+        """كل تصنيفات المقرر بمرور واحد على اسم القسم واسم المقرر (الأسماء بحروف صغيرة)"""
+        department_matches = self._automaton.find(department_name)
+        course_matches = self._automaton.find(course_name)
+        return {
+            'subject_type': self._classify(department_matches, course_matches),
+            'specialization_scores': self._specialization_scores(department_matches, course_matches),
+            'related_specializations': self._related_specializations(department_matches, course_matches)
+        }
+
+
+SUBJECT_CLASSIFIER = SubjectClassifier()